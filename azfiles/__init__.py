@@ -1,23 +1,87 @@
-import inspect
+import base64
+import collections
+import copy
+import fnmatch
+import functools
+import hashlib
+import io
 import json
+import os
+import queue
 import re
 import sys
-import traceback
+import threading
+import time
 import typing
-import xml.etree.ElementTree as ET
-from datetime import datetime
+import zlib
+from datetime import datetime, timezone
 from pathlib import Path, PosixPath
-from typing import Any, Dict, List, Tuple, Type, get_type_hints
-
-import requests
-from dateutil.parser import parse as dt_parse
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    Type,
+    get_type_hints,
+)
+from urllib.parse import quote, urlsplit
+
+if typing.TYPE_CHECKING:
+    import xml.etree.ElementTree as ET
+    from concurrent.futures import Future
+
+    import requests
 
 CHUNK_SIZE = 64 * 1024
 
+RANGE_SIZE = 4000000
+
+# largest range Put Range accepts and Get File computes MD5 for
+MAX_RANGE_SIZE = 4 * 1024 * 1024
+
+# smallest range autotuner splits file into
+MIN_RANGE_SIZE = 256 * 1024
+
+# seconds autotuner measures throughput for before changing workers
+AUTOTUNE_WINDOW = 0.5
+
+# seconds between checks of pending server side copy
+COPY_POLL_INTERVAL = 1.0
+
+# remote file of streamed upload grows by doubling, but not by more than this
+MAX_GROWTH = 1024 * 1024 * 1024
+
+DEFAULT_WORKERS = 4
+
+DEFAULT_JOBS = 4
+
+RETRIES = 3
+
+DEFAULT_POOL_SIZE = 16
+
+THROTTLING_STATUSES = (429, 503)
+
+# InternalError may come after call took effect, so it is retried only by
+# methods that can be repeated safely, unlike Copy File or Put Range From URL
+IDEMPOTENT_METHODS = ("GET", "HEAD")
+
+INTERNAL_ERROR = 500
+
 API_VERSION = "2020-04-08"
 
 CONFIG_PATH = Path.home() / ".azfiles.json"
 
+CACHE_PATH = Path.home() / ".azfiles.cache"
+
+JOURNAL_DIR = Path.home() / ".azfiles.journal"
+
+DEFAULT_CACHE_TTL = 300
+
+DEFAULT_CACHE_SIZE = 1000000
+
 
 class Config:
     def __init__(self, f: Path = None):
@@ -30,10 +94,17 @@ class Config:
         print(f"{self.path!s} saved. mounts={list(self.data.keys())}")
 
 
-_CONFIG = Config(CONFIG_PATH)
-
 _MOUNT_VARS = ["storage_account", "share", "sas_token"]
 
+# optional, with defaults: base url of service if not
+# `https://<storage_account>.file.core.windows.net`, and rate limits of
+# all traffic to mount (0 is unlimited)
+_MOUNT_OPTIONAL_VARS = {
+    "endpoint": "",
+    "max_bytes_per_sec": 0,
+    "max_requests_per_sec": 0,
+}
+
 
 class Mount:
     def __init__(self, mount: str, config: Config):
@@ -42,6 +113,9 @@ class Mount:
         self.storage_account = ""
         self.share = ""
         self.sas_token = ""
+        self.endpoint = ""
+        self.max_bytes_per_sec = 0
+        self.max_requests_per_sec = 0
         if mount in config.data:
             self.from_dict(self.config.data[mount])
 
@@ -51,26 +125,51 @@ class Mount:
 
     def save(self):
         d = self.to_dict()
-        if all(d.values()):
+        if all(d[k] for k in _MOUNT_VARS):
             self.config.data[self.mount_name] = d
             self.config.save()
         else:
             raise ValueError(f"Invalid mount:{self.mount_name} {d}")
 
     def to_dict(self):
-        return {k: getattr(self, k) for k in _MOUNT_VARS}
+        d = {k: getattr(self, k) for k in _MOUNT_VARS}
+        d.update(
+            {k: getattr(self, k) for k in _MOUNT_OPTIONAL_VARS if getattr(self, k)}
+        )
+        return d
 
     def from_dict(self, d):
         for k in _MOUNT_VARS:
             setattr(self, k, d[k])
+        for k, default in _MOUNT_OPTIONAL_VARS.items():
+            setattr(self, k, type(default)(d.get(k, default)))
 
     def __str__(self):
         return f"{self.mount_name}:"
 
     def url(self, path: PosixPath, query: str = None):
+        """
+        >>> m = Mount("m", Config(Path("/nonexistent")))
+        >>> m.storage_account, m.share, m.sas_token = "acct", "share", "sig=x"
+        >>> m.url(PosixPath("/a b.txt"))
+        'https://acct.file.core.windows.net/share/a b.txt?sig=x'
+        >>> m.endpoint = "http://127.0.0.1:10000/acct/"
+        >>> m.url(PosixPath("/d"), "restype=directory")
+        'http://127.0.0.1:10000/acct/share/d?restype=directory&sig=x'
+        """
         assert path.is_absolute(), path
         query = self.sas_token if query is None else f"{query}&{self.sas_token}"
-        return f"https://{self.storage_account}.file.core.windows.net/{self.share}{str(path)}?{query}"
+        return f"{self.share_url()}{str(path)[1:]}?{query}"
+
+    def share_url(self) -> str:
+        """
+        Url every path of share starts with
+        """
+        if self.endpoint:
+            base = self.endpoint.rstrip("/")
+        else:
+            base = f"https://{self.storage_account}.file.core.windows.net"
+        return f"{base}/{self.share}/"
 
 
 class Remote:
@@ -94,6 +193,14 @@ class Remote:
     def __str__(self):
         return str(self.mount) + str(self.remote_file)
 
+    def child(self, remote_file: PosixPath) -> "Remote":
+        """
+        Copy of this remote pointing to particular `remote_file`
+        """
+        remote = copy.copy(self)
+        remote.remote_file = remote_file
+        return remote
+
     def set_remote_file(self, local_path: Path):
         """
         Required when remote file is not predetermined by remote_str and
@@ -119,6 +226,7 @@ class Remote:
         return local_path / self.remote_file.name if local_path.is_dir() else local_path
 
 
+@functools.lru_cache(maxsize=None)
 def to_snake_case(name):
     """
     >>> list(map(to_snake_case,['Content-Length', 'Content-Length', 'CreationTime','LastAccessTime', 'LastWriteTime', 'Etag']))
@@ -127,6 +235,7 @@ def to_snake_case(name):
     return re.sub("([a-z0-9])[-_]?([A-Z])", r"\1_\2", name).lower()
 
 
+@functools.lru_cache(maxsize=1024)
 def clean_header(s):
     """
     >>> hh = ['Content-Length', 'Content-Type', 'Last-Modified', 'ETag', 'Server', 'x-ms-request-id', 'x-ms-version', 'x-ms-type', 'x-ms-server-encrypted', 'x-ms-lease-status', 'x-ms-lease-state', 'x-ms-file-change-time', 'x-ms-file-last-write-time', 'x-ms-file-creation-time', 'x-ms-file-permission-key', 'x-ms-file-attributes', 'x-ms-file-id', 'x-ms-file-parent-id', 'Date']
@@ -137,6 +246,77 @@ def clean_header(s):
     return to_snake_case(re.sub("-", "_", re.sub("x-ms-file-", "", s)))
 
 
+def to_azure_time(dt: datetime) -> str:
+    """
+    >>> to_azure_time(datetime(2021, 7, 30, 18, 13, 20, 123456, tzinfo=timezone.utc))
+    '2021-07-30T18:13:20.1234560Z'
+    """
+    return dt.astimezone(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%f0Z")
+
+
+_MONTHS = {
+    m: i + 1
+    for i, m in enumerate(
+        ["Jan", "Feb", "Mar", "Apr", "May", "Jun"]
+        + ["Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+    )
+}
+
+
+def parse_timestamp(s: str) -> datetime:
+    """
+    Fast path for fixed formats service uses: ISO-8601 with 7 digit
+    fraction (properties in listings and `x-ms-file-*-time` headers) and
+    RFC-1123 (`Last-Modified`, `Date`). Anything else goes to dateutil.
+
+    >>> parse_timestamp("2021-07-30T18:13:20.1234567Z")
+    datetime.datetime(2021, 7, 30, 18, 13, 20, 123456, tzinfo=datetime.timezone.utc)
+    >>> parse_timestamp("2021-07-30T18:13:20Z")
+    datetime.datetime(2021, 7, 30, 18, 13, 20, tzinfo=datetime.timezone.utc)
+    >>> parse_timestamp("Fri, 30 Jul 2021 18:13:20 GMT")
+    datetime.datetime(2021, 7, 30, 18, 13, 20, tzinfo=datetime.timezone.utc)
+    >>> parse_timestamp("2021-07-30 18:13:20.5-04:00").isoformat()
+    '2021-07-30T18:13:20.500000-04:00'
+    """
+    try:
+        n = len(s)
+        if s[-1] == "Z" and s[10] == "T" and (n == 28 or n == 20):
+            return datetime(
+                int(s[0:4]),
+                int(s[5:7]),
+                int(s[8:10]),
+                int(s[11:13]),
+                int(s[14:16]),
+                int(s[17:19]),
+                int(s[20:26]) if n == 28 else 0,
+                timezone.utc,
+            )
+        if n == 29 and s[-4:] == " GMT":
+            return datetime(
+                int(s[12:16]),
+                _MONTHS[s[8:11]],
+                int(s[5:7]),
+                int(s[17:19]),
+                int(s[20:22]),
+                int(s[23:25]),
+                0,
+                timezone.utc,
+            )
+    except (ValueError, KeyError):
+        pass
+    return dt_parse(s)
+
+
+def dt_parse(s: str) -> datetime:
+    from dateutil.parser import parse
+
+    return parse(s)
+
+
+def mtime_of(local_path: Path) -> datetime:
+    return datetime.fromtimestamp(local_path.stat().st_mtime, timezone.utc)
+
+
 class DirContent:
     def __init__(self, path: PosixPath):
         self.path = path
@@ -174,11 +354,24 @@ def get_attr_hints(o):
     ...
     >>> get_attr_hints(X)
     {'y': <class 'float'>}
+    >>> list(get_attr_hints(DirEntry)) == _DIR_ENTRY_HEADER
+    True
     """
     return {k: h for k, h in get_type_hints(o).items() if not is_classvar(h)}
 
 
 class DirEntry:
+    __slots__ = (
+        "parent",
+        "path",
+        "name",
+        "type",
+        "size",
+        "creation_time",
+        "last_access_time",
+        "last_write_time",
+        "etag",
+    )
     name: str
     type: str
     size: int
@@ -188,15 +381,16 @@ class DirEntry:
     etag: str
 
     @classmethod
-    def from_xml(cls, parent: DirContent, xml: ET.Element):
+    def from_xml(
+        cls, parent: DirContent, xml: "ET.Element", dir_path: PosixPath = None
+    ):
+        name = xml.findtext("Name")
         return cls(
-            next(xml.iter("Name")).text,
+            name,
             xml.tag,
-            {
-                to_snake_case(prop.tag): prop.text
-                for prop in next(xml.iter("Properties"))
-            },
+            {to_snake_case(prop.tag): prop.text for prop in xml.find("Properties")},
             parent=parent,
+            path=None if dir_path is None else dir_path / name,
         )
 
     def __init__(
@@ -206,28 +400,35 @@ class DirEntry:
         self.path = path
         self.name = name
         self.type = t
-        properties["size"] = properties.get("content_length", None)
-        for k in _DIR_ENTRY_HEADER:
-            v: Any = None
-            if k in properties:
-                v = properties[k]
-                if v is not None:
-                    t = _DIR_ENTRY_HINTS[k]
-                    if t == datetime:
-                        v = dt_parse(v)
-                    elif t == int:
-                        v = int(v)
-            if not hasattr(self, k):
-                setattr(self, k, v)
+        get = properties.get
+        v = get("content_length")
+        self.size = None if v is None else int(v)
+        v = get("creation_time")
+        self.creation_time = None if v is None else parse_timestamp(v)
+        v = get("last_access_time")
+        self.last_access_time = None if v is None else parse_timestamp(v)
+        v = get("last_write_time")
+        self.last_write_time = None if v is None else parse_timestamp(v)
+        self.etag = get("etag")
         if self.parent:
             self.path = self.parent.path / self.name
             self.parent.entries[self.name] = self
 
+    def row(self, name: str = None) -> str:
+        """
+        CSV row in `__str__` format, but with `name` replaced (by full
+        path, for example)
+        """
+        fields = [self.get_str_field(k) for k in _DIR_ENTRY_HEADER]
+        if name is not None:
+            fields[0] = name
+        return ",".join(fields)
+
     def get_str_field(self, k):
         v = getattr(self, k)
         if v is None:
             return ""
-        elif _DIR_ENTRY_HINTS[k] == datetime:
+        elif k in _DIR_ENTRY_TIMES:
             return v.replace(microsecond=0).isoformat()
         else:
             return str(v)
@@ -236,13 +437,758 @@ class DirEntry:
         return ",".join(self.get_str_field(k) for k in _DIR_ENTRY_HEADER)
 
 
-_DIR_ENTRY_HINTS = get_attr_hints(DirEntry)
-_DIR_ENTRY_HEADER = list(_DIR_ENTRY_HINTS.keys())
+# annotated fields of `DirEntry`, spelled out to keep get_type_hints off import
+_DIR_ENTRY_HEADER = [
+    "name",
+    "type",
+    "size",
+    "creation_time",
+    "last_access_time",
+    "last_write_time",
+    "etag",
+]
+_DIR_ENTRY_TIMES = {"creation_time", "last_access_time", "last_write_time"}
+
+
+class ListingParser:
+    """
+    Incremental parser of List Directories and Files response. It is fed
+    with chunks as they arrive and returns entries completed so far, so
+    neither whole page nor its tree is ever held in memory.
+
+    >>> p = ListingParser(PosixPath("/d"))
+    >>> [str(e.path) for e in p.feed(b"<EnumerationResults><Entries><File>"
+    ...     b"<Name>a</Name><Properties><Content-Length>1</Content-Length>"
+    ...     b"</Properties></File><Directory><Name>b</Name>")]
+    ['/d/a']
+    >>> [e.type for e in p.feed(b"<Properties /></Directory></Entries>"
+    ...     b"<NextMarker>c</NextMarker></EnumerationResults>")], p.marker
+    (['Directory'], 'c')
+    """
+
+    FEED_SIZE = 16 * 1024
+
+    def __init__(self, dir_path: PosixPath):
+        import xml.etree.ElementTree as ET
+
+        self.dir_path = dir_path
+        self.marker = ""
+        self.entries: typing.Optional[ET.Element] = None
+        self.parser: "ET.XMLPullParser[ET.Element]" = ET.XMLPullParser(
+            events=("start", "end")
+        )
+
+    def feed(self, chunk: bytes) -> List[DirEntry]:
+        found: List[DirEntry] = []
+        # events pile up with their elements until read, so big chunks are
+        # fed in small slices to keep tree (and memory) small
+        for i in range(0, len(chunk), self.FEED_SIZE):
+            self.parser.feed(chunk[i : i + self.FEED_SIZE])
+            self._read_events(found)
+        return found
+
+    def _read_events(self, found: List[DirEntry]):
+        entries = self.entries
+        events = typing.cast(
+            Iterator[Tuple[str, "ET.Element"]], self.parser.read_events()
+        )
+        for event, elem in events:
+            if event == "start":
+                if elem.tag == "Entries":
+                    entries = self.entries = elem
+            elif elem.tag == "NextMarker":
+                self.marker = elem.text or ""
+            elif entries is not None and elem in entries:
+                found.append(DirEntry.from_xml(None, elem, self.dir_path))
+                entries.remove(elem)
+
+
+MTIME_TOLERANCE = 1.0
+
+
+def is_changed(size: int, mtime: datetime, entry: DirEntry) -> bool:
+    """
+    Local file of `size` and `mtime` differs from remote `entry`
+
+    >>> e = DirEntry("a", "File", {"content_length": "5",
+    ...     "last_write_time": "2021-07-30T18:13:20.4000000Z"})
+    >>> t = datetime(2021, 7, 30, 18, 13, 20, tzinfo=timezone.utc)
+    >>> is_changed(5, t, e), is_changed(6, t, e)
+    (False, True)
+    >>> is_changed(5, t.replace(minute=14), e)
+    True
+    >>> is_changed(5, t, None)
+    True
+    """
+    if entry is None or entry.type != "File" or entry.size != size:
+        return True
+    if entry.last_write_time is None:
+        return True
+    delta = (entry.last_write_time - mtime).total_seconds()
+    return abs(delta) > MTIME_TOLERANCE
+
+
+_CACHE_FIELDS = [
+    "name",
+    "type",
+    "size",
+    "creation_time",
+    "last_access_time",
+    "last_write_time",
+    "etag",
+]
+
+
+class MetaCache:
+    """
+    On-disk SQLite cache of `DirEntry` records and complete directory
+    listings keyed by storage account, share and path. Records older than
+    `ttl` seconds are not served. Refetched record replaces columns it
+    has, fields its source doesn't carry (Get Properties has no access
+    time) are kept while etag is unchanged. Changed etag also drops
+    listing of parent. Expired record is still kept, so its etag can be
+    revalidated with conditional request and `refresh`ed if unchanged.
+    Least recently used records, read alone or as part of listing, are
+    evicted once there are more than `max_entries` of them.
+
+    >>> import tempfile
+    >>> tmp = Path(tempfile.mkdtemp())
+    >>> cache = MetaCache(tmp / "cache", ttl=60)
+    >>> m = Mount("m", Config(tmp / "config"))
+    >>> e = DirEntry("a.txt", "File", {"content_length": "5", "etag": "x"},
+    ...     path=PosixPath("/d/a.txt"))
+    >>> cache.put(m, e)
+    >>> cache.get(m, PosixPath("/d/a.txt")).size
+    5
+    >>> listed = time.time()
+    >>> e = DirEntry("a.txt", "File", {"content_length": "5", "etag": "x",
+    ...     "last_access_time": "2021-07-30T18:13:20.4000000Z"},
+    ...     path=PosixPath("/d/a.txt"))
+    >>> cache.put(m, e); cache.put_listing(m, PosixPath("/d"), listed, 1)
+    >>> [x.last_access_time.year for x in cache.listing(m, PosixPath("/d"))]
+    [2021]
+    >>> e = DirEntry("a.txt", "File", {"content_length": "5", "etag": "x"},
+    ...     path=PosixPath("/d/a.txt"))
+    >>> cache.put(m, e)
+    >>> cache.get(m, PosixPath("/d/a.txt")).last_access_time.year
+    2021
+    >>> e.etag, e.size = "y", 6
+    >>> cache.put(m, e)
+    >>> cache.get(m, PosixPath("/d/a.txt")).size
+    6
+    >>> cache.listing(m, PosixPath("/d")) is None
+    True
+    >>> cache.ttl = 0
+    >>> cache.get(m, PosixPath("/d/a.txt")) is None
+    True
+    >>> cache.stale(m, PosixPath("/d/a.txt")).etag
+    'y'
+    >>> cache.ttl = 60; cache.refresh(m, PosixPath("/d/a.txt"))
+    >>> cache.get(m, PosixPath("/d/a.txt")).size
+    6
+    >>> cache.invalidate(m, PosixPath("/d"))
+    >>> cache.get(m, PosixPath("/d/a.txt")) is None
+    True
+    """
+
+    def __init__(
+        self, path: Path, ttl: float = DEFAULT_CACHE_TTL, max_entries=DEFAULT_CACHE_SIZE
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.puts = 0
+        import sqlite3
+
+        self.db = sqlite3.connect(str(path), check_same_thread=False)
+        self.db.executescript(
+            f"""
+            CREATE TABLE IF NOT EXISTS entries (
+                mount TEXT, path TEXT, parent TEXT, {", ".join(_CACHE_FIELDS)},
+                fetched REAL, used REAL, PRIMARY KEY (mount, path));
+            CREATE INDEX IF NOT EXISTS entries_parent ON entries (mount, parent);
+            CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+            CREATE TABLE IF NOT EXISTS listings (
+                mount TEXT, path TEXT, listed REAL, children INTEGER,
+                PRIMARY KEY (mount, path));
+            """
+        )
+        path.chmod(0o0600)
+
+    @staticmethod
+    def _key(mount: Mount) -> str:
+        return f"{mount.storage_account}/{mount.share}"
+
+    def _to_entry(self, path: str, row) -> DirEntry:
+        props = dict(zip(_CACHE_FIELDS[2:], row[2:]))
+        props["content_length"] = props.pop("size")
+        return DirEntry(row[0], row[1], props, path=PosixPath(path))
+
+    def get(self, mount: Mount, path: PosixPath) -> typing.Union[DirEntry, None]:
+        return self._get(mount, path, time.time() - self.ttl)
+
+    def stale(self, mount: Mount, path: PosixPath) -> typing.Union[DirEntry, None]:
+        """
+        Entry however long ago it was fetched, to revalidate its etag
+        """
+        return self._get(mount, path, float("-inf"))
+
+    def _get(
+        self, mount: Mount, path: PosixPath, fetched_after: float
+    ) -> typing.Union[DirEntry, None]:
+        now = time.time()
+        with self.lock, self.db:
+            row = self.db.execute(
+                f"SELECT {', '.join(_CACHE_FIELDS)} FROM entries "
+                "WHERE mount = ? AND path = ? AND fetched > ?",
+                (self._key(mount), str(path), fetched_after),
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE entries SET used = ? WHERE mount = ? AND path = ?",
+                (now, self._key(mount), str(path)),
+            )
+        return self._to_entry(str(path), row)
+
+    def refresh(self, mount: Mount, path: PosixPath):
+        """
+        Service confirmed etag is unchanged, entry is valid for another `ttl`
+        """
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE entries SET fetched = ?, used = ? WHERE mount = ? AND path = ?",
+                (now, now, self._key(mount), str(path)),
+            )
+
+    def put(self, mount: Mount, *entries: DirEntry):
+        now = time.time()
+        key = self._key(mount)
+        with self.lock, self.db:
+            for e in entries:
+                values = [
+                    v.isoformat() if isinstance(v, datetime) else v
+                    for v in (getattr(e, k) for k in _CACHE_FIELDS)
+                ]
+                row = self.db.execute(
+                    "SELECT etag FROM entries WHERE mount = ? AND path = ?",
+                    (key, str(e.path)),
+                ).fetchone()
+                if row is not None and row[0] == e.etag:
+                    self.db.execute(
+                        "UPDATE entries SET "
+                        + "".join(f"{k} = coalesce(?, {k}), " for k in _CACHE_FIELDS)
+                        + "fetched = ?, used = ? WHERE mount = ? AND path = ?",
+                        (*values, now, now, key, str(e.path)),
+                    )
+                    continue
+                if row is not None:
+                    self.db.execute(
+                        "DELETE FROM listings WHERE mount = ? AND path = ?",
+                        (key, str(e.path.parent)),
+                    )
+                self.db.execute(
+                    "INSERT OR REPLACE INTO entries VALUES "
+                    f"(?, ?, ?, {', '.join('?' * len(_CACHE_FIELDS))}, ?, ?)",
+                    (key, str(e.path), str(e.path.parent), *values, now, now),
+                )
+            self.puts += len(entries)
+            if self.puts >= 1000:
+                self.puts = 0
+                self._evict()
+
+    def _evict(self):
+        (count,) = self.db.execute("SELECT count(*) FROM entries").fetchone()
+        if count > self.max_entries:
+            self.db.execute(
+                "DELETE FROM entries WHERE rowid IN "
+                "(SELECT rowid FROM entries ORDER BY used LIMIT ?)",
+                (count - self.max_entries,),
+            )
+
+    def listing(
+        self, mount: Mount, path: PosixPath
+    ) -> typing.Union[List[DirEntry], None]:
+        """
+        Complete cached content of directory, or `None` if any of it is
+        stale or evicted.
+        """
+        key = self._key(mount)
+        now = time.time()
+        with self.lock, self.db:
+            row = self.db.execute(
+                "SELECT children FROM listings "
+                "WHERE mount = ? AND path = ? AND listed > ?",
+                (key, str(path), now - self.ttl),
+            ).fetchone()
+            if row is None:
+                return None
+            rows = self.db.execute(
+                f"SELECT path, {', '.join(_CACHE_FIELDS)} FROM entries "
+                "WHERE mount = ? AND parent = ? ORDER BY name",
+                (key, str(path)),
+            ).fetchall()
+            if len(rows) != row[0]:
+                return None
+            self.db.execute(
+                "UPDATE entries SET used = ? WHERE mount = ? AND parent = ?",
+                (now, key, str(path)),
+            )
+        return [self._to_entry(r[0], r[1:]) for r in rows]
+
+    def put_listing(self, mount: Mount, path: PosixPath, listed: float, children):
+        """
+        Mark content of directory as complete, as of `listed` time, and
+        drop cached children that were not seen since.
+        """
+        key = self._key(mount)
+        with self.lock, self.db:
+            self.db.execute(
+                "DELETE FROM entries WHERE mount = ? AND parent = ? AND fetched < ?",
+                (key, str(path), listed),
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO listings VALUES (?, ?, ?, ?)",
+                (key, str(path), listed, children),
+            )
+
+    def invalidate(self, mount: Mount, path: PosixPath):
+        """
+        Forget `path`, everything under it and listing of its parent
+        """
+        key = self._key(mount)
+        prefix = str(path).rstrip("/") + "/"
+        with self.lock, self.db:
+            for table in ("entries", "listings"):
+                self.db.execute(
+                    f"DELETE FROM {table} WHERE mount = ? AND "
+                    "(path = ? OR substr(path, 1, ?) = ?)",
+                    (key, str(path), len(prefix), prefix),
+                )
+            self.db.execute(
+                "DELETE FROM listings WHERE mount = ? AND path = ?",
+                (key, str(path.parent)),
+            )
+
+
+def account_key(url: str) -> str:
+    """
+    Storage account of url: host of `<account>.file.core.windows.net`,
+    or host and first path segment for endpoints on IP address or
+    localhost, like emulator and stand-in, that carry account in path.
+
+    >>> account_key("https://acct.file.core.windows.net/share/a?sig=x")
+    'acct.file.core.windows.net'
+    >>> account_key("http://127.0.0.1:10000/acct/share/a?sig=x")
+    '127.0.0.1:10000/acct'
+    >>> account_key("http://[::1]:10000/acct/share/a?sig=x")
+    '[::1]:10000/acct'
+    """
+    parts = urlsplit(url)
+    if re.fullmatch(r"[\d.]+|[\da-f]*:[\da-f:]*|localhost", parts.hostname or ""):
+        return parts.netloc + "/" + parts.path.lstrip("/").split("/", 1)[0]
+    return parts.netloc
+
+
+def should_retry(method: str, status: int) -> bool:
+    """
+    >>> should_retry("PUT", 503), should_retry("PUT", 500), should_retry("GET", 500)
+    (True, False, True)
+    """
+    if status == INTERNAL_ERROR:
+        return method.upper() in IDEMPOTENT_METHODS
+    return status in THROTTLING_STATUSES
+
+
+class SessionPool:
+    """
+    Thread-safe registry of keep-alive `requests.Session`, one per storage
+    account, each holding up to `pool_size` open connections. Throttled
+    (429/503) calls, and failed (500) ones that are idempotent, are retried
+    with exponential backoff honoring `Retry-After`.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, retries: int = RETRIES):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.lock = threading.Lock()
+        self.sessions: Dict[str, "requests.Session"] = {}
+
+    def configure(self, pool_size: int = None, retries: int = None):
+        with self.lock:
+            if pool_size is not None:
+                self.pool_size = pool_size
+            if retries is not None:
+                self.retries = retries
+            self._close()
+
+    def _close(self):
+        for session in self.sessions.values():
+            session.close()
+        self.sessions = {}
+
+    def close(self):
+        with self.lock:
+            self._close()
+
+    def session(self, url: str) -> "requests.Session":
+        key = account_key(url)
+        session = self.sessions.get(key)
+        if session is None:
+            with self.lock:
+                session = self.sessions.get(key)
+                if session is None:
+                    session = self._new_session()
+                    self.sessions[key] = session
+        return session
+
+    def _new_session(self) -> "requests.Session":
+        import requests
+        from requests.adapters import HTTPAdapter
+        from urllib3.util.retry import Retry
+
+        class SafeRetry(Retry):
+            def is_retry(self, method, status_code, has_retry_after=False):
+                return should_retry(method, status_code) and super().is_retry(
+                    method, status_code, has_retry_after
+                )
+
+        retry = SafeRetry(
+            total=self.retries,
+            status_forcelist=(*THROTTLING_STATUSES, INTERNAL_ERROR),
+            backoff_factor=0.5,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Counts of connections opened and requests sent over already
+        opened connections across all sessions.
+        """
+        from requests.adapters import HTTPAdapter
+
+        opened = requests_sent = 0
+        with self.lock:
+            for session in self.sessions.values():
+                adapter = typing.cast(HTTPAdapter, session.get_adapter("https://"))
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    opened += pool.num_connections
+                    requests_sent += pool.num_requests
+        return {"opened": opened, "reused": max(0, requests_sent - opened)}
+
+
+def operation_name(method: str, url: str) -> str:
+    """
+    REST operation of request: method qualified by `comp` or, if there is
+    none, by `restype` of query
+
+    >>> operation_name("PUT", "https://a.file.core.windows.net/s/f?comp=range&sv=x")
+    'PUT range'
+    >>> operation_name("GET", "https://a/s/d?restype=directory&comp=list")
+    'GET list'
+    >>> operation_name("PUT", "https://a/s/d?restype=directory&sv=x")
+    'PUT directory'
+    >>> operation_name("HEAD", "https://a/s/f?sv=x")
+    'HEAD'
+    """
+    restype = ""
+    for param in urlsplit(url).query.split("&"):
+        k, _, v = param.partition("=")
+        if k == "comp":
+            return f"{method} {v}"
+        if k == "restype":
+            restype = v
+    return f"{method} {restype}" if restype else method
+
+
+class CallRecord:
+    """
+    Outcome of one REST call as seen by `ApiCall.observer`. `seconds`
+    is time until response headers arrived, so for streamed downloads it
+    doesn't include reading of body. `status` is 0 if call failed without
+    response. `retries` counts throttled or failed attempts retried.
+    """
+
+    def __init__(
+        self,
+        operation: str,
+        status: int,
+        start: float,
+        seconds: float,
+        sent: int,
+        received: int,
+        retries: int,
+    ):
+        self.operation = operation
+        self.status = status
+        self.start = start
+        self.seconds = seconds
+        self.sent = sent
+        self.received = received
+        self.retries = retries
+
+    def __repr__(self):
+        return (
+            f"CallRecord({self.operation!r}, status={self.status}, "
+            f"seconds={self.seconds:.3f}, sent={self.sent}, "
+            f"received={self.received}, retries={self.retries})"
+        )
+
+
+class OperationStats:
+    def __init__(self, start: float):
+        self.calls = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.sent = 0
+        self.received = 0
+        self.first = start
+        self.last = start
+        self.statuses: typing.Counter[int] = collections.Counter()
+
+    def add(self, record: CallRecord):
+        self.calls += 1
+        self.retries += record.retries
+        self.seconds += record.seconds
+        self.max_seconds = max(self.max_seconds, record.seconds)
+        self.sent += record.sent
+        self.received += record.received
+        self.first = min(self.first, record.start)
+        self.last = max(self.last, record.start + record.seconds)
+        self.statuses[record.status] += 1
+
+    def errors(self) -> int:
+        return sum(n for status, n in self.statuses.items() if not 0 < status < 400)
+
+    def throughput(self) -> float:
+        """
+        Bytes per second between start of first and end of last call, so
+        concurrent calls are not counted twice
+        """
+        elapsed = self.last - self.first
+        return (self.sent + self.received) / elapsed if elapsed > 0 else 0.0
+
+
+class CallStats:
+    """
+    Thread-safe `ApiCall.observer` aggregating calls by operation.
+
+    >>> stats = CallStats()
+    >>> stats(CallRecord("PUT range", 201, 0.0, 0.5, 4000000, 0, 0))
+    >>> stats(CallRecord("PUT range", 503, 0.25, 1.5, 4000000, 0, 1))
+    >>> stats(CallRecord("HEAD", 404, 2.0, 0.01, 0, 0, 0))
+    >>> for line in stats.summary(): print(line)
+    operation           calls errors retries  mean_ms   max_ms    sent_MB    recv_MB   MB/s statuses
+    PUT range               2      1       1   1000.0   1500.0        8.0        0.0    4.6 201:1 503:1
+    HEAD                    1      1       0     10.0     10.0        0.0        0.0    0.0 404:1
+    total                   3      2       1    670.0   1500.0        8.0        0.0    4.0
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.operations: Dict[str, OperationStats] = {}
+
+    def __call__(self, record: CallRecord):
+        with self.lock:
+            op = self.operations.get(record.operation)
+            if op is None:
+                op = self.operations[record.operation] = OperationStats(record.start)
+            op.add(record)
+
+    def summary(self) -> List[str]:
+        with self.lock:
+            ops = list(self.operations.items())
+        if not ops:
+            return ["no calls"]
+        total = OperationStats(min(op.first for _, op in ops))
+        for _, op in ops:
+            total.calls += op.calls
+            total.retries += op.retries
+            total.seconds += op.seconds
+            total.max_seconds = max(total.max_seconds, op.max_seconds)
+            total.sent += op.sent
+            total.received += op.received
+            total.last = max(total.last, op.last)
+            total.statuses.update(op.statuses)
+
+        def line(name: str, op: OperationStats, statuses: str) -> str:
+            return (
+                f"{name:<18} {op.calls:>6} {op.errors():>6} {op.retries:>7} "
+                f"{op.seconds / op.calls * 1000:>8.1f} {op.max_seconds * 1000:>8.1f} "
+                f"{op.sent / 1e6:>10.1f} {op.received / 1e6:>10.1f} "
+                f"{op.throughput() / 1e6:>6.1f} {statuses}"
+            ).rstrip()
+
+        header = (
+            f"{'operation':<18} {'calls':>6} {'errors':>6} {'retries':>7} "
+            f"{'mean_ms':>8} {'max_ms':>8} {'sent_MB':>10} {'recv_MB':>10} "
+            f"{'MB/s':>6} statuses"
+        )
+        return [
+            header,
+            *(
+                line(
+                    name,
+                    op,
+                    " ".join(f"{k}:{v}" for k, v in sorted(op.statuses.items())),
+                )
+                for name, op in ops
+            ),
+            line("total", total, ""),
+        ]
+
+
+class TokenBucket:
+    """
+    Grants `rate` units per second, letting up to `burst` (one second
+    worth by default) accumulate while unused. Reservation never fails:
+    it returns how long to wait until reserved units are earned, so takers
+    waiting at once are served in order of arrival and none of them
+    starves.
+
+    >>> bucket = TokenBucket(1000)
+    >>> bucket.reserve(1000)
+    0.0
+    >>> 0.4 < bucket.reserve(500) <= 0.5
+    True
+    """
+
+    def __init__(self, rate: float, burst: float = None):
+        self.rate = rate
+        self.burst = rate if burst is None else burst
+        self.lock = threading.Lock()
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def reserve(self, n: float) -> float:
+        """
+        Reserve `n` units, returns seconds to wait before using them
+        """
+        with self.lock:
+            now = time.monotonic()
+            earned = (now - self.updated) * self.rate
+            self.tokens = min(self.burst, self.tokens + earned) - n
+            self.updated = now
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+
+class RateLimiter:
+    """
+    Bytes per second and requests per second limits, 0 is unlimited
+    """
+
+    def __init__(self, bytes_per_sec: float = 0, requests_per_sec: float = 0):
+        self.limits = (bytes_per_sec, requests_per_sec)
+        self.bytes = TokenBucket(bytes_per_sec) if bytes_per_sec else None
+        self.requests = TokenBucket(requests_per_sec) if requests_per_sec else None
+
+    def reserve(self, requests: int, size: int) -> float:
+        wait = 0.0
+        if self.requests is not None and requests:
+            wait = self.requests.reserve(requests)
+        if self.bytes is not None and size:
+            wait = max(wait, self.bytes.reserve(size))
+        return wait
+
+
+class RateLimits:
+    """
+    Process wide rate limits: one for all calls, set from command line,
+    and one for every mount that has limits in config, applied to urls
+    of its share. Limiters are replaced only when limits change, so
+    commands running at once share them.
+
+    >>> limits = RateLimits()
+    >>> limits.active
+    False
+    >>> limits.configure(bytes_per_sec=10 ** 6)
+    >>> m = Mount("m", Config(Path("/nonexistent")))
+    >>> m.storage_account, m.share, m.max_requests_per_sec = "acct", "share", 10
+    >>> limits.register(m)
+    >>> [l.limits for l in limits.limiters(m.url(PosixPath("/a")))]
+    [(1000000, 0), (0, 10)]
+    >>> [l.limits for l in limits.limiters("https://other/share/a")]
+    [(1000000, 0)]
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.overall: typing.Optional[RateLimiter] = None
+        self.shares: Dict[str, RateLimiter] = {}
+        self.active = False
+
+    def configure(self, bytes_per_sec: float = 0, requests_per_sec: float = 0):
+        with self.lock:
+            limits = (bytes_per_sec, requests_per_sec)
+            if self.overall is None or self.overall.limits != limits:
+                self.overall = RateLimiter(*limits) if any(limits) else None
+            self._update()
+
+    def register(self, mount: Mount):
+        limits = (mount.max_bytes_per_sec, mount.max_requests_per_sec)
+        url = mount.share_url()
+        with self.lock:
+            # replaced, not changed in place, `limiters` iterates it unlocked
+            shares = dict(self.shares)
+            limiter = shares.get(url)
+            if not any(limits):
+                shares.pop(url, None)
+            elif limiter is None or limiter.limits != limits:
+                shares[url] = RateLimiter(*limits)
+            self.shares = shares
+            self._update()
+
+    def _update(self):
+        self.active = self.overall is not None or bool(self.shares)
+
+    def limiters(self, url: str) -> List[RateLimiter]:
+        overall, shares = self.overall, self.shares
+        found = [] if overall is None else [overall]
+        found.extend(l for prefix, l in shares.items() if url.startswith(prefix))
+        return found
+
+    def reserve(self, url: str, requests: int, size: int) -> float:
+        """
+        Reserve `requests` and `size` bytes to `url` with every limiter that
+        applies, returns seconds to wait before sending
+        """
+        return max((l.reserve(requests, size) for l in self.limiters(url)), default=0.0)
+
+    def take(self, url: str, requests: int, size: int):
+        wait = self.reserve(url, requests, size)
+        if wait > 0:
+            time.sleep(wait)
 
 
 class ApiCall:
+    sessions: typing.ClassVar[SessionPool] = SessionPool()
+    cache: typing.ClassVar[typing.Optional[MetaCache]] = None
+    # called with `CallRecord` of every call, see `CallStats`
+    observer: typing.ClassVar[typing.Optional[Callable[[CallRecord], None]]] = None
+    limits: typing.ClassVar[RateLimits] = RateLimits()
+
+    @classmethod
+    def cached(cls, remote: Remote, path: PosixPath) -> typing.Union[DirEntry, None]:
+        return None if cls.cache is None else cls.cache.get(remote.mount, path)
+
+    @classmethod
+    def invalidate(cls, remote: Remote, path: PosixPath):
+        if cls.cache is not None:
+            cls.cache.invalidate(remote.mount, path)
+
     @classmethod
-    def clear_file(cls, remote: Remote, size: int):
+    def clear_file(cls, remote: Remote, size: int, last_write_time: datetime = None):
         """
         https://docs.microsoft.com/en-us/rest/api/storageservices/create-file
         """
@@ -255,141 +1201,489 @@ class ApiCall:
                 "x-ms-file-permission": "inherit",
                 "x-ms-file-attributes": "None",
                 "x-ms-file-creation-time": "now",
-                "x-ms-file-last-write-time": "now",
+                "x-ms-file-last-write-time": "now"
+                if last_write_time is None
+                else to_azure_time(last_write_time),
             },
         )
+        cls.invalidate(remote, remote.remote_file)
         call.if_error(f"Can't clear_file:{remote!s} ")
 
     @classmethod
     def upload_file_range(cls, remote: Remote, file: Path, start: int, end: int):
         """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/put-range
+        Read `[start:end]` of `file` and send it with `upload_range`
         """
-        with file.open("rb") as fp:
+        buf = bytearray(end - start)
+        with file.open("rb", buffering=0) as fp:
             fp.seek(start)
-            call = cls(
-                "PUT",
-                remote.url("comp=range"),
-                data=fp.read(end - start),
-                headers={
-                    "x-ms-range": f"bytes={start}-{end-1}",
-                    "x-ms-write": "update",
-                },
-            )
-            call.if_error(f"Can't upload_file_range: {remote!s}[{start}:{end}] ")
+            data = read_upto(fp, buf, end - start)
+        if len(data) != end - start:
+            raise ValueError(f"Short read: [{start}:{end}] of {file}")
+        return cls.upload_range(remote, start, data)
 
     @classmethod
-    def directory_exists(cls, remote: Remote, remote_dir: PosixPath) -> bool:
+    def upload_range(
+        cls,
+        remote: Remote,
+        start: int,
+        data: typing.Union[bytes, memoryview],
+        content_md5: str = None,
+    ):
         """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/get-directory-properties
+        Service rejects range if `content_md5` is given and doesn't match.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/put-range
         """
-        call = cls("HEAD", remote.mount.url(remote_dir, "restype=directory"))
-        if call.response.status_code == 404:
-            return False
-        call.if_error()
-        return True
+        end = start + len(data)
+        headers = {
+            "x-ms-range": f"bytes={start}-{end-1}",
+            "x-ms-write": "update",
+        }
+        if content_md5 is not None:
+            headers["Content-MD5"] = content_md5
+        call = cls("PUT", remote.url("comp=range"), data=data, headers=headers)
+        cls.invalidate(remote, remote.remote_file)
+        call.if_error(f"Can't upload_range: {remote!s}[{start}:{end}] ")
+        return call.response.headers.get("ETag")
 
     @classmethod
-    def get_dir_properties(
-        cls, remote: Remote, remote_path: PosixPath
-    ) -> typing.Union[DirEntry, None]:
+    def set_content_md5(cls, remote: Remote, content_md5: str):
         """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/get-directory-properties
+        Store whole file MD5, it is returned as `Content-MD5` of Get File
         """
-        call = cls("HEAD", remote.mount.url(remote_path, "restype=directory"))
-        if call.response.status_code == 200:
-            return call.headers_to_direntry(remote_path, "Directory")
-        return None
+        cls._set_properties(remote, {"x-ms-content-md5": content_md5})
 
     @classmethod
-    def get_file_properties(
-        cls, remote: Remote, remote_path: PosixPath
-    ) -> typing.Union[DirEntry, None]:
+    def set_file_size(cls, remote: Remote, size: int):
         """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file-properties
+        Truncate or extend file, added bytes read as zeros
         """
-        call = cls("HEAD", remote.mount.url(remote_path))
-        if call.response.status_code == 200:
-            return call.headers_to_direntry(remote_path, "File")
-        return None
+        cls._set_properties(remote, {"x-ms-content-length": str(size)})
 
     @classmethod
-    def create_directory(cls, remote: Remote, remote_dir: PosixPath):
+    def set_last_write_time(
+        cls, remote: Remote, last_write_time: datetime, content_md5: str = None
+    ):
         """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/create-directory
+        Put Range of this API version resets last write time to now, so
+        time is set again after data is written. Whole file MD5 is stored
+        by the same call if given.
+        """
+        headers = {"x-ms-file-last-write-time": to_azure_time(last_write_time)}
+        if content_md5 is not None:
+            headers["x-ms-content-md5"] = content_md5
+        cls._set_properties(remote, headers)
+
+    @classmethod
+    def _set_properties(cls, remote: Remote, headers: Dict[str, str]):
+        """
+        Properties not in `headers` are preserved
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/set-file-properties
         """
         call = cls(
             "PUT",
-            remote.mount.url(remote_dir, "restype=directory"),
+            remote.url("comp=properties"),
             headers={
-                "x-ms-file-permission": "inherit",
-                "x-ms-file-attributes": "Directory",
-                "x-ms-file-creation-time": "now",
-                "x-ms-file-last-write-time": "now",
+                "x-ms-file-permission": "preserve",
+                "x-ms-file-attributes": "preserve",
+                "x-ms-file-creation-time": "preserve",
+                "x-ms-file-last-write-time": "preserve",
+                **headers,
             },
         )
-        call.if_error(f"Can't create dir:{remote_dir!s} ")
+        cls.invalidate(remote, remote.remote_file)
+        call.if_error(f"Can't set properties {list(headers)}: {remote!s} ")
 
     @classmethod
-    def download_file(cls, remote: Remote, local_path: Path):
-        """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file
+    def copy_file(cls, remote: Remote, source: Remote) -> str:
         """
-        r = cls("GET", remote.url(), stream=True).response
-        r.raise_for_status()
-        with local_path.open("wb") as f:
-            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
-                f.write(chunk)
+        Start server side copy of `source`, which may be in other share or
+        storage account, to `remote`. Returns copy status, `success` or
+        `pending`.
 
-    @classmethod
-    def delete_directory(cls, remote: Remote, remote_dir: PosixPath):
-        """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/delete-directory
+        https://docs.microsoft.com/en-us/rest/api/storageservices/copy-file
         """
-        call = cls("DELETE", remote.mount.url(remote_dir, "restype=directory"))
-        call.if_error()
+        call = cls(
+            "PUT",
+            remote.url(),
+            headers={
+                "x-ms-copy-source": source.url(),
+                "x-ms-file-creation-time": "source",
+                "x-ms-file-last-write-time": "source",
+            },
+        )
+        cls.invalidate(remote, remote.remote_file)
+        call.if_error(f"Can't copy_file: {source!s} -> {remote!s} ")
+        return call.response.headers.get("x-ms-copy-status", "success")
 
     @classmethod
-    def delete_file(cls, remote: Remote, remote_path: PosixPath):
+    def get_copy_status(cls, remote: Remote) -> Tuple[str, str]:
         """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/delete-file2
+        Status of last copy into `remote` and its description
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file-properties
         """
-        call = cls("DELETE", remote.mount.url(remote_path))
-        call.if_error()
+        call = cls("HEAD", remote.url())
+        call.if_error(f"Can't get_copy_status: {remote!s} ")
+        h = call.response.headers
+        return (
+            h.get("x-ms-copy-status", "success"),
+            h.get("x-ms-copy-status-description", ""),
+        )
 
     @classmethod
-    def list_dir(cls, remote: Remote, remote_dir: PosixPath) -> DirContent:
+    def copy_range(cls, remote: Remote, source: Remote, start: int, end: int):
         """
-        https://docs.microsoft.com/en-us/rest/api/storageservices/list-directories-and-files
+        Copy `[start:end]` range (4MiB at most) of `source` into the same
+        range of `remote` without data passing through client.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/put-range-from-url
         """
         call = cls(
-            "GET",
-            remote.mount.url(
-                remote_dir,
-                "restype=directory&comp=list&include=ETag&include=Timestamps",
-            ),
+            "PUT",
+            remote.url("comp=range"),
+            headers={
+                "x-ms-copy-source": source.url(),
+                "x-ms-source-range": f"bytes={start}-{end-1}",
+                "x-ms-range": f"bytes={start}-{end-1}",
+                "x-ms-write": "update",
+            },
         )
-        call.if_error()
-        root = ET.fromstring(call.response.text)
-        content = DirContent(remote_dir)
-        for child in next(root.iter("Entries")):
-            DirEntry.from_xml(content, child)
-        return content
+        cls.invalidate(remote, remote.remote_file)
+        call.if_error(f"Can't copy_range: {source!s} -> {remote!s}[{start}:{end}] ")
 
-    def __init__(
+    @classmethod
+    def directory_exists(cls, remote: Remote, remote_dir: PosixPath) -> bool:
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-directory-properties
+        """
+        e = cls.cached(remote, remote_dir)
+        if e is not None:
+            return e.type == "Directory"
+        call, e = cls._head(remote, remote_dir, "Directory")
+        if call.response.status_code == 404:
+            return False
+        call.if_error()
+        return True
+
+    @classmethod
+    def get_dir_properties(
+        cls, remote: Remote, remote_path: PosixPath
+    ) -> typing.Union[DirEntry, None]:
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-directory-properties
+        """
+        return cls._get_properties(remote, remote_path, "Directory")
+
+    @classmethod
+    def _get_properties(
+        cls, remote: Remote, remote_path: PosixPath, ftype: str
+    ) -> typing.Union[DirEntry, None]:
+        e = cls.cached(remote, remote_path)
+        if e is not None:
+            return e if e.type == ftype else None
+        return cls._head(remote, remote_path, ftype)[1]
+
+    @classmethod
+    def _head(
+        cls, remote: Remote, remote_path: PosixPath, ftype: str
+    ) -> Tuple["ApiCall", typing.Union[DirEntry, None]]:
+        """
+        Get properties, caching them. If expired entry is still cached,
+        its etag is sent as `If-None-Match`, and when service answers 304
+        Not Modified the entry is refreshed instead of refetched.
+        """
+        stale = (
+            None if cls.cache is None else cls.cache.stale(remote.mount, remote_path)
+        )
+        headers = {}
+        if stale is not None and stale.type == ftype and stale.etag:
+            headers["If-None-Match"] = stale.etag
+        query = "restype=directory" if ftype == "Directory" else None
+        call = cls("HEAD", remote.mount.url(remote_path, query), headers=headers)
+        status = call.response.status_code
+        if status == 304:
+            cls.cache.refresh(remote.mount, remote_path)
+            return call, stale
+        if status == 200:
+            e = call.headers_to_direntry(remote_path, ftype)
+            if cls.cache is not None:
+                cls.cache.put(remote.mount, e)
+            return call, e
+        return call, None
+
+    @classmethod
+    def get_file_properties(
+        cls, remote: Remote, remote_path: PosixPath
+    ) -> typing.Union[DirEntry, None]:
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file-properties
+        """
+        return cls._get_properties(remote, remote_path, "File")
+
+    @classmethod
+    def get_content_md5(cls, remote: Remote) -> typing.Optional[str]:
+        """
+        MD5 of whole file stored with it, if there is one
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file-properties
+        """
+        call = cls("HEAD", remote.url())
+        call.if_error(f"Can't get_content_md5: {remote!s} ")
+        return call.response.headers.get("Content-MD5")
+
+    @classmethod
+    def create_directory(
+        cls, remote: Remote, remote_dir: PosixPath, exist_ok: bool = False
+    ):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/create-directory
+        """
+        call = cls(
+            "PUT",
+            remote.mount.url(remote_dir, "restype=directory"),
+            headers={
+                "x-ms-file-permission": "inherit",
+                "x-ms-file-attributes": "Directory",
+                "x-ms-file-creation-time": "now",
+                "x-ms-file-last-write-time": "now",
+            },
+        )
+        cls.invalidate(remote, remote_dir)
+        if exist_ok and call.response.status_code == 409:
+            return
+        call.if_error(f"Can't create dir:{remote_dir!s} ")
+
+    @classmethod
+    def download_file(cls, remote: Remote, local_path: Path, verify_md5=False):
+        """
+        With `verify_md5` content is hashed as it is written and checked
+        against `Content-MD5` stored with file, if there is one.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file
+        """
+        r = cls("GET", remote.url(), stream=True).response
+        r.raise_for_status()
+        h = hashlib.md5() if verify_md5 else None
+        with local_path.open("wb") as f:
+            for chunk in r.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                if h is not None:
+                    h.update(chunk)
+        if h is not None:
+            check_md5(str(remote), r.headers.get("Content-MD5"), h)
+
+    @classmethod
+    def download_file_range(
+        cls, remote: Remote, local_path: Path, start: int, end: int, verify_md5=False
+    ):
+        """
+        Write `[start:end]` range of remote file into preallocated
+        `local_path` at the same offset. With `verify_md5` range (4MiB at
+        most) is checked against MD5 that service computes for it.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file
+        """
+        headers = {"x-ms-range": f"bytes={start}-{end-1}"}
+        if verify_md5:
+            headers["x-ms-range-get-content-md5"] = "true"
+        call = cls("GET", remote.url(), headers=headers, stream=True)
+        call.if_error(f"Can't download_file_range: {remote!s}[{start}:{end}] ")
+        h = hashlib.md5() if verify_md5 else None
+        with local_path.open("r+b") as f:
+            f.seek(start)
+            for chunk in call.response.iter_content(chunk_size=CHUNK_SIZE):
+                f.write(chunk)
+                if h is not None:
+                    h.update(chunk)
+            if f.tell() != end:
+                raise ValueError(
+                    f"Short read: {remote!s}[{start}:{end}] ended at {f.tell()}"
+                )
+        if h is not None:
+            expected = call.response.headers.get("Content-MD5")
+            actual = base64.b64encode(h.digest()).decode()
+            if actual != expected:
+                raise ValueError(
+                    f"MD5 mismatch: {remote!s}[{start}:{end}] "
+                    f"expected:{expected} actual:{actual}"
+                )
+
+    @classmethod
+    def read_range(
+        cls, remote: Remote, start: int, end: int, verify_md5=False
+    ) -> bytes:
+        """
+        Content of `[start:end]` range of remote file. With `verify_md5`
+        range (4MiB at most) is checked against MD5 that service computes.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file
+        """
+        headers = {"x-ms-range": f"bytes={start}-{end-1}"}
+        if verify_md5:
+            headers["x-ms-range-get-content-md5"] = "true"
+        call = cls("GET", remote.url(), headers=headers)
+        call.if_error(f"Can't read_range: {remote!s}[{start}:{end}] ")
+        data = call.response.content
+        if len(data) != end - start:
+            raise ValueError(
+                f"Short read: {remote!s}[{start}:{end}] got {len(data)} bytes"
+            )
+        if verify_md5:
+            expected = call.response.headers.get("Content-MD5")
+            actual = b64_md5(data)
+            if actual != expected:
+                raise ValueError(
+                    f"MD5 mismatch: {remote!s}[{start}:{end}] "
+                    f"expected:{expected} actual:{actual}"
+                )
+        return data
+
+    @classmethod
+    def list_ranges(cls, remote: Remote) -> List[Tuple[int, int]]:
+        """
+        `[start, end)` ranges of file that hold data, everything else reads
+        as zeros.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/list-ranges
+        """
+        call = cls("GET", remote.url("comp=rangelist"))
+        call.if_error(f"Can't list_ranges: {remote!s} ")
+        import xml.etree.ElementTree as ET
+
+        root = ET.fromstring(call.response.content)
+        return [
+            (int(r.findtext("Start")), int(r.findtext("End")) + 1)
+            for r in root.iter("Range")
+        ]
+
+    @classmethod
+    def delete_directory(cls, remote: Remote, remote_dir: PosixPath):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/delete-directory
+        """
+        call = cls("DELETE", remote.mount.url(remote_dir, "restype=directory"))
+        cls.invalidate(remote, remote_dir)
+        call.if_error()
+
+    @classmethod
+    def delete_file(cls, remote: Remote, remote_path: PosixPath):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/delete-file2
+        """
+        call = cls("DELETE", remote.mount.url(remote_path))
+        cls.invalidate(remote, remote_path)
+        call.if_error()
+
+    @classmethod
+    def list_dir(
+        cls, remote: Remote, remote_dir: PosixPath, maxresults: int = None
+    ) -> Iterator[DirEntry]:
+        """
+        Yields entries of `remote_dir` as they are parsed from response,
+        requesting next page of `maxresults` entries until service stops
+        returning `NextMarker`.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/list-directories-and-files
+        """
+        if cls.cache is not None:
+            cached = cls.cache.listing(remote.mount, remote_dir)
+            if cached is not None:
+                yield from cached
+                return
+        listed, children, batch = time.time(), 0, []
+        query = "restype=directory&comp=list&include=ETag&include=Timestamps"
+        if maxresults:
+            query += f"&maxresults={maxresults}"
+        marker = ""
+        while True:
+            page_query = f"{query}&marker={quote(marker)}" if marker else query
+            call = cls("GET", remote.mount.url(remote_dir, page_query), stream=True)
+            call.if_error()
+            parser = ListingParser(remote_dir)
+            try:
+                for chunk in call.response.iter_content(chunk_size=CHUNK_SIZE):
+                    for e in parser.feed(chunk):
+                        if cls.cache is not None:
+                            children += 1
+                            batch.append(e)
+                            if len(batch) >= 1000:
+                                cls.cache.put(remote.mount, *batch)
+                                batch = []
+                        yield e
+            finally:
+                call.response.close()
+            marker = parser.marker
+            if not marker:
+                break
+        if cls.cache is not None:
+            cls.cache.put(remote.mount, *batch)
+            cls.cache.put_listing(remote.mount, remote_dir, listed, children)
+
+    def __init__(
         self,
         method: str,
         url: str,
-        data: bytes = None,
+        data: typing.Union[bytes, memoryview] = None,
         headers: Dict[str, str] = None,
         stream=False,
     ):
         if headers is None:
             headers = {}
         headers["x-ms-version"] = API_VERSION
-        self.response = requests.request(
-            method, url, data=data, headers=headers, stream=stream
-        )
+        # memoryview is sent as is without copying, stubs just don't know it
+        body = typing.cast(bytes, data)
+        session = self.sessions.session(url)
+        sent = 0 if data is None else len(data)
+        limits = self.limits
+        limited = limits.active
+        if limited:
+            ranged = "x-ms-range" in headers and method == "GET"
+            expected = range_length(headers["x-ms-range"]) if ranged else 0
+            limits.take(url, 1, sent + expected)
+        # read from class, so function observer isn't bound as method
+        observer = type(self).observer
+        if observer is None:
+            self.response = session.request(
+                method, url, data=body, headers=headers, stream=stream
+            )
+        else:
+            self._observed_request(observer, method, url, body, headers, stream)
+        if limited and method == "GET" and not ranged:
+            # size of whole file or listing is known only now, before body is read
+            limits.take(url, 0, int(self.response.headers.get("Content-Length", 0)))
+
+    def _observed_request(
+        self,
+        observer: Callable[[CallRecord], None],
+        method: str,
+        url: str,
+        body: bytes,
+        headers: Dict[str, str],
+        stream: bool,
+    ):
+        start = time.perf_counter()
+        status = received = retries = 0
+        try:
+            self.response = self.sessions.session(url).request(
+                method, url, data=body, headers=headers, stream=stream
+            )
+            status = self.response.status_code
+            if method != "HEAD":
+                received = int(self.response.headers.get("Content-Length", 0))
+            history = getattr(
+                getattr(self.response.raw, "retries", None), "history", ()
+            )
+            retries = len(history)
+        finally:
+            sent = 0 if body is None else len(body)
+            seconds = time.perf_counter() - start
+            operation = operation_name(method, url)
+            observer(
+                CallRecord(operation, status, start, seconds, sent, received, retries)
+            )
 
     def if_error(self, msg=""):
         if self.response.status_code >= 400:
@@ -412,6 +1706,17 @@ class ApiCall:
         return f"status:{self.response.status_code}\n{self.response.text}"
 
 
+def range_length(header: str) -> int:
+    """
+    Number of bytes in `bytes=start-end` range, end is inclusive
+
+    >>> range_length("bytes=0-99")
+    100
+    """
+    start, _, end = header.partition("=")[2].partition("-")
+    return int(end) - int(start) + 1
+
+
 def split_buffer(sz: int, max: int) -> List[Tuple[int, int]]:
     """
     >>> split_buffer(100,4000000)
@@ -428,6 +1733,809 @@ def split_buffer(sz: int, max: int) -> List[Tuple[int, int]]:
     return list(zip(starts, ends))
 
 
+def data_extents(fp: typing.BinaryIO, size: int) -> List[Tuple[int, int]]:
+    """
+    `[start, end)` extents of file holding data according to filesystem,
+    holes in between read as zeros. Where SEEK_DATA/SEEK_HOLE is not
+    supported whole file is one extent.
+
+    >>> import tempfile
+    >>> with tempfile.TemporaryFile() as fp:
+    ...     _ = fp.write(b"abc")
+    ...     fp.flush()
+    ...     data_extents(fp, 3)
+    [(0, 3)]
+    """
+    seek_data = getattr(os, "SEEK_DATA", None)
+    seek_hole = getattr(os, "SEEK_HOLE", None)
+    if seek_data is None or seek_hole is None or size == 0:
+        return [(0, size)] if size else []
+    fd = fp.fileno()
+    extents = []
+    pos = 0
+    try:
+        while pos < size:
+            try:
+                start = os.lseek(fd, pos, seek_data)
+            except OSError:  # ENXIO: only hole till the end
+                break
+            end = min(os.lseek(fd, start, seek_hole), size)
+            extents.append((start, end))
+            pos = end
+    except OSError:
+        return [(0, size)]
+    return extents
+
+
+def split_extents(extents: List[Tuple[int, int]], max: int) -> List[Tuple[int, int]]:
+    """
+    >>> split_extents([(0, 5), (10, 12)], 3)
+    [(0, 3), (3, 5), (10, 12)]
+    """
+    return [
+        (start + s, start + e)
+        for start, end in extents
+        for s, e in split_buffer(end - start, max)
+    ]
+
+
+def is_zero(buf: typing.Union[bytes, bytearray], n: int) -> bool:
+    """
+    First `n` bytes of `buf` are all zeros
+
+    >>> is_zero(bytes(10), 10), is_zero(b"\\0\\0\\1", 3), is_zero(b"\\0\\0\\1", 2)
+    (True, False, True)
+    """
+    return buf.count(0, 0, n) == n
+
+
+def b64_md5(data) -> str:
+    """
+    Base64 encoded MD5, the way `Content-MD5` header carries it
+
+    >>> b64_md5(b"abc")
+    'kAFQmDzST7DWlj99KOF/cg=='
+    """
+    return base64.b64encode(hashlib.md5(data).digest()).decode()
+
+
+def check_md5(name: str, expected: typing.Optional[str], h: "hashlib._Hash"):
+    """
+    Raise if `expected` MD5, when there is one, doesn't match hash `h`
+
+    >>> check_md5("a", None, hashlib.md5(b"abc"))
+    >>> check_md5("a", "kAFQmDzST7DWlj99KOF/cg==", hashlib.md5(b"abc"))
+    >>> check_md5("a", "kAFQmDzST7DWlj99KOF/cg==", hashlib.md5(b"abd"))
+    Traceback (most recent call last):
+    ...
+    ValueError: MD5 mismatch: a expected:kAFQmDzST7DWlj99KOF/cg== actual:SRHlFuWqIdMnUS4Mixl2Fg==
+    """
+    actual = base64.b64encode(h.digest()).decode()
+    if expected and actual != expected:
+        raise ValueError(f"MD5 mismatch: {name} expected:{expected} actual:{actual}")
+
+
+class OrderedHasher:
+    """
+    MD5 of file written by ranges that complete in any order. Hash is
+    advanced over file as soon as everything before next missing range is
+    written, rereading it while it is still in page cache. Bytes not
+    covered by any range, holes of sparse file, are hashed as they read.
+
+    >>> import tempfile
+    >>> path = Path(tempfile.mkdtemp()) / "f"
+    >>> _ = path.write_bytes(b"abcdef")
+    >>> h = OrderedHasher(path, 6, [(0, 2), (2, 4), (4, 6)])
+    >>> h.done(4); h.done(2); h.pos
+    0
+    >>> h.done(0); h.pos, h.md5.digest() == hashlib.md5(b"abcdef").digest()
+    (6, True)
+    """
+
+    def __init__(self, local_path: Path, size: int, ranges: List[Tuple[int, int]]):
+        self.local_path = local_path
+        self.size = size
+        self.missing = collections.deque(sorted(ranges))
+        self.completed: typing.Set[int] = set()
+        self.pos = 0
+        self.md5 = hashlib.md5()
+        self.lock = threading.Lock()
+        self.buf = bytearray(CHUNK_SIZE)
+
+    def done(self, start: int):
+        with self.lock:
+            self.completed.add(start)
+            while self.missing and self.missing[0][0] in self.completed:
+                self.completed.discard(self.missing.popleft()[0])
+            end = self.missing[0][0] if self.missing else self.size
+            if end <= self.pos:
+                return
+            with self.local_path.open("rb", buffering=0) as fp:
+                fp.seek(self.pos)
+                while self.pos < end:
+                    data = read_upto(fp, self.buf, min(CHUNK_SIZE, end - self.pos))
+                    if not len(data):
+                        raise ValueError(f"Short file: {self.local_path}")
+                    self.md5.update(data)
+                    self.pos += len(data)
+
+
+COMPRESSIONS = ("gzip", "zstd")
+
+
+def _zstandard():
+    try:
+        import zstandard  # type: ignore
+    except ImportError:
+        raise ValueError("zstd needs zstandard package: pip install azfiles[zstd]")
+    return zstandard
+
+
+# fastest gzip level is the one that keeps up with network, zstd is fast anyway
+COMPRESSION_LEVELS = {"gzip": 1, "zstd": 3}
+
+
+def compressor(compression: str, level: int = None) -> Callable[[Any], bytes]:
+    """
+    Function compressing chunk into self contained gzip member or zstd
+    frame. Concatenated, they are valid stream, so chunks can be
+    compressed independently and in parallel.
+
+    >>> compress, d = compressor("gzip"), Decompressor("gzip")
+    >>> data = compress(b"abc") + compress(b"def")
+    >>> d.decompress(data[:30]) + d.decompress(data[30:])
+    b'abcdef'
+    >>> d.close()
+    """
+    if compression not in COMPRESSIONS:
+        raise ValueError(
+            f"Unknown compression: {compression}, use one of {COMPRESSIONS}"
+        )
+    if level is None:
+        level = COMPRESSION_LEVELS[compression]
+    if compression == "gzip":
+
+        def compress(data) -> bytes:
+            c = zlib.compressobj(level, zlib.DEFLATED, 31)
+            return c.compress(data) + c.flush()
+
+        return compress
+    zstandard = _zstandard()
+    return lambda data: zstandard.ZstdCompressor(level=level).compress(data)
+
+
+class Decompressor:
+    """
+    Decompress stream of concatenated gzip members or zstd frames as it
+    arrives
+    """
+
+    def __init__(self, compression: str):
+        if compression not in COMPRESSIONS:
+            raise ValueError(
+                f"Unknown compression: {compression}, use one of {COMPRESSIONS}"
+            )
+        self.compression = compression
+        self.obj = self._new()
+        self.pending = False
+
+    def _new(self):
+        if self.compression == "gzip":
+            return zlib.decompressobj(31)
+        return _zstandard().ZstdDecompressor().decompressobj()
+
+    def decompress(self, data) -> bytes:
+        out = []
+        while len(data):
+            out.append(self.obj.decompress(data))
+            self.pending = not self.obj.eof
+            if self.pending:
+                break
+            data = self.obj.unused_data
+            self.obj = self._new()
+        return b"".join(out)
+
+    def close(self):
+        if self.pending:
+            raise ValueError(f"Truncated {self.compression} stream")
+
+
+_ZEROS = bytes(1024 * 1024)
+
+
+def update_with_zeros(h, n: int):
+    """
+    Feed `n` zero bytes to hash `h` (file holes are not read)
+
+    >>> h = hashlib.md5(); update_with_zeros(h, 3); h.digest() == hashlib.md5(bytes(3)).digest()
+    True
+    """
+    while n > 0:
+        k = min(n, len(_ZEROS))
+        h.update(_ZEROS[:k])
+        n -= k
+
+
+# tar archive is made of blocks of this size
+TAR_BLOCK = 512
+
+
+def tar_stream(local_root: Path, index: Dict[str, list]) -> Iterator[bytes]:
+    """
+    Yields tar archive of `local_root` tree piece by piece, member names
+    starting with name of `local_root`. Directories are added to
+    `index["dirs"]` and files to `index["members"]` with offset of their
+    data in archive, so any of them can be read later by ranged GET.
+
+    >>> import tarfile, tempfile
+    >>> root = Path(tempfile.mkdtemp()) / "docs"
+    >>> (root / "sub").mkdir(parents=True)
+    >>> _ = (root / "sub" / "a.txt").write_bytes(b"hello")
+    >>> index = {"dirs": [], "members": []}
+    >>> data = b"".join(tar_stream(root, index))
+    >>> index["dirs"]
+    ['docs', 'docs/sub']
+    >>> m = index["members"][0]
+    >>> m["name"], data[m["offset"] : m["offset"] + m["size"]]
+    ('docs/sub/a.txt', b'hello')
+    >>> tarfile.open(fileobj=io.BytesIO(data)).getnames()
+    ['docs', 'docs/sub', 'docs/sub/a.txt']
+    """
+    import tarfile
+
+    def header(info: tarfile.TarInfo) -> bytes:
+        return info.tobuf(tarfile.PAX_FORMAT, "utf-8", "surrogateescape")
+
+    pos = 0
+    for dirpath, dirnames, filenames in os.walk(local_root):
+        dirnames.sort()
+        name = Path(dirpath).relative_to(local_root.parent).as_posix()
+        st = os.stat(dirpath)
+        info = tarfile.TarInfo(name)
+        info.type, info.mode, info.mtime = (
+            tarfile.DIRTYPE,
+            st.st_mode & 0o7777,
+            int(st.st_mtime),
+        )
+        block = header(info)
+        pos += len(block)
+        yield block
+        index["dirs"].append(name)
+        for f in sorted(filenames):
+            path = Path(dirpath, f)
+            st = path.stat()
+            info = tarfile.TarInfo(f"{name}/{f}")
+            info.size, info.mode, info.mtime = (
+                st.st_size,
+                st.st_mode & 0o7777,
+                int(st.st_mtime),
+            )
+            block = header(info)
+            pos += len(block)
+            yield block
+            index["members"].append(
+                {
+                    "name": info.name,
+                    "offset": pos,
+                    "size": st.st_size,
+                    "mtime": st.st_mtime,
+                }
+            )
+            left = st.st_size
+            with path.open("rb") as fp:
+                while left:
+                    data = fp.read(min(left, RANGE_SIZE))
+                    if not data:
+                        raise ValueError(f"File shrunk while packing: {path}")
+                    left -= len(data)
+                    yield data
+            padding = -st.st_size % TAR_BLOCK
+            pos += st.st_size + padding
+            yield bytes(padding)
+    yield bytes(2 * TAR_BLOCK)
+
+
+class IterReader(io.RawIOBase):
+    """
+    Binary stream reading bytes pieces yielded by iterator
+
+    >>> bytes(read_upto(IterReader(iter([b"ab", b"", b"cde"])), bytearray(8), 8))
+    b'abcde'
+    """
+
+    def __init__(self, pieces: Iterator[bytes]):
+        self.pieces = pieces
+        self.piece = memoryview(b"")
+
+    def readable(self):
+        return True
+
+    def readinto(self, b) -> int:
+        while not len(self.piece):
+            piece = next(self.pieces, None)
+            if piece is None:
+                return 0
+            self.piece = memoryview(piece)
+        n = min(len(b), len(self.piece))
+        b[:n] = self.piece[:n]
+        self.piece = self.piece[n:]
+        return n
+
+
+def member_path(local_root: Path, name: str) -> Path:
+    """
+    Local path of archive member, refusing names that would land outside
+    of `local_root`
+
+    >>> member_path(Path("/tmp/x"), "docs/a.txt")
+    PosixPath('/tmp/x/docs/a.txt')
+    >>> member_path(Path("/tmp/x"), "../etc/passwd")
+    Traceback (most recent call last):
+    ...
+    ValueError: Unsafe member name: ../etc/passwd
+    """
+    parts = PosixPath(name).parts
+    if not parts or PosixPath(name).is_absolute() or ".." in parts:
+        raise ValueError(f"Unsafe member name: {name}")
+    return local_root.joinpath(*parts)
+
+
+class PackExtractor:
+    """
+    Writable target for stream of packed archive. Data of every member in
+    `index` is written to its file under `local_root` as its bytes pass,
+    tar headers and padding are skipped.
+
+    >>> import tempfile
+    >>> src = Path(tempfile.mkdtemp()) / "docs"
+    >>> src.mkdir()
+    >>> _ = (src / "a.txt").write_bytes(b"hello"); _ = (src / "empty").write_bytes(b"")
+    >>> index = {"dirs": [], "members": []}
+    >>> data = b"".join(tar_stream(src, index))
+    >>> dst = Path(tempfile.mkdtemp())
+    >>> x = PackExtractor(index, dst)
+    >>> for i in range(0, len(data), 100): x.write(data[i : i + 100])
+    >>> x.close()
+    >>> (dst / "docs" / "a.txt").read_bytes(), (dst / "docs" / "empty").exists()
+    (b'hello', True)
+    """
+
+    def __init__(self, index: Dict[str, list], local_root: Path):
+        self.local_root = local_root
+        self.members = index["members"]
+        for name in index["dirs"]:
+            member_path(local_root, name).mkdir(parents=True, exist_ok=True)
+        self.pos = 0
+        self.current = 0
+        self.fp: typing.Optional[typing.BinaryIO] = None
+
+    def write(self, data: bytes):
+        view = memoryview(data)
+        while True:
+            self._finish_empty()
+            if not len(view) or self.current >= len(self.members):
+                break
+            m = self.members[self.current]
+            if self.pos < m["offset"]:
+                skip = min(len(view), m["offset"] - self.pos)
+            else:
+                if self.fp is None:
+                    self.fp = member_path(self.local_root, m["name"]).open("wb")
+                skip = min(len(view), m["offset"] + m["size"] - self.pos)
+                self.fp.write(view[:skip])
+            view = view[skip:]
+            self.pos += skip
+            if self.fp is not None and self.pos == m["offset"] + m["size"]:
+                self._done(m)
+        self.pos += len(view)
+
+    def _finish_empty(self):
+        while self.current < len(self.members):
+            m = self.members[self.current]
+            if m["size"] or m["offset"] > self.pos:
+                break
+            member_path(self.local_root, m["name"]).open("wb").close()
+            self._done(m)
+
+    def _done(self, m: dict):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+        path = member_path(self.local_root, m["name"])
+        os.utime(path, (m["mtime"], m["mtime"]))
+        self.current += 1
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self._finish_empty()
+        if self.current < len(self.members):
+            raise ValueError(
+                f"Archive ends before member: {self.members[self.current]['name']}"
+            )
+
+
+class BufferPool:
+    """
+    Up to `count` reusable buffers of `size` bytes. Buffers are allocated
+    on first demand and `get` blocks when all of them are in use, which
+    also bounds how far reading can run ahead of uploading.
+
+    >>> pool = BufferPool(2, 4)
+    >>> a = pool.get(); b = pool.get(); pool.put(a)
+    >>> pool.get() is a, len(a)
+    (True, 4)
+    """
+
+    def __init__(self, count: int, size: int):
+        self.size = size
+        self.free: queue.LifoQueue = queue.LifoQueue()
+        self.unallocated = threading.BoundedSemaphore(max(1, count))
+
+    def get(self) -> bytearray:
+        try:
+            return self.free.get_nowait()
+        except queue.Empty:
+            pass
+        if self.unallocated.acquire(blocking=False):
+            return bytearray(self.size)
+        return self.free.get()
+
+    def put(self, buf: bytearray):
+        self.free.put(buf)
+
+
+def read_into(fp, buf: bytearray, n: int) -> memoryview:
+    """
+    Fill first `n` bytes of `buf` from current position of `fp`
+
+    >>> import io
+    >>> bytes(read_into(io.BytesIO(b"abcdef"), bytearray(8), 4))
+    b'abcd'
+    """
+    view = read_upto(fp, buf, n)
+    if len(view) < n:
+        raise EOFError(f"Expected {n} bytes, got only {len(view)}")
+    return view
+
+
+def read_upto(fp, buf: bytearray, n: int) -> memoryview:
+    """
+    Fill up to `n` bytes of `buf` from `fp`, fewer only at end of stream.
+    Pipe returns data in pieces as it is written, so it is read until
+    buffer is full.
+
+    >>> import io
+    >>> bytes(read_upto(io.BytesIO(b"abc"), bytearray(8), 8))
+    b'abc'
+    """
+    view = memoryview(buf)[:n]
+    got = 0
+    while got < n:
+        k = fp.readinto(view[got:])
+        if not k:
+            break
+        got += k
+    return view[:got]
+
+
+def with_retries(fn: Callable, *args, attempts: int = RETRIES, backoff: float = 1.0):
+    """
+    Call `fn(*args)` up to `attempts` times, sleeping `backoff`, then
+    twice as long, and so on between failures. Last error is reraised.
+
+    >>> calls = []
+    >>> def flaky(x):
+    ...     calls.append(x)
+    ...     if len(calls) < 3:
+    ...         raise ValueError("boom")
+    ...     return x * 2
+    >>> with_retries(flaky, 21, backoff=0)
+    42
+    >>> len(calls)
+    3
+    >>> with_retries(flaky, 1, attempts=1, backoff=0)
+    2
+    """
+    for attempt in range(attempts):
+        try:
+            return fn(*args)
+        except Exception:
+            if attempt + 1 >= attempts:
+                raise
+            time.sleep(backoff * (2 ** attempt))
+
+
+class ByteBudget:
+    """
+    Blocks `acquire(n)` while more than `limit` bytes are already held.
+    Request bigger than `limit` is granted when nothing else is held, so
+    it cannot deadlock.
+
+    >>> budget = ByteBudget(10)
+    >>> budget.acquire(6); budget.acquire(4); budget.held
+    10
+    >>> budget.release(10); budget.acquire(25); budget.held
+    25
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.held = 0
+        self.cond = threading.Condition()
+
+    def acquire(self, n: int):
+        with self.cond:
+            while self.held and self.held + n > self.limit:
+                self.cond.wait()
+            self.held += n
+
+    def release(self, n: int):
+        with self.cond:
+            self.held -= n
+            self.cond.notify_all()
+
+
+class Journal:
+    """
+    Local checkpoint of one multi-range transfer: header line describing
+    transfer followed by line per completed range, so transfer interrupted
+    midway can pick up where it stopped.
+
+    >>> import tempfile
+    >>> j = Journal(Path(tempfile.mkdtemp()), "upload", "m:/a", "/tmp/a")
+    >>> j.load()
+    (None, {})
+    >>> j.start({"size": 10})
+    >>> j.add(0, 5, "e1"); j.add(5, 10, "e2")
+    >>> j.load()
+    ({'size': 10}, {0: 'e1', 5: 'e2'})
+    >>> j.finish(); j.load()
+    (None, {})
+    """
+
+    def __init__(self, dir: Path, *key: str):
+        digest = hashlib.sha1(json.dumps(key).encode()).hexdigest()
+        self.path = dir / digest
+        self.lock = threading.Lock()
+        self.fp: typing.Optional[typing.TextIO] = None
+
+    def load(self) -> Tuple[typing.Optional[dict], Dict[int, str]]:
+        """
+        Header and `{start: etag}` of completed ranges, if journal exists
+        """
+        if not self.path.exists():
+            return None, {}
+        with self.path.open("rt") as fp:
+            lines = [json.loads(line) for line in fp if line.endswith("\n")]
+        if not lines:
+            return None, {}
+        return lines[0], {r["start"]: r["etag"] for r in lines[1:]}
+
+    def start(self, header: dict, resume: bool = False):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.fp = self.path.open("at" if resume else "wt")
+        self.path.chmod(0o0600)
+        if not resume:
+            self._write(header)
+
+    def _write(self, record: dict):
+        with self.lock:
+            self.fp.write(json.dumps(record) + "\n")
+            self.fp.flush()
+
+    def add(self, start: int, end: int, etag: str = None):
+        self._write({"start": start, "end": end, "etag": etag})
+
+    def close(self):
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    def finish(self):
+        self.close()
+        if self.path.exists():
+            self.path.unlink()
+
+
+class BoundedExecutor:
+    """
+    Thread pool where `submit` blocks while `max_pending` tasks are
+    queued or running, so producer never runs ahead of workers holding
+    unbounded amount of data in memory. First error raised by any task is
+    reraised by `join()`.
+
+    >>> out = []
+    >>> with BoundedExecutor(workers=2, max_pending=3) as ex:
+    ...     for i in range(10):
+    ...         _ = ex.submit(out.append, i)
+    >>> sorted(out)
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+    >>> with BoundedExecutor(workers=2) as ex:
+    ...     _ = ex.submit(int, "x")
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid literal for int() with base 10: 'x'
+    """
+
+    def __init__(self, workers: int, max_pending: int = None):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.slots = threading.BoundedSemaphore(max(1, max_pending or workers))
+        self.errors: List[BaseException] = []
+
+    def submit(self, fn: Callable, *args) -> "Future":
+        self.slots.acquire()
+        if self.errors:
+            self.slots.release()
+            raise self.errors[0]
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(self._done)
+        return future
+
+    def _done(self, future: "Future"):
+        e = future.exception()
+        if e is not None:
+            self.errors.append(e)
+        self.slots.release()
+
+    def join(self):
+        self.executor.shutdown(wait=True)
+        if self.errors:
+            raise self.errors[0]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.join()
+        else:
+            self.executor.shutdown(wait=True)
+
+
+def smooth(average: float, value: float, weight: float = 0.2) -> float:
+    """
+    Exponential moving average, starting from first value
+
+    >>> smooth(smooth(0.0, 10.0), 20.0)
+    12.0
+    """
+    return value if not average else average + weight * (value - average)
+
+
+class Autotuner:
+    """
+    Adjusts number of concurrent transfers while they run and picks range
+    size for each file. Throughput is measured over windows of at least
+    `window` seconds and `workers` completed transfers. Workers are added
+    one at a time while throughput keeps improving, when it stops
+    direction is reversed, so count settles around the best one. Window
+    with throttled call (429/503) halves workers right away.
+
+    >>> t = Autotuner(workers=2, max_workers=8, window=0)
+    >>> t.acquire(); t.acquire(); t.release(1000, 0.1); t.release(1000, 0.1)
+    >>> t.workers
+    3
+    >>> t.observe(CallRecord("PUT range", 503, 0.0, 0.1, 1000, 0, 1))
+    >>> for _ in range(3): t.acquire()
+    >>> for _ in range(3): t.release(1000, 0.1)
+    >>> t.workers, t.throttled
+    (1, 1)
+    """
+
+    def __init__(self, workers: int, max_workers: int, window: float = AUTOTUNE_WINDOW):
+        self.max_workers = max(1, max_workers)
+        self.workers = max(1, min(workers, self.max_workers))
+        self.window = window
+        self.cond = threading.Condition()
+        self.active = 0
+        self.direction = 1
+        self.rate = 0.0
+        self.window_start = self.started = time.perf_counter()
+        self.window_bytes = self.window_count = self.window_throttled = 0
+        self.transferred = self.throttled = 0
+        # smoothed latency of calls without payload, and bytes/s of one range
+        self.latency = 0.0
+        self.call_rate = 0.0
+        self.last_range_size = 0
+
+    def instrument(self, api: Type["ApiCall"]) -> Type["ApiCall"]:
+        """
+        Subclass of `api` reporting its calls to this tuner, as well as to
+        observer `api` already had
+        """
+        previous = getattr(api, "observer", None)
+
+        def observe(record: CallRecord):
+            self.observe(record)
+            if previous is not None:
+                previous(record)
+
+        return type(api.__name__, (api,), {"observer": staticmethod(observe)})
+
+    def observe(self, record: CallRecord):
+        with self.cond:
+            if record.retries or record.status in (429, 503):
+                self.window_throttled += 1
+                self.throttled += 1
+            if record.sent + record.received < MIN_RANGE_SIZE:
+                self.latency = smooth(self.latency, record.seconds)
+
+    def range_size(self, size: int) -> int:
+        """
+        Range for file of `size`, so every one of `max_workers` gets
+        a range, but not so small that latency dominates its transfer:
+        at rate seen for one range it takes at least 4 latencies.
+
+        >>> t = Autotuner(4, 16)
+        >>> t.range_size(100 * 2 ** 20) == MAX_RANGE_SIZE
+        True
+        >>> t.range_size(8 * 2 ** 20)
+        524288
+        >>> t.latency, t.call_rate = 0.05, 10e6
+        >>> t.range_size(8 * 2 ** 20)
+        2031616
+        """
+        target = max(-(-size // self.max_workers), 4 * self.latency * self.call_rate)
+        chunks = -(-int(max(target, MIN_RANGE_SIZE)) // CHUNK_SIZE)
+        self.last_range_size = min(chunks * CHUNK_SIZE, MAX_RANGE_SIZE)
+        return self.last_range_size
+
+    def acquire(self):
+        """
+        Wait until fewer than `workers` transfers are active
+        """
+        with self.cond:
+            while self.active >= self.workers:
+                self.cond.wait()
+            self.active += 1
+
+    def release(self, size: int, seconds: float):
+        """
+        Transfer of `size` bytes that took `seconds` is done
+        """
+        with self.cond:
+            self.active -= 1
+            self.transferred += size
+            self.window_bytes += size
+            self.window_count += 1
+            if size >= MIN_RANGE_SIZE and seconds > 0:
+                self.call_rate = smooth(self.call_rate, size / seconds)
+            self._adjust(time.perf_counter())
+            self.cond.notify_all()
+
+    def _adjust(self, now: float):
+        elapsed = now - self.window_start
+        if elapsed < self.window or self.window_count < self.workers:
+            return
+        rate = self.window_bytes / elapsed if elapsed > 0 else float(self.window_bytes)
+        if self.window_throttled:
+            self.workers = max(1, self.workers // 2)
+            self.direction = 1
+            rate = 0.0
+        else:
+            if rate < self.rate * 1.05:
+                self.direction = -self.direction
+            self.workers = max(1, min(self.max_workers, self.workers + self.direction))
+        self.rate = rate
+        self.window_start = now
+        self.window_bytes = self.window_count = self.window_throttled = 0
+
+    def report(self) -> str:
+        elapsed = time.perf_counter() - self.started
+        mb_per_sec = self.transferred / elapsed / 1e6 if elapsed > 0 else 0.0
+        range_size = (
+            f" range_size={self.last_range_size}" if self.last_range_size else ""
+        )
+        return (
+            f"autotune: workers={self.workers}{range_size} "
+            f"{mb_per_sec:.1f} MB/s, throttled calls: {self.throttled}"
+        )
+
+
 def clean_sas_token(token: str) -> str:
     """
     >>> clean_sas_token("abc")
@@ -442,48 +2550,1116 @@ def clean_sas_token(token: str) -> str:
     return token[1:] if token and token[0] == "?" else token
 
 
+class TreeDeleter:
+    """
+    Deletes remote directory tree with pool of `workers` threads. Directories
+    are listed concurrently, files deleted as soon as they are listed and
+    each directory is deleted right after its last child is gone.
+    """
+
+    def __init__(self, api: Type[ApiCall], remote: Remote, workers: int):
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.api = api
+        self.remote = remote
+        self.executor = ThreadPoolExecutor(max_workers=max(1, workers))
+        self.lock = threading.Lock()
+        self.remaining: Dict[PosixPath, int] = {}
+        self.outstanding = 0
+        self.finished = threading.Event()
+        self.errors: List[BaseException] = []
+        self.root: PosixPath = None
+        self.files = self.dirs = 0
+        self.reported = time.time()
+
+    def run(self, root: PosixPath):
+        self.root = root
+        self._submit(self._list_dir, root)
+        self.finished.wait()
+        self.executor.shutdown(wait=True)
+        self._report(force=True)
+        if self.errors:
+            raise self.errors[0]
+
+    def _submit(self, fn: Callable, *args):
+        with self.lock:
+            self.outstanding += 1
+        self.executor.submit(self._run, fn, *args)
+
+    def _run(self, fn: Callable, *args):
+        try:
+            if not self.errors:
+                fn(*args)
+        except BaseException as e:
+            self.errors.append(e)
+        finally:
+            with self.lock:
+                self.outstanding -= 1
+                if self.outstanding == 0:
+                    self.finished.set()
+
+    def _list_dir(self, path: PosixPath):
+        # listing itself counts as one child, so directory cannot be
+        # deleted before all entries are seen
+        with self.lock:
+            self.remaining[path] = 1
+        for e in self.api.list_dir(self.remote, path):
+            with self.lock:
+                self.remaining[path] += 1
+            if e.type == "Directory":
+                self._submit(self._list_dir, e.path)
+            else:
+                self._submit(self._delete_file, e.path)
+        self._child_deleted(path)
+
+    def _delete_file(self, path: PosixPath):
+        with_retries(self.api.delete_file, self.remote, path)
+        with self.lock:
+            self.files += 1
+        self._child_deleted(path.parent)
+
+    def _delete_dir(self, path: PosixPath):
+        with_retries(self.api.delete_directory, self.remote, path)
+        with self.lock:
+            self.dirs += 1
+        if path != self.root:
+            self._child_deleted(path.parent)
+
+    def _child_deleted(self, parent: PosixPath):
+        with self.lock:
+            self.remaining[parent] -= 1
+            empty = self.remaining[parent] == 0
+            if empty:
+                del self.remaining[parent]
+        if empty:
+            self._submit(self._delete_dir, parent)
+        self._report()
+
+    def _report(self, force=False):
+        now = time.time()
+        if force or now - self.reported >= 1:
+            self.reported = now
+            print(
+                f"deleted: {self.files} files, {self.dirs} directories",
+                file=sys.stderr,
+            )
+
+
+def walk_local(
+    local_root: Path, root: PosixPath
+) -> Tuple[List[PosixPath], List[Tuple[Path, PosixPath]]]:
+    """
+    Directories and files of local tree mapped to remote paths under
+    `root`
+    """
+    dirs: List[PosixPath] = []
+    files: List[Tuple[Path, PosixPath]] = []
+    for dirpath, dirnames, filenames in os.walk(local_root):
+        rel = Path(dirpath).relative_to(local_root)
+        remote_dir = PosixPath(root, *rel.parts)
+        dirs.extend(remote_dir / d for d in dirnames)
+        files.extend((Path(dirpath, f), remote_dir / f) for f in filenames)
+    return dirs, files
+
+
+def walk_remote(
+    api: Type[ApiCall],
+    remote: Remote,
+    root: PosixPath,
+    workers: int,
+    descend: Callable[[DirEntry, int], bool] = None,
+) -> Iterator[DirEntry]:
+    """
+    Yields all entries under `root`, listing up to `workers` directories
+    concurrently in breadth first order. Directory is listed only if
+    `descend(entry, depth)` agrees, where entries of `root` have depth 1.
+    """
+    results: queue.Queue = queue.Queue()
+    stop = threading.Event()
+
+    def list_one(path: PosixPath, depth: int):
+        try:
+            if not stop.is_set():
+                for e in api.list_dir(remote, path):
+                    results.put((e, depth))
+        except BaseException as x:
+            results.put(x)
+        finally:
+            results.put(None)
+
+    from concurrent.futures import ThreadPoolExecutor
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        executor.submit(list_one, root, 1)
+        outstanding = 1
+        while outstanding:
+            item = results.get()
+            if item is None:
+                outstanding -= 1
+                continue
+            if isinstance(item, BaseException):
+                raise item
+            e, depth = item
+            yield e
+            if e.type == "Directory" and (descend is None or descend(e, depth)):
+                executor.submit(list_one, e.path, depth + 1)
+                outstanding += 1
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def parse_time(s: str) -> datetime:
+    """
+    >>> parse_time("2021-07-30")
+    datetime.datetime(2021, 7, 30, 0, 0, tzinfo=datetime.timezone.utc)
+    >>> parse_time("2021-07-30T18:13:20-04:00").isoformat()
+    '2021-07-30T18:13:20-04:00'
+    """
+    dt = dt_parse(s)
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+class FindFilter:
+    """
+    Entry filters of `find` action. `prune` and `maxdepth` stop traversal
+    of whole subtrees, the rest only hide entries.
+
+    >>> f = FindFilter(name="*.log", min_size=10, maxdepth=2, prune="tmp*")
+    >>> e = lambda n, t="File", sz="10": DirEntry(n, t, {"content_length": sz})
+    >>> f.match(e("a.log")), f.match(e("a.txt")), f.match(e("a.log", sz="9"))
+    (True, False, False)
+    >>> d = e("logs", "Directory", None)
+    >>> f.descend(d, 1), f.descend(d, 2), f.descend(e("tmp1", "Directory"), 1)
+    (True, False, False)
+    """
+
+    def __init__(
+        self,
+        name: str = None,
+        type: str = None,
+        min_size: int = None,
+        max_size: int = None,
+        newer: datetime = None,
+        older: datetime = None,
+        maxdepth: int = None,
+        prune: str = None,
+    ):
+        self.name = name
+        self.type = type
+        self.min_size = min_size
+        self.max_size = max_size
+        self.newer = newer
+        self.older = older
+        self.maxdepth = maxdepth
+        self.prune = prune
+
+    def descend(self, e: DirEntry, depth: int) -> bool:
+        if self.maxdepth is not None and depth >= self.maxdepth:
+            return False
+        return not (self.prune and fnmatch.fnmatchcase(e.name, self.prune))
+
+    def match(self, e: DirEntry) -> bool:
+        if self.name and not fnmatch.fnmatchcase(e.name, self.name):
+            return False
+        if self.type and not e.type.lower().startswith(self.type.lower()):
+            return False
+        if self.min_size is not None or self.max_size is not None:
+            if e.size is None:
+                return False
+            if self.min_size is not None and e.size < self.min_size:
+                return False
+            if self.max_size is not None and e.size > self.max_size:
+                return False
+        if self.newer or self.older:
+            t = e.last_write_time
+            if t is None:
+                return False
+            if self.newer and t <= self.newer:
+                return False
+            if self.older and t >= self.older:
+                return False
+        return True
+
+
+_OPTIONS = {
+    "workers": "number of concurrent transfer threads",
+    "buffers": "max chunks read ahead of upload workers",
+    "segments": "number of ranges to split download into",
+    "pool_size": "max keep-alive connections per storage account",
+    "max_inflight": "max bytes read but not yet uploaded across all files",
+    "dry_run": "only print what would be transferred",
+    "maxresults": "page size for directory listing",
+    "name": "find: glob that entry names have to match",
+    "type": "find: `f` for files or `d` for directories",
+    "min_size": "find: smallest file size in bytes",
+    "max_size": "find: largest file size in bytes",
+    "newer": "find: modified after this time",
+    "older": "find: modified before this time",
+    "maxdepth": "find: how many directory levels to descend",
+    "prune": "find: glob of directory names not to descend into",
+    "sparse": "skip zero ranges of file on upload, fetch only data ranges",
+    "md5": "send and verify MD5 of every range and of whole file",
+    "cache": f"keep metadata in {CACHE_PATH} to skip repeated requests",
+    "cache_ttl": f"seconds cached metadata stays valid (default {DEFAULT_CACHE_TTL})",
+    "compress": "`gzip` or `zstd`: compress on upload, decompress on download",
+    "compress_level": "gzip 1-9 (default 1), zstd 1-22 (default 3)",
+    "jobs": f"batch: number of commands run concurrently (default {DEFAULT_JOBS})",
+    "stats": "print timing, bytes and statuses of REST calls by operation to stderr",
+    "autotune": "adjust workers (up to --pool_size) and range size to throughput",
+    "max_bytes_per_sec": "limit of bytes sent and received by all transfers",
+    "max_requests_per_sec": "limit of REST calls made by all transfers",
+    "pack": "upload directory as one tar with index, download extracts it",
+    "member": "download: extract only this member of pack",
+}
+
+
+def parse_options(args: List[str]) -> Tuple[List[str], Dict[str, str]]:
+    """
+    Extract `--name=value` and `--flag` options from command line
+
+    >>> parse_options(["m:/a", "upload", "--workers=8", "x.txt"])
+    (['m:/a', 'upload', 'x.txt'], {'workers': '8'})
+    >>> parse_options(["m:/a", "upload", "--buffers"])
+    (['m:/a', 'upload'], {'buffers': 'true'})
+    >>> parse_options(["m:/a", "--bogus=1"])
+    Traceback (most recent call last):
+    ...
+    ValueError: Unknown option: --bogus
+    """
+    rest, options = [], {}
+    for v in args:
+        if v.startswith("--"):
+            k, _, value = v[2:].partition("=")
+            if k not in _OPTIONS:
+                raise ValueError(f"Unknown option: --{k}")
+            options[k] = value if value else "true"
+        else:
+            rest.append(v)
+    return rest, options
+
+
 class Actions:
-    def __init__(self, remote: Remote, api: Type[ApiCall]):
+    def __init__(
+        self,
+        remote: Remote,
+        api: Type[ApiCall],
+        options: Dict[str, str] = None,
+        out: typing.TextIO = None,
+    ):
         self.remote = remote
         self.api = api
+        self.options = {} if options is None else options
+        self.out = out
+        if "pool_size" in self.options:
+            pool_size = self._option("pool_size", 0)
+            if pool_size != self.api.sessions.pool_size:
+                self.api.sessions.configure(pool_size=pool_size)
+        if self._option("cache", False):
+            ttl = self._option("cache_ttl", float(DEFAULT_CACHE_TTL))
+            if self.api.cache is None or self.api.cache.ttl != ttl:
+                self.api.cache = MetaCache(CACHE_PATH, ttl)
+        if (
+            "max_bytes_per_sec" in self.options
+            or "max_requests_per_sec" in self.options
+        ):
+            self.api.limits.configure(
+                self._option("max_bytes_per_sec", 0.0),
+                self._option("max_requests_per_sec", 0.0),
+            )
+        self.api.limits.register(remote.mount)
+        self.tuner: typing.Optional[Autotuner] = None
+        if self._option("autotune", False):
+            # workers beyond keep-alive pool would only churn connections
+            self.tuner = Autotuner(
+                self._option("workers", DEFAULT_WORKERS), self.api.sessions.pool_size
+            )
+            self.api = self.tuner.instrument(self.api)
 
-    def upload(self, local_str):
-        local_path = Path(local_str)
-        self.remote.set_remote_file(local_path)
+    def _print(self, *args):
+        print(*args, file=self.out)
+
+    def _option(self, name: str, default):
+        """
+        Option value from command line cast to type of `default`
+        """
+        if name not in self.options:
+            return default
+        v = self.options[name]
+        if isinstance(default, bool):
+            return v.lower() in ("1", "true", "yes", "y")
+        return type(default)(v)
+
+    def _compressor(self) -> typing.Optional[Callable[[Any], bytes]]:
+        compression = self._option("compress", "")
+        if not compression:
+            return None
+        level = self._option("compress_level", 0)
+        return compressor(compression, level or None)
+
+    def _journal(self, direction: str, local_path: Path) -> Journal:
+        mount = self.remote.mount
+        return Journal(
+            JOURNAL_DIR,
+            direction,
+            f"{mount.storage_account}/{mount.share}",
+            str(self.remote.remote_file),
+            str(local_path.absolute()),
+        )
+
+    def _upload_ranges(self, local_path: Path, sz: int):
+        """
+        Create remote file and upload it range by range. Completed ranges
+        of multi-range file are journaled, so when upload of the same,
+        unmodified, file is restarted, remote file is verified by size and
+        etag and only missing ranges are sent. Remote file keeps local
+        modification time, the same as files `sync` uploads.
+        """
+        tuner = self.tuner
+        if tuner is None:
+            workers = self._option("workers", DEFAULT_WORKERS)
+            buffers = self._option("buffers", workers * 2)
+            range_size = RANGE_SIZE
+        else:
+            # buffers are only held by active workers, and one being read
+            workers = tuner.max_workers
+            buffers = self._option("buffers", workers + 1)
+            range_size = tuner.range_size(sz)
+        sparse = self._option("sparse", False)
+        if sparse:
+            # freshly created remote file reads as zeros, so holes and
+            # zero ranges don't need to be sent
+            with local_path.open("rb") as extents_fp:
+                ranges = split_extents(data_extents(extents_fp, sz), range_size)
+        else:
+            ranges = split_buffer(sz, range_size)
+        journal = self._journal("upload", local_path)
+        mtime = mtime_of(local_path)
+        header = {
+            "size": sz,
+            "mtime": local_path.stat().st_mtime_ns,
+            "range_size": range_size,
+            "sparse": sparse,
+        }
+        saved, done = journal.load() if len(ranges) > 1 else (None, {})
+        if saved == header and done:
+            e = self.api.get_file_properties(self.remote, self.remote.remote_file)
+            if e is None or e.size != sz or e.etag not in done.values():
+                done = {}
+        else:
+            done = {}
+        if done:
+            self._print(
+                f"Resuming {self.remote}: {len(done)} of {len(ranges)} ranges done"
+            )
+        else:
+            self.api.clear_file(self.remote, sz, mtime)
+        if len(ranges) > 1:
+            journal.start(header, resume=bool(done))
 
-        # ensure dirs
-        dir = self.remote.remote_file.parent
+        md5 = self._option("md5", False)
+        whole = hashlib.md5() if md5 else None
+
+        def upload_range(start: int, data: memoryview):
+            content_md5 = b64_md5(data) if md5 else None
+            etag = with_retries(
+                self.api.upload_range, self.remote, start, data, content_md5
+            )
+            if len(ranges) > 1:
+                journal.add(start, start + len(data), etag)
+
+        pool = BufferPool(buffers, range_size)
+
+        def upload_buffer(start: int, data: memoryview, buf: bytearray):
+            started, size = time.perf_counter(), 0
+            try:
+                upload_range(start, data)
+                size = len(data)
+            finally:
+                pool.put(buf)
+                if tuner is not None:
+                    tuner.release(size, time.perf_counter() - started)
+
+        try:
+            with local_path.open("rb", buffering=0) as fp:
+                with BoundedExecutor(workers, buffers) as executor:
+                    pos = 0
+                    for start, end in ranges:
+                        if start in done and whole is None:
+                            continue
+                        buf = pool.get()
+                        fp.seek(start)
+                        data = read_into(fp, buf, end - start)
+                        if whole is not None:
+                            # hashed in the same pass, holes as zeros
+                            update_with_zeros(whole, start - pos)
+                            whole.update(data)
+                            pos = end
+                        if start in done or (sparse and is_zero(buf, end - start)):
+                            pool.put(buf)
+                            continue
+                        if tuner is not None:
+                            tuner.acquire()
+                        executor.submit(upload_buffer, start, data, buf)
+            content_md5 = None
+            if whole is not None:
+                update_with_zeros(whole, sz - pos)
+                content_md5 = base64.b64encode(whole.digest()).decode()
+            if sz:
+                self.api.set_last_write_time(self.remote, mtime, content_md5)
+            elif content_md5 is not None:
+                self.api.set_content_md5(self.remote, content_md5)
+        finally:
+            journal.close()
+        journal.finish()
+        if tuner is not None:
+            self._print(tuner.report())
+
+    def _upload_stream(self, stream: typing.BinaryIO, remote: Remote = None):
+        """
+        Upload stream of unknown length, such as stdin. Remote file is
+        created empty and extended ahead of ranges as they are read, then
+        truncated to exact length at the end. At most `buffers` ranges
+        are held in memory.
+        """
+        remote = self.remote if remote is None else remote
+        if remote.remote_file is None:
+            raise ValueError(f"Remote file name is required: {remote.mount}")
+        workers = self._option("workers", DEFAULT_WORKERS)
+        buffers = self._option("buffers", workers * 2)
+        sparse = self._option("sparse", False)
+        md5 = self._option("md5", False)
+        whole = hashlib.md5() if md5 else None
+        self._ensure_dir(remote.remote_file.parent)
+        self.api.clear_file(remote, 0)
+        pool = BufferPool(buffers, RANGE_SIZE)
+
+        def upload_buffer(
+            start: int, data: memoryview, buf: typing.Optional[bytearray]
+        ):
+            try:
+                content_md5 = b64_md5(data) if md5 else None
+                with_retries(self.api.upload_range, remote, start, data, content_md5)
+            finally:
+                if buf is not None:
+                    pool.put(buf)
+
+        def compress_buffer(data: memoryview, buf: bytearray) -> bytes:
+            try:
+                return compress(data)
+            finally:
+                pool.put(buf)
+
+        size = pos = 0
+
+        def send(data: memoryview, buf: typing.Optional[bytearray]):
+            """
+            Place data after everything sent before, extending remote file
+            if needed. Compressed chunk, not in pooled buffer, may be
+            bigger than range service accepts.
+            """
+            nonlocal size, pos
+            start, pos = pos, pos + len(data)
+            if whole is not None:
+                whole.update(data)
+            if pos > size:
+                size = max(pos, min(2 * size, size + MAX_GROWTH))
+                with_retries(self.api.set_file_size, remote, size)
+            if buf is not None and sparse and is_zero(buf, len(data)):
+                pool.put(buf)
+                return
+            for s, e in split_buffer(len(data), RANGE_SIZE):
+                executor.submit(upload_buffer, start + s, data[s:e], buf)
+
+        compress = self._compressor()
+        from concurrent.futures import ThreadPoolExecutor
+
+        ahead: typing.Deque["Future"] = collections.deque()
+        with BoundedExecutor(workers, buffers) as executor:
+            with ThreadPoolExecutor(max_workers=workers) as compressors:
+                while True:
+                    buf = pool.get()
+                    data = read_upto(stream, buf, RANGE_SIZE)
+                    if not len(data):
+                        pool.put(buf)
+                        break
+                    if compress is None:
+                        send(data, buf)
+                        continue
+                    # compressed in parallel, but placed in order
+                    ahead.append(compressors.submit(compress_buffer, data, buf))
+                    if len(ahead) >= workers:
+                        send(memoryview(ahead.popleft().result()), None)
+                while ahead:
+                    send(memoryview(ahead.popleft().result()), None)
+        if size != pos:
+            self.api.set_file_size(remote, pos)
+        if whole is not None:
+            self.api.set_content_md5(remote, base64.b64encode(whole.digest()).decode())
+
+    def _ensure_dir(self, dir: PosixPath, remote: Remote = None):
         assert dir.is_absolute(), dir
-        dirs_to_create = []
+        remote = self.remote if remote is None else remote
+        dirs_to_create: List[PosixPath] = []
         while True:
             if len(dir.parts) <= 1:
                 break
-            if self.api.directory_exists(self.remote, dir):
+            if self.api.directory_exists(remote, dir):
                 break
             dirs_to_create.insert(0, dir)
             dir = dir.parent
         for dir in dirs_to_create:
-            self.api.create_directory(self.remote, dir)
+            # may have been created meanwhile by concurrent upload
+            self.api.create_directory(remote, dir, exist_ok=True)
 
+    def _upload_file(
+        self, remote: Remote, local_path: Path, budget: ByteBudget, pool: BufferPool
+    ):
+        """
+        Upload whole file from single worker, range by range, holding each
+        range in `budget` while it is in memory. Remote file keeps local
+        modification time, so `sync` can tell it is unchanged later.
+        """
         sz = local_path.stat().st_size
-        self.api.clear_file(self.remote, sz)
-        ranges = split_buffer(sz, 4000000)
-        for start, end in ranges:
-            self.api.upload_file_range(self.remote, local_path, start, end)
+        mtime = mtime_of(local_path)
+        self.api.clear_file(remote, sz, mtime)
+        md5 = self._option("md5", False)
+        whole = hashlib.md5() if md5 else None
+        with local_path.open("rb", buffering=0) as fp:
+            for start, end in split_buffer(sz, RANGE_SIZE):
+                budget.acquire(end - start)
+                buf = pool.get()
+                try:
+                    data = read_into(fp, buf, end - start)
+                    content_md5 = None
+                    if whole is not None:
+                        whole.update(data)
+                        content_md5 = b64_md5(data)
+                    with_retries(
+                        self.api.upload_range, remote, start, data, content_md5
+                    )
+                finally:
+                    pool.put(buf)
+                    budget.release(end - start)
+        content_md5 = None
+        if whole is not None:
+            content_md5 = base64.b64encode(whole.digest()).decode()
+        if sz:
+            self.api.set_last_write_time(remote, mtime, content_md5)
+        elif content_md5 is not None:
+            self.api.set_content_md5(remote, content_md5)
+
+    def _walk_remote(self, path: PosixPath) -> Iterator[DirEntry]:
+        workers = self._option("workers", DEFAULT_WORKERS)
+        return walk_remote(self.api, self.remote, path, workers)
+
+    def _create_dirs(self, dirs: List[PosixPath], remote: Remote = None):
+        """
+        Create remote directories one depth level at a time, so parent
+        always exists before its children.
+        """
+        remote = self.remote if remote is None else remote
+        workers = self._option("workers", DEFAULT_WORKERS)
+        levels: Dict[int, List[PosixPath]] = {}
+        for d in dirs:
+            levels.setdefault(len(d.parts), []).append(d)
+        for depth in sorted(levels):
+            with BoundedExecutor(workers, workers * 2) as executor:
+                for d in levels[depth]:
+                    executor.submit(
+                        with_retries, self.api.create_directory, remote, d, True
+                    )
+
+    def _upload_files(self, files: List[Tuple[Path, PosixPath]]):
+        tuner = self.tuner
+        workers = self._option("workers", DEFAULT_WORKERS)
+        if tuner is not None:
+            workers = tuner.max_workers
+        budget = ByteBudget(self._option("max_inflight", workers * 2 * RANGE_SIZE))
+        pool = BufferPool(workers, RANGE_SIZE)
+
+        def upload_file(remote: Remote, local_path: Path):
+            started, size = time.perf_counter(), 0
+            try:
+                self._upload_file(remote, local_path, budget, pool)
+                size = local_path.stat().st_size
+            finally:
+                if tuner is not None:
+                    tuner.release(size, time.perf_counter() - started)
+
+        with BoundedExecutor(workers, workers * 2) as executor:
+            for local_path, remote_file in files:
+                if tuner is not None:
+                    tuner.acquire()
+                executor.submit(upload_file, self.remote.child(remote_file), local_path)
+        if tuner is not None:
+            self._print(tuner.report())
+
+    def _upload_tree(self, local_root: Path):
+        dirs, files = walk_local(local_root, self.remote.remote_file)
+        self._ensure_dir(self.remote.remote_file)
+        self._create_dirs(dirs)
+        self._upload_files(files)
+
+    def _pack(self, local_path: Path):
+        """
+        Stream tree of small files into single tar archive, so it costs
+        few big range uploads instead of requests per file and directory.
+        Sidecar `<archive>.index.json` keeps offset and size of every
+        member, so any of them can be fetched alone by ranged GET.
+        """
+        if not local_path.is_dir():
+            raise ValueError(f"Only directory can be packed: {local_path}")
+        if self._option("compress", ""):
+            raise ValueError("Pack cannot be compressed, members are read by offset")
+        if self.remote.remote_file is None:
+            name = f"{local_path.absolute().name}.tar"
+            # bare mount `m:` has relative `.` as its path
+            parts = self.remote.remote_path.parts
+            self.remote.remote_file = PosixPath("/", *parts, name)
+        index: Dict[str, list] = {"dirs": [], "members": []}
+        self._upload_stream(
+            typing.cast(typing.BinaryIO, IterReader(tar_stream(local_path, index)))
+        )
+        data = json.dumps(index).encode()
+        self._upload_stream(io.BytesIO(data), self._index_remote())
+        size = sum(m["size"] for m in index["members"])
+        self._print(
+            f"packed: {len(index['members'])} files, {size} bytes into {self.remote!s}"
+        )
+
+    def _index_remote(self) -> Remote:
+        archive = self.remote.remote_file
+        return self.remote.child(archive.with_name(f"{archive.name}.index.json"))
+
+    def _unpack(self, local_str: str):
+        """
+        Extract whole pack into `local_str` directory while it streams
+        down, or with `--member` fetch only that member's bytes.
+        """
+        if self.remote.remote_file is None:
+            raise ValueError(f"Remote file name is required: {self.remote.mount}")
+        buf = io.BytesIO()
+        self._download_stream(buf, self._index_remote())
+        index = json.loads(buf.getvalue())
+        local_path = Path(local_str)
+        name = self._option("member", "")
+        if not name:
+            local_path.mkdir(parents=True, exist_ok=True)
+            extractor = PackExtractor(index, local_path)
+            self._download_stream(typing.cast(typing.BinaryIO, extractor))
+            extractor.close()
+            return
+        m = next((m for m in index["members"] if m["name"] == name), None)
+        if m is None:
+            raise ValueError(f"No member {name} in {self.remote!s}")
+        if local_path.is_dir():
+            local_path = local_path / PosixPath(name).name
+        with local_path.open("wb") as fp:
+            self._download_stream(fp, start=m["offset"], end=m["offset"] + m["size"])
+        os.utime(local_path, (m["mtime"], m["mtime"]))
+
+    def upload(self, local_str):
+        if local_str == "-":
+            self._upload_stream(sys.stdin.buffer)
+            return
+        local_path = Path(local_str)
+        if self._option("pack", False):
+            self._pack(local_path)
+            return
+        if self._option("compress", ""):
+            if local_path.is_dir():
+                raise ValueError("Only single file or stdin can be compressed")
+            self.remote.set_remote_file(local_path)
+            with local_path.open("rb", buffering=0) as fp:
+                self._upload_stream(fp)
+            return
+        self.remote.set_remote_file(local_path)
+        if local_path.is_dir():
+            self._upload_tree(local_path)
+            return
+
+        self._ensure_dir(self.remote.remote_file.parent)
+        self._upload_ranges(local_path, local_path.stat().st_size)
+
+    def _download_ranges(self, local_path: Path, e: DirEntry):
+        """
+        Download segments into preallocated file, journaling completed
+        ones. Restarted download of the same, unmodified, remote file only
+        fetches segments that are missing.
+        """
+        sz = e.size
+        tuner = self.tuner
+        workers = self._option("workers", DEFAULT_WORKERS)
+        segments = self._option("segments", 0)
+        segment_size = -(-sz // segments) if segments > 0 else RANGE_SIZE
+        if tuner is not None:
+            workers = tuner.max_workers
+            if segments <= 0:
+                segment_size = tuner.range_size(sz)
+        md5 = self._option("md5", False)
+        if md5:
+            # service computes MD5 only for ranges up to 4MiB
+            segment_size = min(segment_size, RANGE_SIZE)
+        sparse = self._option("sparse", False)
+        if sparse:
+            # holes are left in truncated local file and read as zeros
+            extents = self.api.list_ranges(self.remote)
+            ranges = split_extents(extents, segment_size)
+        else:
+            ranges = split_buffer(sz, segment_size)
+        journal = self._journal("download", local_path)
+        header = {
+            "size": sz,
+            "etag": e.etag,
+            "range_size": segment_size,
+            "sparse": sparse,
+        }
+        saved, done = journal.load()
+        if not (saved == header and local_path.is_file()):
+            done = {}
+        if local_path.is_file() and local_path.stat().st_size != sz:
+            done = {}
+        if done:
+            self._print(f"Resuming {local_path}: {len(done)} segments done")
+        else:
+            with local_path.open("wb") as f:
+                f.truncate(sz)
+        journal.start(header, resume=bool(done))
+        hasher = OrderedHasher(local_path, sz, ranges) if md5 else None
+        if hasher is not None:
+            for start in done:
+                hasher.done(start)
+
+        def download_range(start: int, end: int):
+            started, size = time.perf_counter(), 0
+            try:
+                with_retries(
+                    self.api.download_file_range,
+                    self.remote,
+                    local_path,
+                    start,
+                    end,
+                    md5,
+                )
+                size = end - start
+            finally:
+                if tuner is not None:
+                    tuner.release(size, time.perf_counter() - started)
+            journal.add(start, end)
+            if hasher is not None:
+                hasher.done(start)
+
+        try:
+            with BoundedExecutor(workers) as executor:
+                for start, end in ranges:
+                    if start not in done:
+                        if tuner is not None:
+                            tuner.acquire()
+                        executor.submit(download_range, start, end)
+        finally:
+            journal.close()
+        if hasher is not None:
+            check_md5(
+                str(self.remote), self.api.get_content_md5(self.remote), hasher.md5
+            )
+        journal.finish()
+        if tuner is not None:
+            self._print(tuner.report())
+
+    def _download_stream(
+        self,
+        stream: typing.BinaryIO,
+        remote: Remote = None,
+        start: int = 0,
+        end: int = None,
+    ):
+        """
+        Write remote file, or its `[start:end]` window, to stream, such as
+        stdout. Up to `workers` ranges are fetched ahead concurrently and
+        written in order as they arrive, so at most that many ranges are
+        held in memory.
+        """
+        remote = self.remote if remote is None else remote
+        md5 = self._option("md5", False)
+        # stored MD5 is of whole file, as it was uploaded
+        whole = None
+        if end is None:
+            e = self.api.get_file_properties(remote, remote.remote_file)
+            if e is None:
+                raise ValueError(f"File doesn't exist: {remote!s}")
+            end = e.size
+            whole = hashlib.md5() if md5 else None
+        workers = self._option("workers", DEFAULT_WORKERS)
+        compression = self._option("compress", "")
+        decompressor = Decompressor(compression) if compression else None
+
+        def write(data: bytes):
+            if whole is not None:
+                whole.update(data)
+            if decompressor is not None:
+                # while next ranges are still being fetched
+                data = decompressor.decompress(data)
+            stream.write(data)
+
+        from concurrent.futures import ThreadPoolExecutor
+
+        ahead: typing.Deque["Future"] = collections.deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for lo, hi in split_buffer(end - start, RANGE_SIZE):
+                    if len(ahead) >= workers:
+                        write(ahead.popleft().result())
+                    ahead.append(
+                        executor.submit(
+                            with_retries,
+                            self.api.read_range,
+                            remote,
+                            start + lo,
+                            start + hi,
+                            md5,
+                        )
+                    )
+                while ahead:
+                    write(ahead.popleft().result())
+            finally:
+                for future in ahead:
+                    future.cancel()
+        if whole is not None:
+            check_md5(str(remote), self.api.get_content_md5(remote), whole)
+        if decompressor is not None:
+            decompressor.close()
+        stream.flush()
 
     def download(self, local_path):
-        self.api.download_file(self.remote, self.remote.get_local_file(local_path))
+        if local_path == "-":
+            self._download_stream(sys.stdout.buffer)
+            return
+        if self._option("pack", False) or self._option("member", ""):
+            self._unpack(local_path)
+            return
+        if self._option("compress", ""):
+            with self.remote.get_local_file(local_path).open("wb") as fp:
+                self._download_stream(fp)
+            return
+        local_file = self.remote.get_local_file(local_path)
+        e = self.api.get_file_properties(self.remote, self.remote.remote_file)
+        if e is None:
+            raise ValueError(f"File doesn't exist: {self.remote!s}")
+        ranged = self._option("segments", 0) > 1 or self._option("sparse", False)
+        if self.tuner is not None:
+            ranged = ranged or self.tuner.range_size(e.size) < e.size
+        if e.size > RANGE_SIZE or ranged:
+            self._download_ranges(local_file, e)
+        else:
+            self.api.download_file(self.remote, local_file, self._option("md5", False))
+
+    def _download_file(self, remote: Remote, local_path: Path, e: DirEntry):
+        """
+        Download whole file from single worker and stamp it with remote
+        modification time, so `sync` can tell it is unchanged later.
+        """
+        self.api.download_file(remote, local_path, self._option("md5", False))
+        if e.last_write_time is not None:
+            t = e.last_write_time.timestamp()
+            os.utime(local_path, (t, t))
+
+    def sync(self, local_str, direction="up"):
+        """
+        Transfer only new or changed files between local and remote trees.
+        `direction` is `up` (local to remote) or `down` (remote to local).
+        """
+        if direction not in ("up", "down"):
+            raise ValueError(f"direction has to be `up` or `down`: {direction}")
+        local_root = Path(local_str)
+        if local_root.exists() and not local_root.is_dir():
+            raise ValueError(f"Only directory can be synced: {local_root}")
+        self.remote.set_remote_file(local_root)
+        root = self.remote.remote_file
+        dry_run = self._option("dry_run", False)
+
+        remote_entries: Dict[PosixPath, DirEntry] = {}
+        if self.api.get_dir_properties(self.remote, root) is not None:
+            remote_entries = {e.path: e for e in self._walk_remote(root)}
+
+        counts = {"transferred": [0, 0], "skipped": [0, 0]}
+
+        def count(changed: bool, size: int):
+            c = counts["transferred" if changed else "skipped"]
+            c[0] += 1
+            c[1] += size
+
+        if direction == "up":
+            dirs, files = walk_local(local_root, root)
+            new_dirs = [d for d in dirs if d not in remote_entries]
+            to_upload = []
+            for local_path, remote_file in files:
+                sz = local_path.stat().st_size
+                changed = is_changed(
+                    sz, mtime_of(local_path), remote_entries.get(remote_file)
+                )
+                count(changed, sz)
+                if changed:
+                    to_upload.append((local_path, remote_file))
+                    if dry_run:
+                        self._print(
+                            f"upload {local_path} -> {self.remote.mount}{remote_file}"
+                        )
+            if not dry_run:
+                self._ensure_dir(root)
+                self._create_dirs(new_dirs)
+                self._upload_files(to_upload)
+        else:
+            workers = self._option("workers", DEFAULT_WORKERS)
+            to_download = []
+            for e in sorted(remote_entries.values(), key=lambda e: e.path):
+                local_path = Path(local_root, *e.path.relative_to(root).parts)
+                if e.type == "Directory":
+                    if not dry_run:
+                        local_path.mkdir(parents=True, exist_ok=True)
+                    continue
+                local = local_path.stat() if local_path.is_file() else None
+                changed = local is None or is_changed(
+                    local.st_size, mtime_of(local_path), e
+                )
+                count(changed, e.size)
+                if changed:
+                    to_download.append((local_path, e))
+                    if dry_run:
+                        self._print(
+                            f"download {self.remote.mount}{e.path} -> {local_path}"
+                        )
+            if not dry_run:
+                local_root.mkdir(parents=True, exist_ok=True)
+                with BoundedExecutor(workers, workers * 2) as executor:
+                    for local_path, e in to_download:
+                        executor.submit(
+                            with_retries,
+                            self._download_file,
+                            self.remote.child(e.path),
+                            local_path,
+                            e,
+                        )
+        (n, sz), (skipped_n, skipped_sz) = counts["transferred"], counts["skipped"]
+        self._print(
+            f"{'would transfer' if dry_run else 'transferred'}: {n} files, {sz} bytes; "
+            f"skipped: {skipped_n} files, {skipped_sz} bytes"
+        )
 
     def list(self):
         self.remote.set_remote_file(Path())
-        content = self.api.list_dir(self.remote, self.remote.remote_path)
-        print(str(self.remote.mount) + str(content.path))
-        print(",".join(_DIR_ENTRY_HEADER))
-        for e in content.entries.values():
-            print(str(e))
+        path = self.remote.remote_path
+        self._print(str(self.remote.mount) + str(path))
+        self._print(",".join(_DIR_ENTRY_HEADER))
+        for e in self.api.list_dir(self.remote, path, self._option("maxresults", 0)):
+            self._print(str(e))
+
+    def find(self):
+        """
+        Recursive listing of remote directory, narrowed by `find:` options
+        """
+        self.remote.set_remote_file(Path())
+        path = self.remote.remote_path
+        limits: Dict[str, Any] = {
+            k: parse_time(self.options[k]) if k in ("newer", "older") else int(v)
+            for k, v in self.options.items()
+            if k in ("newer", "older", "min_size", "max_size", "maxdepth")
+        }
+        f = FindFilter(
+            name=self.options.get("name"),
+            type=self.options.get("type"),
+            prune=self.options.get("prune"),
+            **limits,
+        )
+        workers = self._option("workers", DEFAULT_WORKERS)
+        self._print(str(self.remote.mount) + str(path))
+        self._print(",".join(["path", *_DIR_ENTRY_HEADER[1:]]))
+        for e in walk_remote(self.api, self.remote, path, workers, f.descend):
+            if f.match(e):
+                self._print(e.row(str(e.path)))
+
+    def _copy_file(self, dst: Remote, src: Remote, e: DirEntry, workers: int = 1):
+        """
+        Within storage account file is copied by Copy File, which is
+        polled until service finishes it. Across accounts, ranges are
+        copied by Put Range From URL, `workers` at a time, so progress
+        doesn't depend on service scheduling asynchronous copy.
+        """
+        if src.mount.storage_account == dst.mount.storage_account:
+            status = with_retries(self.api.copy_file, dst, src)
+            description = ""
+            while status == "pending":
+                time.sleep(COPY_POLL_INTERVAL)
+                status, description = self.api.get_copy_status(dst)
+            if status != "success":
+                raise ValueError(f"Copy {src!s} -> {dst!s} {status}: {description}")
+            return
+        self.api.clear_file(dst, e.size, e.last_write_time)
+        with BoundedExecutor(workers, workers) as executor:
+            for start, end in split_buffer(e.size, RANGE_SIZE):
+                executor.submit(with_retries, self.api.copy_range, dst, src, start, end)
+        if e.size and e.last_write_time is not None:
+            self.api.set_last_write_time(dst, e.last_write_time)
+
+    def _copy_tree(self, root: PosixPath, dst: Remote, dst_root: PosixPath):
+        workers = self._option("workers", DEFAULT_WORKERS)
+        dirs: List[DirEntry] = []
+        files: List[DirEntry] = []
+        for e in walk_remote(self.api, self.remote, root, workers):
+            (dirs if e.type == "Directory" else files).append(e)
+        self._ensure_dir(dst_root, dst)
+        self._create_dirs([dst_root / d.path.relative_to(root) for d in dirs], dst)
+        with BoundedExecutor(workers, workers * 2) as executor:
+            for e in files:
+                executor.submit(
+                    self._copy_file,
+                    dst.child(dst_root / e.path.relative_to(root)),
+                    self.remote.child(e.path),
+                    e,
+                )
+        self._print(
+            f"copied: {len(files)} files, {sum(e.size or 0 for e in files)} bytes, "
+            f"{len(dirs)} directories"
+        )
+
+    def copy(self, dest_str):
+        """
+        Server side copy of file or directory tree to `dest_str`, which
+        may be on other mount. Data doesn't pass through this machine.
+        """
+        e = self._get_direntry()
+        if e is None:
+            raise ValueError(f"Path doesn't exist: {self.remote.remote_file}")
+        dst = Remote(dest_str, self.remote.mount.config, self.remote.ask)
+        self.api.limits.register(dst.mount)
+        # bare mount `m:` has relative `.` as its path and means share root
+        root = PosixPath("/", *dst.remote_path.parts)
+        into = dst.is_dir or not dst.remote_path.parts
+        dst_path = root / e.name if into else root
+        if e.type == "Directory":
+            same_share = self.remote.mount.to_dict() == dst.mount.to_dict()
+            if same_share and (dst_path == e.path or e.path in dst_path.parents):
+                raise ValueError(f"Can't copy {e.path} into itself: {dst_path}")
+            self._copy_tree(e.path, dst, dst_path)
+        else:
+            self._ensure_dir(dst_path.parent, dst)
+            workers = self._option("workers", DEFAULT_WORKERS)
+            self._copy_file(dst.child(dst_path), self.remote.child(e.path), e, workers)
+        return e
+
+    def move(self, dest_str):
+        """
+        `copy` followed by delete of source
+        """
+        e = self.copy(dest_str)
+        if e.type == "Directory":
+            self._delete_dir_recursively(e.path)
+        else:
+            self.api.delete_file(self.remote, e.path)
 
     def props(self):
-        print(str(self._get_direntry()))
+        self._print(str(self._get_direntry()))
 
     def _get_direntry(self):
         self.remote.set_remote_file(Path())
@@ -500,18 +3676,13 @@ class Actions:
 
     def _delete_dir_recursively(self, path: PosixPath):
         assert path.is_absolute(), path
-        dir_content = self.api.list_dir(self.remote, path)
-        for e in dir_content.entries.values():
-            if e.type == "Directory":
-                self._delete_dir_recursively(e.path)
-            else:
-                self.api.delete_file(self.remote, e.path)
-        self.api.delete_directory(self.remote, path)
+        workers = self._option("workers", DEFAULT_WORKERS)
+        TreeDeleter(self.api, self.remote, workers).run(path)
 
     def delete(self):
         e = self._get_direntry()
         if e is None:
-            print(f"Path doesn't exist: {self.remote.remote_file}")
+            self._print(f"Path doesn't exist: {self.remote.remote_file}")
         else:
             if e.type == "Directory":
                 if self.remote.proceed(f"Delete directory recursively!!!:{e.path}?"):
@@ -520,7 +3691,7 @@ class Actions:
                 if self.remote.proceed(f"Delete file:{e.path}?"):
                     self.api.delete_file(self.remote, self.remote.remote_file)
 
-    def add_mount(self, storage_account, share, sas_token):
+    def add_mount(self, storage_account, share, sas_token, endpoint=""):
         mount = self.remote.mount
         if any(mount.to_dict().values()):
             if not self.remote.proceed(f"Override mount:{self.remote.mount}?"):
@@ -528,6 +3699,9 @@ class Actions:
         mount.storage_account = storage_account
         mount.share = share
         mount.sas_token = clean_sas_token(sas_token)
+        mount.endpoint = endpoint
+        mount.max_bytes_per_sec = self._option("max_bytes_per_sec", 0)
+        mount.max_requests_per_sec = self._option("max_requests_per_sec", 0)
         mount.save()
 
     def delete_mount(self):
@@ -535,6 +3709,150 @@ class Actions:
             self.remote.mount.delete()
 
 
+_BATCH_ACTIONS = (
+    "upload",
+    "download",
+    "sync",
+    "copy",
+    "move",
+    "list",
+    "find",
+    "props",
+    "delete",
+)
+
+# shared by all commands of batch, so they can only be given to batch itself
+_BATCH_OPTIONS = (
+    "jobs",
+    "pool_size",
+    "cache",
+    "cache_ttl",
+    "stats",
+    "max_bytes_per_sec",
+    "max_requests_per_sec",
+)
+
+
+def parse_command(line: str) -> List[str]:
+    """
+    Arguments of batch manifest line, which is JSON list of arguments,
+    JSON object with `remote`, `action`, `args` and `options`, or CSV row
+
+    >>> parse_command('["m:/a.txt", "upload", "a.txt", "--md5"]')
+    ['m:/a.txt', 'upload', 'a.txt', '--md5']
+    >>> parse_command('{"remote": "m:/d/", "action": "list", "options": {"maxresults": 9}}')
+    ['m:/d/', 'list', '--maxresults=9']
+    >>> parse_command('m:/a b.txt,download,"x,y.txt"')
+    ['m:/a b.txt', 'download', 'x,y.txt']
+    """
+    line = line.strip()
+    if line.startswith("["):
+        return [str(v) for v in json.loads(line)]
+    if line.startswith("{"):
+        cmd = json.loads(line)
+        return [
+            cmd["remote"],
+            cmd["action"],
+            *(str(v) for v in cmd.get("args", [])),
+            *(f"--{k}={v}" for k, v in cmd.get("options", {}).items()),
+        ]
+    import csv
+
+    return next(csv.reader([line]))
+
+
+class Batch:
+    """
+    Run commands of manifest in one process, up to `jobs` of them at a
+    time, all sharing connection pool and metadata cache. Options given
+    to batch apply to every command, command may add its own. Nothing is
+    asked before delete. Result of every command is written to `out` as
+    JSON line as soon as it completes:
+
+        {"line": 3, "command": ["m:/a.txt", "props"], "ok": true,
+         "seconds": 0.042, "output": ["a.txt,File,5,..."]}
+    """
+
+    def __init__(
+        self,
+        api: Type[ApiCall],
+        config: Config,
+        options: Dict[str, str],
+        out: typing.TextIO = None,
+    ):
+        self.api = api
+        self.config = config
+        self.options = dict(options)
+        self.jobs = int(self.options.pop("jobs", DEFAULT_JOBS))
+        self.out = sys.stdout if out is None else out
+        self.lock = threading.Lock()
+        self.counts = {"ok": 0, "failed": 0}
+
+    def run(self, lines: Iterable[str]) -> Dict[str, int]:
+        """
+        Actions are constructed here, one by one, so shared pool and
+        cache are configured once before commands run concurrently.
+        """
+        with BoundedExecutor(self.jobs, self.jobs * 2) as executor:
+            for n, line in enumerate(lines, 1):
+                if not line.strip() or line.lstrip().startswith("#"):
+                    continue
+                command: List[str] = []
+                try:
+                    command = parse_command(line)
+                    args, options = parse_options(command)
+                    shared = [k for k in options if k in _BATCH_OPTIONS]
+                    if shared:
+                        raise ValueError(f"Options only batch can have: {shared}")
+                    if len(args) < 2 or args[1] not in _BATCH_ACTIONS:
+                        raise ValueError(f"Not a batch action: {args[1:2]}")
+                    output = io.StringIO()
+                    cli = Actions(
+                        Remote(args[0], self.config, False),
+                        self.api,
+                        {**self.options, **options},
+                        output,
+                    )
+                except Exception as e:
+                    self._report(n, command, "", 0.0, e)
+                    continue
+                executor.submit(self._execute, n, command, cli, args, output)
+        return self.counts
+
+    def _execute(
+        self, n: int, command: List[str], cli: "Actions", args: List[str], output
+    ):
+        start = time.perf_counter()
+        error = None
+        try:
+            getattr(cli, args[1])(*args[2:])
+        except Exception as e:
+            error = e
+        self._report(n, command, output.getvalue(), time.perf_counter() - start, error)
+
+    def _report(
+        self,
+        n: int,
+        command: List[str],
+        output: str,
+        seconds: float,
+        error: BaseException = None,
+    ):
+        result: Dict[str, Any] = {
+            "line": n,
+            "command": command,
+            "ok": error is None,
+            "seconds": round(seconds, 6),
+            "output": output.splitlines(),
+        }
+        if error is not None:
+            result["error"] = f"{type(error).__name__}: {error}"
+        with self.lock:
+            self.counts["ok" if error is None else "failed"] += 1
+            self.out.write(json.dumps(result) + "\n")
+            self.out.flush()
+
+
 def check_the_force(args) -> Tuple[List[str], bool]:
     """
     Check if user wants to force destructive operations without asking
@@ -545,21 +3863,48 @@ def check_the_force(args) -> Tuple[List[str], bool]:
 
 
 # noinspection PyDefaultArgument
-def main(args=sys.argv[1:], api: Type[ApiCall] = ApiCall, config=_CONFIG):
+def main(args=sys.argv[1:], api: Type[ApiCall] = ApiCall, config: Config = None):
+    if config is None:
+        config = Config(CONFIG_PATH)
     show_help = False
+    observer = api.observer
+    if any(a.partition("=")[0] == "--stats" for a in args):
+        api.observer = CallStats()
     if len(args) == 0:
         print("azfiles - interact with Azure file shares\n")
         print(f"Available mounts: \n   {list(config.data.keys())}")
         show_help = True
+    elif args[0] == "batch":
+        args, options = parse_options(args)
+        batch = Batch(api, config, options)
+        if len(args) < 2 or args[1] == "-":
+            counts = batch.run(sys.stdin)
+        else:
+            with open(args[1], "rt") as lines:
+                counts = batch.run(lines)
+        print(f"batch: {counts['ok']} ok, {counts['failed']} failed", file=sys.stderr)
     else:
         try:
             args, ask = check_the_force(args)
-            cli = Actions(Remote(args[0], config, ask), api)
+            args, options = parse_options(args)
+            cli = Actions(Remote(args[0], config, ask), api, options)
             getattr(cli, args[1])(*args[2:])
         except:
+            import traceback
+
             traceback.print_exc()
             show_help = True
+    if isinstance(api.observer, CallStats) and api.observer is not observer:
+        print("\n".join(api.observer.summary()), file=sys.stderr)
+        connections = api.sessions.stats()
+        print(
+            f"connections: {connections['opened']} opened, "
+            f"reused by {connections['reused']} requests",
+            file=sys.stderr,
+        )
+        api.observer = observer
     if show_help:
+        import inspect
 
         print("\nUSAGES:")
         actions = [f for f in dir(Actions) if not f.startswith("_")]
@@ -574,4 +3919,8 @@ def main(args=sys.argv[1:], api: Type[ApiCall] = ApiCall, config=_CONFIG):
                 f"[{n}]" if n in optonals else f"<{n}>" for n in names[1:]
             )
             print(f" azfiles <remote_path> {a} {a_args}")
+        print(" azfiles batch [manifest]")
+        print("\nOPTIONS:")
+        for k, v in _OPTIONS.items():
+            print(f" --{k}: {v}")
         print()
@@ -0,0 +1,728 @@
+"""
+Asyncio flavor of `ApiCall` and of core `Actions` operations, for
+applications that already run an event loop. Results are the same
+`DirEntry` and `DirContent` objects synchronous API produces. Needs
+aiohttp:
+
+    pip install azfiles[aio]
+
+    async with AsyncActions(Remote("share:/data/", Config(CONFIG_PATH), False)) as a:
+        await a.upload("big.bin")
+        content = await a.list()
+
+Metadata cache is not consulted by this layer.
+"""
+import asyncio
+import base64
+import hashlib
+import time
+import typing
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from pathlib import Path, PosixPath
+from typing import (
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
+from urllib.parse import quote
+
+import aiohttp
+from azfiles import (
+    API_VERSION,
+    CHUNK_SIZE,
+    DEFAULT_POOL_SIZE,
+    DEFAULT_WORKERS,
+    RANGE_SIZE,
+    RETRIES,
+    ApiCall,
+    CallRecord,
+    DirContent,
+    DirEntry,
+    ListingParser,
+    OrderedHasher,
+    Remote,
+    account_key,
+    b64_md5,
+    clean_header,
+    mtime_of,
+    operation_name,
+    range_length,
+    should_retry,
+    split_buffer,
+    to_azure_time,
+    walk_local,
+)
+
+
+def run(main: Awaitable):
+    """
+    Run `main` on new event loop and close it, like `asyncio.run` that
+    Python 3.6 doesn't have
+    """
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(main)
+    finally:
+        loop.close()
+
+
+async def with_retries(
+    fn: Callable[..., Awaitable], *args, attempts: int = RETRIES, backoff: float = 1.0
+):
+    """
+    Await `fn(*args)` up to `attempts` times, sleeping `backoff`, then
+    twice as long, and so on between failures. Last error is reraised.
+
+    >>> calls = []
+    >>> async def flaky(x):
+    ...     calls.append(x)
+    ...     if len(calls) < 2:
+    ...         raise ValueError("boom")
+    ...     return x * 2
+    >>> run(with_retries(flaky, 21, backoff=0))
+    42
+    """
+    for attempt in range(attempts):
+        try:
+            return await fn(*args)
+        except Exception:
+            if attempt + 1 >= attempts:
+                raise
+            await asyncio.sleep(backoff * (2 ** attempt))
+
+
+async def run_bounded(coros: Iterable[Awaitable], workers: int):
+    """
+    Await `coros` with at most `workers` of them running at a time. Next
+    one is taken from iterable only when slot frees up, so generator can
+    produce them lazily. First failure cancels the rest and is raised.
+
+    >>> order = []
+    >>> async def step(x):
+    ...     await asyncio.sleep(0.01 * (3 - x))
+    ...     order.append(x)
+    >>> run(run_bounded((step(x) for x in range(3)), 3))
+    >>> order
+    [2, 1, 0]
+    """
+    pending: typing.Set[asyncio.Future] = set()
+
+    async def wait(return_when):
+        nonlocal pending
+        done, pending = await asyncio.wait(pending, return_when=return_when)
+        for task in done:
+            task.result()
+
+    try:
+        for coro in coros:
+            pending.add(asyncio.ensure_future(coro))
+            if len(pending) >= workers:
+                await wait(asyncio.FIRST_COMPLETED)
+        while pending:
+            await wait(asyncio.FIRST_EXCEPTION)
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def retry_delay(response: aiohttp.ClientResponse, attempt: int) -> float:
+    retry_after = response.headers.get("Retry-After", "")
+    try:
+        return float(retry_after)
+    except ValueError:
+        return 0.5 * (2 ** attempt)
+
+
+class AsyncSessionPool:
+    """
+    Keep-alive `aiohttp.ClientSession`, one per storage account, each
+    holding up to `pool_size` open connections. Throttled (429/503) calls,
+    and failed (500) ones that are idempotent, are retried with
+    exponential backoff honoring `Retry-After`. Sessions are bound to
+    event loop that created them and have to be closed from it.
+    """
+
+    def __init__(self, pool_size: int = DEFAULT_POOL_SIZE, retries: int = RETRIES):
+        self.pool_size = pool_size
+        self.retries = retries
+        self.sessions: Dict[str, aiohttp.ClientSession] = {}
+
+    def session(self, url: str) -> aiohttp.ClientSession:
+        key = account_key(url)
+        session = self.sessions.get(key)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size)
+            session = aiohttp.ClientSession(connector=connector)
+            self.sessions[key] = session
+        return session
+
+    async def close(self):
+        sessions, self.sessions = self.sessions, {}
+        for session in sessions.values():
+            await session.close()
+
+
+class AsyncApiCall:
+    sessions: typing.ClassVar[AsyncSessionPool] = AsyncSessionPool()
+    # same as `ApiCall.observer`, called from event loop thread
+    observer: typing.ClassVar[Optional[Callable[[CallRecord], None]]] = None
+    # the same process wide limits synchronous calls wait for
+    limits = ApiCall.limits
+
+    @classmethod
+    async def clear_file(
+        cls, remote: Remote, size: int, last_write_time: datetime = None
+    ):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/create-file
+        """
+        call = await cls.request(
+            "PUT",
+            remote.url(),
+            headers={
+                "x-ms-content-length": str(size),
+                "x-ms-type": "file",
+                "x-ms-file-permission": "inherit",
+                "x-ms-file-attributes": "None",
+                "x-ms-file-creation-time": "now",
+                "x-ms-file-last-write-time": "now"
+                if last_write_time is None
+                else to_azure_time(last_write_time),
+            },
+        )
+        call.if_error(f"Can't clear_file:{remote!s} ")
+
+    @classmethod
+    async def upload_range(
+        cls,
+        remote: Remote,
+        start: int,
+        data: typing.Union[bytes, memoryview],
+        content_md5: str = None,
+    ):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/put-range
+        """
+        end = start + len(data)
+        headers = {
+            "x-ms-range": f"bytes={start}-{end-1}",
+            "x-ms-write": "update",
+        }
+        if content_md5 is not None:
+            headers["Content-MD5"] = content_md5
+        call = await cls.request(
+            "PUT", remote.url("comp=range"), data=data, headers=headers
+        )
+        call.if_error(f"Can't upload_range: {remote!s}[{start}:{end}] ")
+        return call.response.headers.get("ETag")
+
+    @classmethod
+    async def set_content_md5(cls, remote: Remote, content_md5: str):
+        await cls._set_properties(remote, {"x-ms-content-md5": content_md5})
+
+    @classmethod
+    async def set_last_write_time(
+        cls, remote: Remote, last_write_time: datetime, content_md5: str = None
+    ):
+        """
+        Put Range resets last write time to now, so it is set after data
+        """
+        headers = {"x-ms-file-last-write-time": to_azure_time(last_write_time)}
+        if content_md5 is not None:
+            headers["x-ms-content-md5"] = content_md5
+        await cls._set_properties(remote, headers)
+
+    @classmethod
+    async def _set_properties(cls, remote: Remote, headers: Dict[str, str]):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/set-file-properties
+        """
+        call = await cls.request(
+            "PUT",
+            remote.url("comp=properties"),
+            headers={
+                "x-ms-file-permission": "preserve",
+                "x-ms-file-attributes": "preserve",
+                "x-ms-file-creation-time": "preserve",
+                "x-ms-file-last-write-time": "preserve",
+                **headers,
+            },
+        )
+        call.if_error(f"Can't set properties {list(headers)}: {remote!s} ")
+
+    @classmethod
+    async def directory_exists(cls, remote: Remote, remote_dir: PosixPath) -> bool:
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-directory-properties
+        """
+        call = await cls.request(
+            "HEAD", remote.mount.url(remote_dir, "restype=directory")
+        )
+        if call.response.status == 404:
+            return False
+        call.if_error()
+        return True
+
+    @classmethod
+    async def get_dir_properties(
+        cls, remote: Remote, remote_path: PosixPath
+    ) -> Optional[DirEntry]:
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-directory-properties
+        """
+        return await cls._get_properties(remote, remote_path, "Directory")
+
+    @classmethod
+    async def get_file_properties(
+        cls, remote: Remote, remote_path: PosixPath
+    ) -> Optional[DirEntry]:
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file-properties
+        """
+        return await cls._get_properties(remote, remote_path, "File")
+
+    @classmethod
+    async def _get_properties(
+        cls, remote: Remote, remote_path: PosixPath, ftype: str
+    ) -> Optional[DirEntry]:
+        query = "restype=directory" if ftype == "Directory" else None
+        call = await cls.request("HEAD", remote.mount.url(remote_path, query))
+        if call.response.status == 200:
+            return call.headers_to_direntry(remote_path, ftype)
+        return None
+
+    @classmethod
+    async def create_directory(
+        cls, remote: Remote, remote_dir: PosixPath, exist_ok: bool = False
+    ):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/create-directory
+        """
+        call = await cls.request(
+            "PUT",
+            remote.mount.url(remote_dir, "restype=directory"),
+            headers={
+                "x-ms-file-permission": "inherit",
+                "x-ms-file-attributes": "Directory",
+                "x-ms-file-creation-time": "now",
+                "x-ms-file-last-write-time": "now",
+            },
+        )
+        if exist_ok and call.response.status == 409:
+            return
+        call.if_error(f"Can't create dir:{remote_dir!s} ")
+
+    @classmethod
+    async def download_file(cls, remote: Remote, local_path: Path, verify_md5=False):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file
+        """
+        call = await cls.request("GET", remote.url(), stream=True)
+        call.if_error(f"Can't download_file: {remote!s} ")
+        try:
+            digest = await call.write_to(local_path, "wb", 0, verify_md5)
+        finally:
+            call.response.release()
+        expected = call.response.headers.get("Content-MD5")
+        if digest is not None and expected and digest != expected:
+            raise ValueError(
+                f"MD5 mismatch: {remote!s} expected:{expected} actual:{digest}"
+            )
+
+    @classmethod
+    async def download_file_range(
+        cls, remote: Remote, local_path: Path, start: int, end: int, verify_md5=False
+    ):
+        """
+        Write `[start:end]` range of remote file into preallocated
+        `local_path` at the same offset.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/get-file
+        """
+        headers = {"x-ms-range": f"bytes={start}-{end-1}"}
+        if verify_md5:
+            headers["x-ms-range-get-content-md5"] = "true"
+        call = await cls.request("GET", remote.url(), headers=headers, stream=True)
+        call.if_error(f"Can't download_file_range: {remote!s}[{start}:{end}] ")
+        try:
+            digest = await call.write_to(local_path, "r+b", start, verify_md5, end)
+        finally:
+            call.response.release()
+        expected = call.response.headers.get("Content-MD5")
+        if digest is not None and digest != expected:
+            raise ValueError(
+                f"MD5 mismatch: {remote!s}[{start}:{end}] "
+                f"expected:{expected} actual:{digest}"
+            )
+
+    @classmethod
+    async def list_ranges(cls, remote: Remote) -> List[Tuple[int, int]]:
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/list-ranges
+        """
+        call = await cls.request("GET", remote.url("comp=rangelist"))
+        call.if_error(f"Can't list_ranges: {remote!s} ")
+        return [
+            (int(r.findtext("Start")), int(r.findtext("End")) + 1)
+            for r in ET.fromstring(call.body).iter("Range")
+        ]
+
+    @classmethod
+    async def delete_directory(cls, remote: Remote, remote_dir: PosixPath):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/delete-directory
+        """
+        call = await cls.request(
+            "DELETE", remote.mount.url(remote_dir, "restype=directory")
+        )
+        call.if_error()
+
+    @classmethod
+    async def delete_file(cls, remote: Remote, remote_path: PosixPath):
+        """
+        https://docs.microsoft.com/en-us/rest/api/storageservices/delete-file2
+        """
+        call = await cls.request("DELETE", remote.mount.url(remote_path))
+        call.if_error()
+
+    @classmethod
+    async def list_dir(
+        cls, remote: Remote, remote_dir: PosixPath, maxresults: int = None
+    ) -> AsyncIterator[DirEntry]:
+        """
+        Yields entries of `remote_dir` as they are parsed from response,
+        requesting next page until service stops returning `NextMarker`.
+
+        https://docs.microsoft.com/en-us/rest/api/storageservices/list-directories-and-files
+        """
+        query = "restype=directory&comp=list&include=ETag&include=Timestamps"
+        if maxresults:
+            query += f"&maxresults={maxresults}"
+        marker = ""
+        while True:
+            page_query = f"{query}&marker={quote(marker)}" if marker else query
+            url = remote.mount.url(remote_dir, page_query)
+            call = await cls.request("GET", url, stream=True)
+            call.if_error()
+            parser = ListingParser(remote_dir)
+            try:
+                async for chunk in call.response.content.iter_chunked(CHUNK_SIZE):
+                    for e in parser.feed(chunk):
+                        yield e
+            finally:
+                call.response.release()
+            marker = parser.marker
+            if not marker:
+                break
+
+    @classmethod
+    async def request(
+        cls,
+        method: str,
+        url: str,
+        data: typing.Union[bytes, memoryview] = None,
+        headers: Dict[str, str] = None,
+        stream=False,
+    ) -> "AsyncApiCall":
+        """
+        Send request, retrying throttled ones. Unless `stream` is requested,
+        response body is read into `body` and connection goes back to
+        pool right away. Streamed response has to be released by caller.
+        """
+        headers = {} if headers is None else dict(headers)
+        headers["x-ms-version"] = API_VERSION
+        session = cls.sessions.session(url)
+        if cls.limits.active:
+            size = 0 if data is None else len(data)
+            if method == "GET" and "x-ms-range" in headers:
+                size += range_length(headers["x-ms-range"])
+            await asyncio.sleep(cls.limits.reserve(url, 1, size))
+        observer = cls.observer
+        if observer is None:
+            return await cls._request(session, method, url, data, headers, stream)
+        start = time.perf_counter()
+        status = received = 0
+        attempts: List[int] = []
+        try:
+            call = await cls._request(
+                session, method, url, data, headers, stream, attempts
+            )
+            status = call.response.status
+            if method != "HEAD":
+                received = int(call.response.headers.get("Content-Length", 0))
+            return call
+        finally:
+            sent = 0 if data is None else len(data)
+            seconds = time.perf_counter() - start
+            operation = operation_name(method, url)
+            record = CallRecord(
+                operation, status, start, seconds, sent, received, len(attempts)
+            )
+            observer(record)
+
+    @classmethod
+    async def _request(
+        cls,
+        session: aiohttp.ClientSession,
+        method: str,
+        url: str,
+        data: Optional[typing.Union[bytes, memoryview]],
+        headers: Dict[str, str],
+        stream: bool,
+        retried: List[int] = None,
+    ) -> "AsyncApiCall":
+        retries = cls.sessions.retries
+        for attempt in range(retries + 1):
+            response = await session.request(method, url, data=data, headers=headers)
+            if not should_retry(method, response.status) or attempt == retries:
+                break
+            if retried is not None:
+                retried.append(response.status)
+            response.release()
+            await asyncio.sleep(retry_delay(response, attempt))
+        call = cls(response)
+        if not stream or response.status >= 400:
+            call.body = await response.read()
+        return call
+
+    def __init__(self, response: aiohttp.ClientResponse):
+        self.response = response
+        self.body = b""
+
+    async def write_to(
+        self, local_path: Path, mode: str, start: int, md5: bool, end: int = None
+    ) -> Optional[str]:
+        """
+        Stream response body into `local_path` at `start` offset, writing
+        from executor thread so event loop is never blocked on disk.
+        Returns base64 MD5 of body if `md5` is requested.
+        """
+        loop = asyncio.get_event_loop()
+        h = hashlib.md5() if md5 else None
+        with local_path.open(mode) as f:
+            f.seek(start)
+            async for chunk in self.response.content.iter_chunked(CHUNK_SIZE):
+                await loop.run_in_executor(None, f.write, chunk)
+                if h is not None:
+                    h.update(chunk)
+            if end is not None and f.tell() != end:
+                raise ValueError(
+                    f"Short read: [{start}:{end}] of {local_path} ended at {f.tell()}"
+                )
+        return None if h is None else base64.b64encode(h.digest()).decode()
+
+    def if_error(self, msg=""):
+        if self.response.status >= 400:
+            raise ValueError(msg + str(self))
+
+    def headers_to_direntry(self, path: PosixPath, ftype: str):
+        return DirEntry(
+            path.name,
+            ftype,
+            {clean_header(k): v for k, v in self.response.headers.items()},
+            path=path,
+        )
+
+    def __str__(self):
+        return f"status:{self.response.status}\n{self.body.decode(errors='replace')}"
+
+
+class AsyncActions:
+    """
+    `upload`, `download`, `list`, `props` and `delete` of `Actions`,
+    returning results instead of printing them. All service calls share
+    `workers` slots, no matter how many files or trees are in flight.
+    """
+
+    def __init__(
+        self,
+        remote: Remote,
+        api: Type[AsyncApiCall] = AsyncApiCall,
+        workers: int = DEFAULT_WORKERS,
+        md5: bool = False,
+    ):
+        self.remote = remote
+        self.api = api
+        self.workers = workers
+        self.md5 = md5
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def __aenter__(self) -> "AsyncActions":
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.api.sessions.close()
+
+    def _slot(self) -> asyncio.Semaphore:
+        if self._slots is None:
+            # created lazily, so it belongs to the running event loop
+            self._slots = asyncio.Semaphore(self.workers)
+        return self._slots
+
+    async def _call(self, fn: Callable[..., Awaitable], *args):
+        async with self._slot():
+            return await with_retries(fn, *args)
+
+    async def _ensure_dir(self, dir: PosixPath):
+        dirs_to_create: List[PosixPath] = []
+        while len(dir.parts) > 1:
+            if await self._call(self.api.directory_exists, self.remote, dir):
+                break
+            dirs_to_create.insert(0, dir)
+            dir = dir.parent
+        for dir in dirs_to_create:
+            await self._call(self.api.create_directory, self.remote, dir, True)
+
+    async def _upload_file(self, remote: Remote, local_path: Path):
+        """
+        Upload ranges of file concurrently. Ranges are read one at a time,
+        each from its own offset, and only after taking slot shared by all
+        files to send them from, so at most `workers` ranges are held in
+        memory however many files are uploaded at once. Slots are not
+        handed out in order, so whole file MD5 is advanced by
+        `OrderedHasher` rereading what is already read.
+        """
+        loop = asyncio.get_event_loop()
+        sz = local_path.stat().st_size
+        mtime = mtime_of(local_path)
+        await self._call(self.api.clear_file, remote, sz, mtime)
+        ranges = list(split_buffer(sz, RANGE_SIZE))
+        hasher = OrderedHasher(local_path, sz, ranges) if self.md5 else None
+        read_lock = asyncio.Lock()
+
+        with local_path.open("rb") as fp:
+
+            def read(start: int, end: int) -> bytes:
+                fp.seek(start)
+                return fp.read(end - start)
+
+            async def upload_range(start: int, end: int):
+                async with self._slot():
+                    async with read_lock:
+                        data = await loop.run_in_executor(None, read, start, end)
+                    content_md5 = None
+                    if hasher is not None:
+                        content_md5 = b64_md5(data)
+                        await loop.run_in_executor(None, hasher.done, start)
+                    await with_retries(
+                        self.api.upload_range, remote, start, data, content_md5
+                    )
+
+            await run_bounded((upload_range(s, e) for s, e in ranges), self.workers)
+        md5 = None
+        if hasher is not None:
+            md5 = base64.b64encode(hasher.md5.digest()).decode()
+        if sz:
+            await self._call(self.api.set_last_write_time, remote, mtime, md5)
+        elif md5 is not None:
+            await self._call(self.api.set_content_md5, remote, md5)
+
+    async def upload(self, local_str):
+        """
+        Upload file or, recursively, directory
+        """
+        local_path = Path(local_str)
+        self.remote.set_remote_file(local_path)
+        if not local_path.is_dir():
+            await self._ensure_dir(self.remote.remote_file.parent)
+            await self._upload_file(self.remote, local_path)
+            return
+        dirs, files = walk_local(local_path, self.remote.remote_file)
+        await self._ensure_dir(self.remote.remote_file)
+        levels: Dict[int, List[PosixPath]] = {}
+        for d in dirs:
+            levels.setdefault(len(d.parts), []).append(d)
+        for depth in sorted(levels):
+            await asyncio.gather(
+                *(
+                    self._call(self.api.create_directory, self.remote, d, True)
+                    for d in levels[depth]
+                )
+            )
+        await run_bounded(
+            (self._upload_file(self.remote.child(r), l) for l, r in files),
+            self.workers,
+        )
+
+    async def download(self, local_str):
+        """
+        Download file, in `RANGE_SIZE` ranges fetched concurrently
+        """
+        local_path = self.remote.get_local_file(local_str)
+        e = await self._call(
+            self.api.get_file_properties, self.remote, self.remote.remote_file
+        )
+        if e is None:
+            raise ValueError(f"File doesn't exist: {self.remote!s}")
+        if e.size <= RANGE_SIZE:
+            await self._call(self.api.download_file, self.remote, local_path, self.md5)
+            return
+        with local_path.open("wb") as f:
+            f.truncate(e.size)
+        await run_bounded(
+            (
+                self._call(
+                    self.api.download_file_range,
+                    self.remote,
+                    local_path,
+                    start,
+                    end,
+                    self.md5,
+                )
+                for start, end in split_buffer(e.size, RANGE_SIZE)
+            ),
+            self.workers,
+        )
+
+    async def list(self) -> DirContent:
+        self.remote.set_remote_file(Path())
+        content = DirContent(self.remote.remote_path)
+        async for e in self.api.list_dir(self.remote, content.path):
+            e.parent = content
+            content.entries[e.name] = e
+        return content
+
+    async def props(self) -> Optional[DirEntry]:
+        self.remote.set_remote_file(Path())
+        order = [self.api.get_file_properties, self.api.get_dir_properties]
+        if self.remote.is_dir:
+            order.reverse()
+        for c in order:
+            e = await self._call(c, self.remote, self.remote.remote_file)
+            if e is not None:
+                return e
+        return None
+
+    async def _delete_tree(self, path: PosixPath):
+        dirs: List[PosixPath] = []
+        files: List[PosixPath] = []
+        async for e in self.api.list_dir(self.remote, path):
+            (dirs if e.type == "Directory" else files).append(e.path)
+        await asyncio.gather(
+            run_bounded(
+                (self._call(self.api.delete_file, self.remote, f) for f in files),
+                self.workers,
+            ),
+            *(self._delete_tree(d) for d in dirs),
+        )
+        await self._call(self.api.delete_directory, self.remote, path)
+
+    async def delete(self) -> Optional[DirEntry]:
+        """
+        Delete file or, recursively, directory. Returns what was deleted,
+        `None` if path doesn't exist.
+        """
+        e = await self.props()
+        if e is not None:
+            if e.type == "Directory":
+                await self._delete_tree(e.path)
+            else:
+                await self._call(self.api.delete_file, self.remote, e.path)
+        return e
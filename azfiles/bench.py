@@ -0,0 +1,676 @@
+"""
+Micro benchmarks of azfiles internals and end to end benchmarks against
+local stand-in of Azure Files (`azfiles.standin`).
+
+    python -m azfiles.bench [--save=results.jsonl] [name ...]
+
+Each benchmark returns dict of metrics, which are printed one per line.
+With `--save` results are appended to JSONL file and every metric is
+compared with last saved result of the same benchmark.
+"""
+import hashlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+import zlib
+from pathlib import Path, PosixPath
+from typing import Any, Callable, Dict, List, cast
+
+from azfiles import (
+    CHUNK_SIZE,
+    RANGE_SIZE,
+    Actions,
+    ApiCall,
+    BoundedExecutor,
+    BufferPool,
+    Config,
+    DirEntry,
+    ListingParser,
+    Remote,
+    b64_md5,
+    dt_parse,
+    parse_timestamp,
+    read_into,
+    split_buffer,
+)
+from azfiles.standin import StandIn
+
+BENCHMARKS: Dict[str, Callable[[], Dict[str, float]]] = {}
+
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+
+def listing_xml(n: int) -> bytes:
+    """
+    Response of List Directories and Files with `n` file entries
+
+    >>> len(list(ET.fromstring(listing_xml(3)).iter("File")))
+    3
+    """
+    entry = (
+        "<File><Name>file{i:07d}.log</Name><Properties>"
+        "<Content-Length>{i}</Content-Length>"
+        "<CreationTime>2021-07-30T18:13:20.1234567Z</CreationTime>"
+        "<LastAccessTime>2021-07-30T18:13:20.1234567Z</LastAccessTime>"
+        "<LastWriteTime>2021-07-30T18:16:32.7654321Z</LastWriteTime>"
+        "<Etag>&quot;0x8D95385C4B8D2D8&quot;</Etag>"
+        "</Properties></File>"
+    )
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><EnumerationResults><Entries>'
+        + "".join(entry.format(i=i) for i in range(n))
+        + "</Entries><NextMarker /></EnumerationResults>"
+    ).encode()
+
+
+def per_call_us(fn: Callable, n: int) -> float:
+    start = time.perf_counter()
+    fn()
+    return (time.perf_counter() - start) / n * 1e6
+
+
+@benchmark
+def direntry_parse(n: int = 100000) -> Dict[str, float]:
+    """
+    Cost of turning listing into `DirEntry` objects, the way `list_dir`
+    does it, and of single timestamp parse with and without fast path.
+    """
+    body = listing_xml(n)
+    dir_path = PosixPath("/")
+
+    def parse_listing():
+        parser = ListingParser(dir_path)
+        for i in range(0, len(body), CHUNK_SIZE):
+            parser.feed(body[i : i + CHUNK_SIZE])
+
+    def xml_only():
+        for _ in ET.iterparse(io.BytesIO(body)):
+            pass
+
+    ts = "2021-07-30T18:13:20.1234567Z"
+    return {
+        "entries": n,
+        "listing_us_per_entry": per_call_us(parse_listing, n),
+        "xml_only_us_per_entry": per_call_us(xml_only, n),
+        "parse_timestamp_us": per_call_us(
+            lambda: [parse_timestamp(ts) for _ in range(n)], n
+        ),
+        "dateutil_us": per_call_us(lambda: [dt_parse(ts) for _ in range(n)], n),
+    }
+
+
+def temp_file(size: int) -> Path:
+    fd, name = tempfile.mkstemp(prefix="azfiles-bench-")
+    with os.fdopen(fd, "wb") as fp:
+        block = os.urandom(1024 * 1024)
+        for _ in range(size // len(block)):
+            fp.write(block)
+        fp.write(block[: size % len(block)])
+    return Path(name)
+
+
+@benchmark
+def chunk_reading(size: int = 256 * 1024 * 1024, workers: int = 4) -> Dict[str, float]:
+    """
+    Feeding file ranges to `workers` consumers (crc32 standing in for
+    network): reopening file and reading fresh `bytes` per range in
+    consumer, reading fresh `bytes` ahead from one handle, and `readinto`
+    pooled buffers from one handle, as upload does now.
+    """
+    path = temp_file(size)
+    ranges = split_buffer(size, RANGE_SIZE)
+
+    def reopen_and_read():
+        def consume(start, end):
+            with path.open("rb") as fp:
+                fp.seek(start)
+                zlib.crc32(fp.read(end - start))
+
+        with BoundedExecutor(workers, workers * 2) as executor:
+            for start, end in ranges:
+                executor.submit(consume, start, end)
+        return len(ranges)
+
+    def read_ahead():
+        with path.open("rb") as fp:
+            with BoundedExecutor(workers, workers * 2) as executor:
+                for start, end in ranges:
+                    executor.submit(zlib.crc32, fp.read(end - start))
+        return len(ranges)
+
+    def pooled_readinto():
+        pool = BufferPool(workers * 2, RANGE_SIZE)
+
+        def consume(data, buf):
+            zlib.crc32(data)
+            pool.put(buf)
+
+        with path.open("rb", buffering=0) as fp:
+            with BoundedExecutor(workers, workers * 2) as executor:
+                for start, end in ranges:
+                    buf = pool.get()
+                    executor.submit(consume, read_into(fp, buf, end - start), buf)
+        return pool.free.qsize()
+
+    results: Dict[str, float] = {"file_mb": size / 2 ** 20}
+    try:
+        for name, fn in (
+            ("reopen", reopen_and_read),
+            ("read", read_ahead),
+            ("pooled", pooled_readinto),
+        ):
+            tracemalloc.start()
+            start = time.perf_counter()
+            buffers = fn()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            results[f"{name}_mb_per_sec"] = size / 2 ** 20 / elapsed
+            results[f"{name}_peak_mb"] = peak / 2 ** 20
+            results[f"{name}_buffers_allocated"] = buffers
+    finally:
+        path.unlink()
+    return results
+
+
+@benchmark
+def md5_overhead(size: int = 256 * 1024 * 1024, workers: int = 4) -> Dict[str, float]:
+    """
+    Throughput of upload read path (pooled `readinto`, crc32 standing in
+    for network) without and with `--md5`: whole file hash updated by
+    reader and per range `Content-MD5` computed by workers.
+    """
+    path = temp_file(size)
+    ranges = split_buffer(size, RANGE_SIZE)
+
+    def read(md5: bool):
+        pool = BufferPool(workers * 2, RANGE_SIZE)
+        whole = hashlib.md5() if md5 else None
+
+        def consume(data, buf):
+            if md5:
+                b64_md5(data)
+            zlib.crc32(data)
+            pool.put(buf)
+
+        with path.open("rb", buffering=0) as fp:
+            with BoundedExecutor(workers, workers * 2) as executor:
+                for start, end in ranges:
+                    buf = pool.get()
+                    data = read_into(fp, buf, end - start)
+                    if whole is not None:
+                        whole.update(data)
+                    executor.submit(consume, data, buf)
+
+    results: Dict[str, float] = {"file_mb": size / 2 ** 20}
+    try:
+        for name, md5 in (("plain", False), ("md5", True)):
+            start = time.perf_counter()
+            read(md5)
+            results[f"{name}_mb_per_sec"] = (
+                size / 2 ** 20 / (time.perf_counter() - start)
+            )
+    finally:
+        path.unlink()
+    results["md5_cost_pct"] = 100 * (
+        1 - results["md5_mb_per_sec"] / results["plain_mb_per_sec"]
+    )
+    return results
+
+
+class LinkApi:
+    """
+    Stands in for `ApiCall` in streaming transfers, keeping file in
+    memory behind a link of `bandwidth` bytes per second shared by all
+    workers.
+    """
+
+    bandwidth = 50e6
+    link = threading.Lock()
+    data = bytearray()
+
+    @classmethod
+    def transfer(cls, n: int):
+        with cls.link:
+            time.sleep(n / cls.bandwidth)
+
+    @classmethod
+    def directory_exists(cls, remote, remote_dir) -> bool:
+        return True
+
+    @classmethod
+    def clear_file(cls, remote, size: int, last_write_time=None):
+        cls.data = bytearray(size)
+
+    @classmethod
+    def set_file_size(cls, remote, size: int):
+        del cls.data[size:]
+        cls.data.extend(bytes(size - len(cls.data)))
+
+    @classmethod
+    def upload_range(cls, remote, start: int, data, content_md5=None):
+        cls.transfer(len(data))
+        cls.data[start : start + len(data)] = data
+
+    @classmethod
+    def get_file_properties(cls, remote, remote_path) -> DirEntry:
+        return DirEntry(remote_path.name, "File", {"content_length": len(cls.data)})
+
+    @classmethod
+    def read_range(cls, remote, start: int, end: int, verify_md5=False) -> bytes:
+        cls.transfer(end - start)
+        return bytes(cls.data[start:end])
+
+
+def csv_log(size: int) -> bytes:
+    """
+    Log like CSV rows, compressible the way real logs are
+    """
+    rnd = random.Random(0)
+    methods = ["GET", "PUT", "POST", "DELETE"]
+    rows = []
+    n = 0
+    while n < size:
+        row = (
+            f"2021-07-30T18:{rnd.randrange(60):02d}:{rnd.randrange(60):02d}Z,"
+            f"{rnd.choice(methods)},/api/v1/items/{rnd.randrange(10 ** 6)},"
+            f"{rnd.randrange(200, 505)},{rnd.random():.6f}\n"
+        )
+        rows.append(row)
+        n += len(row)
+    return "".join(rows).encode()[:size]
+
+
+@benchmark
+def compression(
+    size: int = 128 * 1024 * 1024, link_mb_per_sec: float = 50.0, workers: int = 4
+) -> Dict[str, float]:
+    """
+    End to end throughput of streaming upload and download of log like
+    CSV over simulated link, plain and with `--compress`, measured in
+    uncompressed megabytes per second.
+    """
+    data = csv_log(size)
+    LinkApi.bandwidth = link_mb_per_sec * 2 ** 20
+    config = Config(Path(tempfile.mkdtemp()) / "config")
+    results: Dict[str, float] = {"file_mb": size / 2 ** 20}
+    compressions = ["", "gzip"]
+    try:
+        __import__("zstandard")
+        compressions.append("zstd")
+    except ImportError:
+        pass
+    for compression in compressions:
+        name = compression or "plain"
+        options = {"workers": str(workers)}
+        if compression:
+            options["compress"] = compression
+        cli = Actions(
+            Remote("m:/bench.csv", config, False), cast(Any, LinkApi), options
+        )
+        start = time.perf_counter()
+        cli._upload_stream(io.BytesIO(data))
+        results[f"{name}_upload_mb_per_sec"] = (
+            size / 2 ** 20 / (time.perf_counter() - start)
+        )
+        results[f"{name}_ratio"] = size / len(LinkApi.data)
+        out = io.BytesIO()
+        start = time.perf_counter()
+        cli._download_stream(out)
+        results[f"{name}_download_mb_per_sec"] = (
+            size / 2 ** 20 / (time.perf_counter() - start)
+        )
+        assert out.getvalue() == data
+    return results
+
+
+_FIRST_REQUEST = """
+import os, sys, time
+start = time.perf_counter()
+import azfiles
+
+class FirstRequest(azfiles.ApiCall):
+    # stop at first request, once session to send it is ready
+    def __init__(self, method, url, *args, **kwargs):
+        self.sessions.session(url)
+        sys.stderr.write(f"{(time.perf_counter() - start) * 1000}\\n")
+        os._exit(0)
+
+config = azfiles.Config(azfiles.Path(sys.argv[1]))
+azfiles.main(sys.argv[2:], FirstRequest, config)
+sys.stderr.write(f"{(time.perf_counter() - start) * 1000}\\n")
+"""
+
+
+def run_python(args: List[str], env: Dict[str, str], cwd: str) -> str:
+    return subprocess.run(
+        [sys.executable, *args],
+        env=env,
+        cwd=cwd,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    ).stderr
+
+
+@benchmark
+def startup(repeat: int = 5) -> Dict[str, float]:
+    """
+    Milliseconds from start of `import azfiles` until command is about to
+    send its first request (or, for `help`, is done), best of `repeat`
+    fresh interpreters with compiled bytecode, and `import azfiles`
+    alone as `python -X importtime` reports it.
+    """
+    tmp = Path(tempfile.mkdtemp())
+    config = tmp / "config"
+    mount = {"storage_account": "account", "share": "share", "sas_token": "sig=x"}
+    config.write_text(json.dumps({"m": mount}))
+    (tmp / "a.txt").write_bytes(b"abc")
+    env = dict(os.environ)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)
+    package_dir = str(Path(__file__).absolute().parent.parent)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (package_dir, env.get("PYTHONPATH")) if p
+    )
+    commands = {
+        "help": [],
+        "props": ["m:/a.txt", "props"],
+        "list": ["m:/d/", "list"],
+        "find": ["m:/d/", "find"],
+        "upload": ["m:/a.txt", "upload", "a.txt"],
+        "download": ["m:/a.txt", "download", "b.txt"],
+    }
+    results: Dict[str, float] = {}
+    for name, args in commands.items():
+        argv = ["-c", _FIRST_REQUEST, str(config), *args]
+        times = [
+            float(run_python(argv, env, str(tmp)).split()[-1])
+            for _ in range(repeat + 1)
+        ]
+        results[f"{name}_ms"] = min(times[1:])
+    imports = []
+    for _ in range(repeat):
+        report = run_python(["-X", "importtime", "-c", "import azfiles"], env, str(tmp))
+        line = [line for line in report.splitlines() if line.endswith("| azfiles")]
+        imports.append(int(line[0].split("|")[1]) / 1000)
+    results["import_ms"] = min(imports)
+    return results
+
+
+def standin_actions(
+    server: StandIn, remote: str, options: Dict[str, str] = None
+) -> Actions:
+    """
+    `Actions` on `remote` path of mount `m` served by `server`
+    """
+    mount = {
+        "storage_account": "acct",
+        "share": "share",
+        "sas_token": "sig=x",
+        "endpoint": server.endpoint("acct"),
+    }
+    config = Config(Path(tempfile.mkdtemp()) / "config")
+    config.data["m"] = mount
+    return Actions(
+        Remote(f"m:{remote}", config, False), ApiCall, options, io.StringIO()
+    )
+
+
+@benchmark
+def standin_transfer(
+    size: int = 64 * 1024 * 1024,
+    workers: int = 8,
+    latency: float = 0.005,
+    bandwidth: int = 0,
+) -> Dict[str, float]:
+    """
+    Upload and download of one big file to stand-in adding `latency` to
+    every request and capping link at `bandwidth` bytes/s (0 is no cap).
+    """
+    path = temp_file(size)
+    server = StandIn(latency=latency, bandwidth=bandwidth).start()
+    try:
+        ApiCall.sessions.close()
+        cli = standin_actions(server, "/big.bin", {"workers": str(workers)})
+        start = time.perf_counter()
+        cli.upload(str(path))
+        upload = time.perf_counter() - start
+        back = path.with_name(path.name + ".back")
+        start = time.perf_counter()
+        cli.download(str(back))
+        download = time.perf_counter() - start
+        assert back.stat().st_size == size
+        back.unlink()
+        return {
+            "upload_mb_per_sec": size / 2 ** 20 / upload,
+            "download_mb_per_sec": size / 2 ** 20 / download,
+            "requests": server.requests,
+            "connections": server.connections,
+            "client_opened": ApiCall.sessions.stats()["opened"],
+            "client_reused": ApiCall.sessions.stats()["reused"],
+        }
+    finally:
+        server.close()
+        path.unlink()
+
+
+@benchmark
+def standin_small_files(
+    dirs: int = 20, files: int = 50, size: int = 1024, workers: int = 8
+) -> Dict[str, float]:
+    """
+    Upload of tree of `dirs` x `files` small files and its download with
+    `sync`, in files per second and REST calls per file.
+    """
+    root = Path(tempfile.mkdtemp()) / "small"
+    for d in range(dirs):
+        (root / f"d{d:03d}").mkdir(parents=True)
+        for f in range(files):
+            (root / f"d{d:03d}" / f"f{f:04d}.txt").write_bytes(os.urandom(size))
+    n = dirs * files
+    server = StandIn(latency=0.002).start()
+    try:
+        cli = standin_actions(server, "/", {"workers": str(workers)})
+        start = time.perf_counter()
+        cli.upload(str(root))
+        upload = time.perf_counter() - start
+        requests = server.requests
+        cli = standin_actions(server, "/small", {"workers": str(workers)})
+        back = root.with_name("back")
+        start = time.perf_counter()
+        cli.sync(str(back), "down")
+        assert len(list(back.glob("*/*.txt"))) == n
+        download = time.perf_counter() - start
+        return {
+            "files": n,
+            "upload_files_per_sec": n / upload,
+            "upload_calls_per_file": requests / n,
+            "sync_down_files_per_sec": n / download,
+            "sync_down_calls_per_file": (server.requests - requests) / n,
+        }
+    finally:
+        server.close()
+
+
+@benchmark
+def standin_listing(entries: int = 50000, maxresults: int = 5000) -> Dict[str, float]:
+    """
+    Listing directory of `entries` files, `maxresults` per page.
+    """
+    server = StandIn().start()
+    try:
+        for i in range(entries):
+            server.write(f"/acct/share/big/file{i:07d}.log", b"")
+        cli = standin_actions(server, "/big/", {"maxresults": str(maxresults)})
+        start = time.perf_counter()
+        cli.list()
+        elapsed = time.perf_counter() - start
+        return {"entries_per_sec": entries / elapsed, "pages": server.requests}
+    finally:
+        server.close()
+
+
+@benchmark
+def standin_delete(
+    dirs: int = 100, files: int = 50, workers: int = 8, latency: float = 0.002
+) -> Dict[str, float]:
+    """
+    Recursive delete of tree of `dirs` x `files` files.
+    """
+    server = StandIn(latency=latency).start()
+    try:
+        for d in range(dirs):
+            for f in range(files):
+                server.write(f"/acct/share/tree/d{d:03d}/f{f:04d}", b"x")
+        cli = standin_actions(server, "/tree", {"workers": str(workers)})
+        start = time.perf_counter()
+        cli.delete()
+        elapsed = time.perf_counter() - start
+        assert "/acct/share/tree" not in server.nodes
+        return {"entries_per_sec": (dirs * (files + 1) + 1) / elapsed}
+    finally:
+        server.close()
+
+
+@benchmark
+def standin_autotune(
+    size: int = 32 * 1024 * 1024,
+    files: int = 300,
+    latency: float = 0.02,
+    max_active: int = 8,
+) -> Dict[str, float]:
+    """
+    Upload of big file and of tree of small `files` with default workers
+    and with `--autotune`, to stand-in adding `latency` and throttling
+    beyond `max_active` concurrent requests.
+    """
+    path = temp_file(size)
+    root = Path(tempfile.mkdtemp()) / "tree"
+    root.mkdir()
+    for i in range(files):
+        (root / f"f{i:04d}").write_bytes(os.urandom(3000))
+    results: Dict[str, float] = {}
+    try:
+        for name, options in (("fixed", {}), ("autotune", {"autotune": "true"})):
+            server = StandIn(latency=latency, max_active=max_active).start()
+            try:
+                cli = standin_actions(server, "/big.bin", options)
+                start = time.perf_counter()
+                cli.upload(str(path))
+                results[f"{name}_file_mb_per_sec"] = (
+                    size / 2 ** 20 / (time.perf_counter() - start)
+                )
+                cli = standin_actions(server, "/", options)
+                start = time.perf_counter()
+                cli.upload(str(root))
+                results[f"{name}_tree_files_per_sec"] = files / (
+                    time.perf_counter() - start
+                )
+                if cli.tuner is not None:
+                    results[f"{name}_tree_workers"] = cli.tuner.workers
+                    results[f"{name}_throttled"] = cli.tuner.throttled
+            finally:
+                server.close()
+    finally:
+        path.unlink()
+    return results
+
+
+@benchmark
+def standin_pack(
+    dirs: int = 20, files: int = 50, size: int = 1024, latency: float = 0.002
+) -> Dict[str, float]:
+    """
+    Upload of tree of `dirs` x `files` small files with `--pack`, its
+    extraction and fetch of single member, to compare with
+    `standin_small_files`.
+    """
+    root = Path(tempfile.mkdtemp()) / "small"
+    for d in range(dirs):
+        (root / f"d{d:03d}").mkdir(parents=True)
+        for f in range(files):
+            (root / f"d{d:03d}" / f"f{f:04d}.txt").write_bytes(os.urandom(size))
+    n = dirs * files
+    server = StandIn(latency=latency).start()
+    try:
+        cli = standin_actions(server, "/", {"pack": "true"})
+        start = time.perf_counter()
+        cli.upload(str(root))
+        upload = time.perf_counter() - start
+        requests = server.requests
+        cli = standin_actions(server, "/small.tar", {"pack": "true"})
+        back = root.with_name("back")
+        start = time.perf_counter()
+        cli.download(str(back))
+        assert len(list(back.glob("small/*/*.txt"))) == n
+        download = time.perf_counter() - start
+        cli = standin_actions(server, "/small.tar", {"member": "small/d000/f0000.txt"})
+        start = time.perf_counter()
+        cli.download(str(back))
+        member = time.perf_counter() - start
+        return {
+            "files": n,
+            "upload_files_per_sec": n / upload,
+            "upload_calls_per_file": requests / n,
+            "extract_files_per_sec": n / download,
+            "member_ms": member * 1000,
+        }
+    finally:
+        server.close()
+
+
+def save_results(path: Path, name: str, results: Dict[str, Any]):
+    """
+    Append `results` to JSONL file at `path`, printing change of every
+    metric since last saved run of benchmark `name`.
+    """
+    previous = None
+    if path.exists():
+        with path.open("rt") as fp:
+            for line in fp:
+                record = json.loads(line)
+                if record["benchmark"] == name:
+                    previous = record
+    if previous is not None:
+        for k, v in results.items():
+            old = previous["metrics"].get(k)
+            if isinstance(old, (int, float)) and old and isinstance(v, (int, float)):
+                change = (v - old) / old * 100
+                print(f"{name}.{k}: {change:+.1f}% since {previous['time']}")
+    record = {
+        "benchmark": name,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "metrics": results,
+    }
+    with path.open("at") as fp:
+        fp.write(json.dumps(record) + "\n")
+
+
+def main(args=sys.argv[1:]):
+    names = [a for a in args if not a.startswith("--save=")]
+    saves = [Path(a[len("--save=") :]) for a in args if a.startswith("--save=")]
+    for name in names or list(BENCHMARKS):
+        results = BENCHMARKS[name]()
+        for k, v in results.items():
+            print(
+                f"{name}.{k}: {v:.3f}" if isinstance(v, float) else f"{name}.{k}: {v}"
+            )
+        for path in saves:
+            save_results(path, name, results)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,484 @@
+"""
+Local stand-in for Azure Files, implementing subset of REST API azfiles
+uses: create, resize, put range (also from url), get with ranges, list
+ranges, list with markers, properties, copy, delete and directories.
+Everything is kept in memory. Latency, bandwidth of link and throttling
+can be injected to see how transfers behave on slow or busy service.
+
+    python -m azfiles.standin --port=10000 --latency=0.02 --bandwidth=50000000
+
+and register mount pointing to it:
+
+    azfiles local: add_mount acct share sig=x http://127.0.0.1:10000/acct
+
+Every storage account and share exists as soon as it is used. SAS token is
+not checked.
+"""
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from typing import Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.sax.saxutils import escape
+
+from azfiles import b64_md5, parse_timestamp, to_azure_time
+
+# status, body and headers of response
+Reply = Tuple[int, bytes, Dict[str, str]]
+
+
+def http_date(t: datetime) -> str:
+    """
+    >>> http_date(datetime(1970, 1, 1, tzinfo=timezone.utc))
+    'Thu, 01 Jan 1970 00:00:00 GMT'
+    """
+    return time.strftime("%a, %d %b %Y %H:%M:%S GMT", t.utctimetuple())
+
+
+def parse_range(header: str) -> Tuple[int, int]:
+    """
+    Inclusive `bytes=start-end` range as `[start, end)`
+
+    >>> parse_range("bytes=0-99")
+    (0, 100)
+    """
+    start, _, end = header.partition("=")[2].partition("-")
+    return int(start), int(end) + 1
+
+
+class Node:
+    def __init__(self, is_dir: bool, t: datetime = None):
+        self.is_dir = is_dir
+        self.data = bytearray()
+        self.children: Set[str] = set()
+        self.etag = 0
+        self.t = datetime.now(timezone.utc) if t is None else t
+        self.md5: Optional[str] = None
+        self.written: Set[Tuple[int, int]] = set()
+        # times Get File Properties reports pending copy before success
+        self.copy_pending = 0
+
+    def modified(self):
+        """
+        Content changed, like on service it resets last write time
+        """
+        self.etag += 1
+        self.t = datetime.now(timezone.utc)
+
+    def properties(self) -> Dict[str, str]:
+        headers = {
+            "ETag": f'"0x{self.etag:X}"',
+            "Last-Modified": http_date(self.t),
+            "x-ms-type": "Directory" if self.is_dir else "File",
+            "x-ms-file-creation-time": to_azure_time(self.t),
+            "x-ms-file-last-write-time": to_azure_time(self.t),
+        }
+        if not self.is_dir:
+            headers["Content-Length"] = str(len(self.data))
+            if self.md5 is not None:
+                headers["Content-MD5"] = self.md5
+        return headers
+
+
+class StandIn(ThreadingMixIn, HTTPServer):
+    """
+    Server on `127.0.0.1:port` (0 picks free port). `latency` seconds are
+    added to every request, `bandwidth` bytes/s is capacity of link all
+    request and response bodies share (0 is unlimited), `throttle` is
+    probability of request being rejected with 503, `max_active` is how
+    many requests can be served at once before the rest is rejected with
+    503 (0 is unlimited), `copy_pending` is how many times Copy File
+    reports `pending` before `success`.
+
+    >>> server = StandIn().start()
+    >>> server.endpoint("acct").startswith("http://127.0.0.1:")
+    True
+    >>> server.close()
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        port: int = 0,
+        latency: float = 0.0,
+        bandwidth: int = 0,
+        throttle: float = 0.0,
+        max_active: int = 0,
+        copy_pending: int = 0,
+    ):
+        super().__init__(("127.0.0.1", port), StandInHandler)
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.throttle = throttle
+        self.max_active = max_active
+        self.active = 0
+        self.copy_pending = copy_pending
+        self.lock = threading.Lock()
+        # link has its own lock, so bodies can be throttled while `lock`
+        # guarding nodes is free for other requests
+        self.link_lock = threading.Lock()
+        self.nodes: Dict[str, Node] = {}
+        self.requests = 0
+        self.connections = 0
+        self.link_free_at = 0.0
+
+    def endpoint(self, storage_account: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}/{storage_account}"
+
+    def start(self) -> "StandIn":
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        self.shutdown()
+        self.server_close()
+
+    def transfer(self, size: int):
+        """
+        Wait until `size` bytes pass through the link, behind all bytes
+        other connections already queued on it
+        """
+        if not self.bandwidth or not size:
+            return
+        with self.link_lock:
+            now = time.perf_counter()
+            self.link_free_at = max(now, self.link_free_at) + size / self.bandwidth
+            done = self.link_free_at
+        time.sleep(max(0.0, done - now))
+
+    def write(self, path: str, data: bytes = None):
+        """
+        Put file (or directory if `data` is None) at `path` of form
+        `/<storage_account>/<share>/...`, creating missing parents
+
+        >>> server = StandIn()
+        >>> server.write("/acct/share/a/b.txt", b"abc")
+        >>> sorted(server.nodes), server.nodes["/acct/share/a"].children
+        (['/acct/share', '/acct/share/a', '/acct/share/a/b.txt'], {'b.txt'})
+        >>> server.server_close()
+        """
+        with self.lock:
+            parts = path.split("/")
+            for i in range(3, len(parts)):
+                parent = "/".join(parts[:i])
+                if parent not in self.nodes:
+                    self.nodes[parent] = Node(True)
+                    if i > 3:
+                        self.nodes["/".join(parts[: i - 1])].children.add(parts[i - 1])
+            node = Node(data is None)
+            if data is not None:
+                node.data = bytearray(data)
+                node.written = {(0, len(data))} if data else set()
+            self.add(path, node)
+
+    def add(self, path: str, node: Node):
+        self.nodes[path] = node
+        parent, name = path.rsplit("/", 1)
+        self.nodes[parent].children.add(name)
+
+    def remove(self, path: str):
+        del self.nodes[path]
+        parent, name = path.rsplit("/", 1)
+        self.nodes[parent].children.discard(name)
+
+    def node_of_url(self, url: str) -> Optional[Node]:
+        return self.nodes.get(url_path(url))
+
+
+def url_path(url: str) -> str:
+    """
+    Node key of url: `/<storage_account>/<share>/<path>` without trailing `/`
+
+    >>> url_path("http://127.0.0.1:1/acct/share/a%20b/?comp=list")
+    '/acct/share/a b'
+    """
+    return unquote(urlsplit(url).path).rstrip("/")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: StandIn
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.admitted = False
+        with self.server.lock:
+            self.server.connections += 1
+
+    def handle_one_request(self):
+        try:
+            super().handle_one_request()
+        finally:
+            if self.admitted:
+                self.admitted = False
+                with self.server.lock:
+                    self.server.active -= 1
+
+    def read_body(self) -> bytes:
+        size = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(size) if size else b""
+        self.server.transfer(len(body))
+        return body
+
+    def send(self, status: int, body: bytes = b"", headers: Dict[str, str] = None):
+        """
+        Never called with `server.lock` held: writing body waits on link
+        """
+        headers = {} if headers is None else headers
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        if "Content-Length" not in headers:
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command != "HEAD" and body:
+            self.server.transfer(len(body))
+            self.wfile.write(body)
+
+    def start_request(self) -> Optional[Tuple[str, Dict[str, List[str]]]]:
+        """
+        Apply latency and throttling, then return node path and query,
+        creating share on first use. None if request is already answered.
+        """
+        server = self.server
+        with server.lock:
+            server.requests += 1
+            if not server.max_active or server.active < server.max_active:
+                server.active += 1
+                self.admitted = True
+        if server.latency:
+            time.sleep(server.latency)
+        throttled = server.throttle and random.random() < server.throttle
+        if throttled or not self.admitted:
+            self.read_body()
+            self.send(503, b"ServerBusy", {"x-ms-error-code": "ServerBusy"})
+            return None
+        path = url_path(self.path)
+        if path.count("/") < 2:
+            self.read_body()
+            self.send(400, b"InvalidUri")
+            return None
+        share = "/".join(path.split("/", 3)[:3])
+        with server.lock:
+            if share not in server.nodes:
+                server.nodes[share] = Node(True)
+        return path, parse_qs(urlsplit(self.path).query)
+
+    def do_HEAD(self):
+        request = self.start_request()
+        if request is None:
+            return
+        path, query = request
+        node = self.server.nodes.get(path)
+        if node is None or node.is_dir != ("restype" in query):
+            return self.send(404)
+        headers = node.properties()
+        if self.headers.get("If-None-Match") == headers["ETag"]:
+            return self.send(304, b"", {"ETag": headers["ETag"]})
+        if node.copy_pending:
+            node.copy_pending -= 1
+            headers["x-ms-copy-status"] = "pending"
+        else:
+            headers["x-ms-copy-status"] = "success"
+        self.send(200, b"", headers)
+
+    def do_GET(self):
+        request = self.start_request()
+        if request is None:
+            return
+        path, query = request
+        node = self.server.nodes.get(path)
+        if node is None:
+            return self.send(404, b"ResourceNotFound")
+        comp = query.get("comp", [""])[0]
+        if comp == "list":
+            return self.send(200, self.listing(path, node, query))
+        if comp == "rangelist":
+            ranges = "".join(
+                f"<Range><Start>{s}</Start><End>{e - 1}</End></Range>"
+                for s, e in sorted(node.written)
+            )
+            body = f'<?xml version="1.0" encoding="utf-8"?><Ranges>{ranges}</Ranges>'
+            headers = {"x-ms-content-length": str(len(node.data))}
+            return self.send(200, body.encode(), headers)
+        headers = node.properties()
+        data = bytes(node.data)
+        status = 200
+        header = self.headers.get("x-ms-range") or self.headers.get("Range")
+        if header:
+            start, end = parse_range(header)
+            data = data[start:end]
+            status = 206
+            if self.headers.get("x-ms-range-get-content-md5") == "true":
+                headers["Content-MD5"] = b64_md5(data)
+        headers["Content-Length"] = str(len(data))
+        self.send(status, data, headers)
+
+    def listing(self, path: str, node: Node, query: Dict[str, List[str]]) -> bytes:
+        marker = query.get("marker", [""])[0]
+        maxresults = int(query.get("maxresults", ["5000"])[0])
+        names = [name for name in sorted(node.children) if name >= marker]
+        page, rest = names[:maxresults], names[maxresults:]
+        entries = []
+        for name in page:
+            child = self.server.nodes[f"{path}/{name}"]
+            tag = "Directory" if child.is_dir else "File"
+            t = to_azure_time(child.t)
+            size = (
+                ""
+                if child.is_dir
+                else f"<Content-Length>{len(child.data)}</Content-Length>"
+            )
+            entries.append(
+                f"<{tag}><Name>{escape(name)}</Name><Properties>{size}"
+                f"<CreationTime>{t}</CreationTime><LastAccessTime>{t}</LastAccessTime>"
+                f"<LastWriteTime>{t}</LastWriteTime>"
+                f'<Etag>"0x{child.etag:X}"</Etag></Properties></{tag}>'
+            )
+        next_marker = escape(rest[0]) if rest else ""
+        return (
+            '<?xml version="1.0" encoding="utf-8"?><EnumerationResults><Entries>'
+            + "".join(entries)
+            + f"</Entries><NextMarker>{next_marker}</NextMarker></EnumerationResults>"
+        ).encode()
+
+    def do_PUT(self):
+        request = self.start_request()
+        if request is None:
+            return
+        path, query = request
+        body = self.read_body()
+        comp = query.get("comp", [""])[0]
+        with self.server.lock:
+            if comp == "range":
+                reply = self.put_range(path, body)
+            elif comp == "properties":
+                reply = self.set_properties(path)
+            else:
+                reply = self.create(path, query)
+        self.send(*reply)
+
+    def create(self, path: str, query: Dict[str, List[str]]) -> Reply:
+        nodes = self.server.nodes
+        if path.rsplit("/", 1)[0] not in nodes:
+            return 404, b"ParentNotFound", {}
+        if query.get("restype") == ["directory"]:
+            if path in nodes:
+                return 409, b"ResourceAlreadyExists", {}
+            self.server.add(path, Node(True))
+            return 201, b"", {}
+        if "x-ms-copy-source" in self.headers:
+            source = self.server.node_of_url(self.headers["x-ms-copy-source"])
+            if source is None:
+                return 404, b"CannotVerifyCopySource", {}
+            node = Node(False, source.t)
+            node.data = bytearray(source.data)
+            node.written = {(0, len(node.data))} if node.data else set()
+            node.copy_pending = self.server.copy_pending
+            self.server.add(path, node)
+            status = "pending" if node.copy_pending else "success"
+            return 202, b"", {"x-ms-copy-status": status}
+        last_write = self.headers.get("x-ms-file-last-write-time", "now")
+        node = Node(False, None if last_write == "now" else parse_timestamp(last_write))
+        node.data = bytearray(int(self.headers["x-ms-content-length"]))
+        self.server.add(path, node)
+        return 201, b"", {"ETag": f'"0x{node.etag:X}"'}
+
+    def put_range(self, path: str, body: bytes) -> Reply:
+        node = self.server.nodes.get(path)
+        if node is None or node.is_dir:
+            return 404, b"ResourceNotFound", {}
+        start, end = parse_range(self.headers["x-ms-range"])
+        if "x-ms-copy-source" in self.headers:
+            source = self.server.node_of_url(self.headers["x-ms-copy-source"])
+            if source is None:
+                return 404, b"CannotVerifyCopySource", {}
+            s, e = parse_range(self.headers["x-ms-source-range"])
+            body = bytes(source.data[s:e])
+        update = self.headers.get("x-ms-write") == "update"
+        if update and len(body) != end - start:
+            return 400, b"InvalidHeaderValue", {}
+        md5 = self.headers.get("Content-MD5")
+        if md5 is not None and b64_md5(body) != md5:
+            return 400, b"Md5Mismatch", {}
+        if end > len(node.data):
+            return 416, b"InvalidRange", {}
+        node.data[start:end] = body if update else bytes(end - start)
+        if update:
+            node.written.add((start, end))
+        else:
+            node.written = {(s, e) for s, e in node.written if e <= start or s >= end}
+        node.modified()
+        return 201, b"", {"ETag": f'"0x{node.etag:X}"'}
+
+    def set_properties(self, path: str) -> Reply:
+        node = self.server.nodes.get(path)
+        if node is None or node.is_dir:
+            return 404, b"ResourceNotFound", {}
+        if "x-ms-content-length" in self.headers:
+            size = int(self.headers["x-ms-content-length"])
+            node.data = node.data[:size] + bytearray(max(0, size - len(node.data)))
+            node.written = {(s, min(e, size)) for s, e in node.written if s < size}
+            node.modified()
+        if "x-ms-content-md5" in self.headers:
+            node.md5 = self.headers["x-ms-content-md5"]
+        last_write = self.headers.get("x-ms-file-last-write-time", "preserve")
+        if last_write == "now":
+            node.t = datetime.now(timezone.utc)
+        elif last_write != "preserve":
+            node.t = parse_timestamp(last_write)
+        node.etag += 1
+        return 200, b"", {"ETag": f'"0x{node.etag:X}"'}
+
+    def do_DELETE(self):
+        request = self.start_request()
+        if request is None:
+            return
+        path, _ = request
+        with self.server.lock:
+            node = self.server.nodes.get(path)
+            if node is None:
+                reply: Reply = (404, b"ResourceNotFound", {})
+            elif node.is_dir and node.children:
+                reply = (409, b"DirectoryNotEmpty", {})
+            else:
+                self.server.remove(path)
+                reply = (202, b"", {})
+        self.send(*reply)
+
+
+_SERVER_OPTIONS = {
+    "port": 10000,
+    "latency": 0.0,
+    "bandwidth": 0,
+    "throttle": 0.0,
+    "max_active": 0,
+    "copy_pending": 0,
+}
+
+
+def main(args=sys.argv[1:]):
+    kwargs = {}
+    for arg in args:
+        k, _, v = arg.lstrip("-").partition("=")
+        if k not in _SERVER_OPTIONS:
+            raise ValueError(f"Unknown option: --{k}, expected {list(_SERVER_OPTIONS)}")
+        kwargs[k] = type(_SERVER_OPTIONS[k])(v)
+    server = StandIn(**kwargs)
+    print(f"serving on {server.endpoint('<storage_account>')}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
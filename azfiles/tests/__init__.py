@@ -0,0 +1,38 @@
+import io
+import os
+from pathlib import Path
+from typing import Dict, List, Type
+
+from azfiles import Actions, ApiCall, CallRecord, Config, Remote
+
+
+def actions(
+    config: Config, remote: str, api: Type[ApiCall] = ApiCall, **options: str
+) -> Actions:
+    return Actions(Remote(remote, config, False), api, options, io.StringIO())
+
+
+def output(cli: Actions) -> List[str]:
+    return cli.out.getvalue().splitlines()  # type: ignore
+
+
+def operations(records: List[CallRecord]) -> Dict[str, int]:
+    counts: Dict[str, int] = {}
+    for r in records:
+        counts[r.operation] = counts.get(r.operation, 0) + 1
+    return counts
+
+
+def write_file(path: Path, data: bytes) -> bytes:
+    path.write_bytes(data)
+    return data
+
+
+def make_tree(root: Path):
+    for d in ("a", "a/b", "c"):
+        (root / d).mkdir(parents=True)
+        for i in range(3):
+            (root / d / f"f{i}.txt").write_bytes(os.urandom(100 * i))
+    # well in the past, so it can't match time of upload by accident
+    for p in root.rglob("*.txt"):
+        os.utime(p, (1e9, 1e9))
@@ -0,0 +1,84 @@
+import asyncio
+import os
+from pathlib import Path
+from typing import List
+
+from azfiles import RANGE_SIZE, Config, Remote, b64_md5
+from azfiles.aio import AsyncActions, run
+from azfiles.standin import StandIn
+
+
+class LastInFirstOut:
+    """
+    Slots handed out newest waiter first, as `asyncio.Semaphore` is free
+    to do before Python 3.11
+    """
+
+    def __init__(self, value: int):
+        self.value = value
+        self.waiters: List[asyncio.Future] = []
+
+    async def __aenter__(self):
+        if self.value:
+            self.value -= 1
+            return
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters.append(waiter)
+        await waiter
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        if self.waiters:
+            self.waiters.pop().set_result(None)
+        else:
+            self.value += 1
+
+
+class Unfair(AsyncActions):
+    def _slot(self):
+        if self._slots is None:
+            self._slots = LastInFirstOut(self.workers)  # type: ignore
+        return self._slots
+
+
+def test_ranges_read_at_their_offsets(config: Config, server: StandIn):
+    # ranges of all files wait for the same slots, so they get them out
+    # of order
+    Path("tree").mkdir()
+    files = {}
+    for i in range(3):
+        files[f"f{i}.bin"] = os.urandom(5 * RANGE_SIZE + i)
+        Path("tree", f"f{i}.bin").write_bytes(files[f"f{i}.bin"])
+
+    async def upload():
+        remote = Remote("m:/", config, False)
+        async with Unfair(remote, workers=3, md5=True) as actions:
+            await actions.upload("tree")
+
+    run(upload())
+    for name, data in files.items():
+        node = server.nodes[f"/acct/share/tree/{name}"]
+        assert node.data == data
+        assert node.md5 == b64_md5(data)
+
+
+def test_upload_download_list_delete(config: Config, server: StandIn):
+    data = os.urandom(2 * RANGE_SIZE + 10)
+    Path("big.bin").write_bytes(data)
+
+    async def roundtrip():
+        remote = Remote("m:/d/", config, False)
+        async with AsyncActions(remote, workers=3, md5=True) as actions:
+            await actions.upload("big.bin")
+            content = await actions.list()
+            assert content.entries["big.bin"].size == len(data)
+        remote = Remote("m:/d/big.bin", config, False)
+        async with AsyncActions(remote, md5=True) as actions:
+            await actions.download("back.bin")
+            assert (await actions.props()).size == len(data)
+        async with AsyncActions(Remote("m:/d", config, False)) as actions:
+            assert (await actions.delete()).type == "Directory"
+            assert await actions.props() is None
+
+    run(roundtrip())
+    assert Path("back.bin").read_bytes() == data
+    assert sorted(server.nodes) == ["/acct/share"]
@@ -0,0 +1,37 @@
+import os
+from pathlib import Path
+from typing import List
+
+from azfiles import ApiCall, CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, operations, output, write_file
+
+
+def test_autotuned_upload_and_download(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    # split so every one of default pool of 16 workers gets a range
+    data = write_file(Path("big.bin"), os.urandom(8 * 2 ** 20))
+    cli = actions(config, "m:/", ApiCall, autotune="true")
+    cli.upload("big.bin")
+    assert server.nodes["/acct/share/big.bin"].data == data
+    assert operations(records)["PUT range"] == 16
+    report = output(cli)[-1]
+    assert report.startswith("autotune: workers=")
+    assert " range_size=524288 " in report
+
+    cli = actions(config, "m:/big.bin", ApiCall, autotune="true")
+    cli.download("copy.bin")
+    assert Path("copy.bin").read_bytes() == data
+    assert operations(records)["GET"] == 16
+    assert output(cli)[-1].startswith("autotune: workers=")
+
+
+def test_tuner_reports_calls_to_previous_observer(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    write_file(Path("a.txt"), b"abc")
+    cli = actions(config, "m:/", ApiCall, autotune="true")
+    cli.upload("a.txt")
+    assert cli.tuner is not None and cli.tuner.transferred == 3
+    assert operations(records)["PUT range"] == 1
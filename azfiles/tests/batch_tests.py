@@ -0,0 +1,73 @@
+import io
+import json
+from pathlib import Path
+
+from azfiles import ApiCall, Batch, Config, main
+from azfiles.standin import StandIn
+
+
+def run(config: Config, manifest: str, **options: str):
+    out = io.StringIO()
+    counts = Batch(ApiCall, config, options, out).run(io.StringIO(manifest))
+    results = [json.loads(line) for line in out.getvalue().splitlines()]
+    return counts, {r["line"]: r for r in results}
+
+
+def test_batch_reports_every_command(config: Config, server: StandIn):
+    for i in range(3):
+        Path(f"f{i}.txt").write_bytes(b"x" * i)
+    manifest = "\n".join(
+        [
+            "# uploads",
+            "m:/d/,upload,f0.txt",
+            '["m:/d/", "upload", "f1.txt"]',
+            '{"remote": "m:/d/", "action": "upload", "args": ["f2.txt"]}',
+            "",
+            "m:/d/,list,--maxresults=2",
+        ]
+    )
+    counts, results = run(config, manifest, jobs="1")
+    assert counts == {"ok": 4, "failed": 0}
+    assert sorted(results) == [2, 3, 4, 6]
+    assert results[3]["command"] == ["m:/d/", "upload", "f1.txt"]
+    assert [line[:6] for line in results[6]["output"][2:]] == [
+        "f0.txt",
+        "f1.txt",
+        "f2.txt",
+    ]
+    assert server.nodes["/acct/share/d/f2.txt"].data == b"xx"
+
+
+def test_batch_error_rows(config: Config):
+    manifest = "\n".join(
+        [
+            "m:/nope.txt,download,x.txt",
+            "m:/a.txt,bogus",
+            "m:/a.txt,props,--jobs=2",
+            "m:/a.txt,props,--frobnicate",
+            '["m:/a.txt", "props"',
+            "x:/,list",
+        ]
+    )
+    counts, results = run(config, manifest)
+    assert counts == {"ok": 1, "failed": 5}
+    errors = {n: r.get("error", "") for n, r in results.items()}
+    assert errors[1] == "ValueError: File doesn't exist: m:/nope.txt"
+    assert errors[2] == "ValueError: Not a batch action: ['bogus']"
+    assert errors[3] == "ValueError: Options only batch can have: ['jobs']"
+    assert errors[4] == "ValueError: Unknown option: --frobnicate"
+    assert errors[5].startswith("JSONDecodeError")
+    assert errors[6] == ""
+    assert [results[n]["ok"] for n in range(1, 7)] == [False] * 5 + [True]
+    assert results[1]["command"] == ["m:/nope.txt", "download", "x.txt"]
+    assert results[5]["command"] == []
+
+
+def test_batch_from_command_line(config: Config, server: StandIn, capsys):
+    Path("a.txt").write_bytes(b"abc")
+    Path("manifest").write_text("m:/d/,upload,a.txt\nm:/d/a.txt,props\n")
+    main(["batch", "manifest", "--jobs=1"], config=config)
+    out, err = capsys.readouterr()
+    assert [json.loads(line)["ok"] for line in out.splitlines()] == [True, True]
+    assert err.splitlines()[-1] == "batch: 2 ok, 0 failed"
+    assert server.nodes["/acct/share/d/a.txt"].data == b"abc"
@@ -0,0 +1,63 @@
+from pathlib import Path, PosixPath
+from typing import List
+
+from azfiles import ApiCall, CallRecord, Config, MetaCache, Remote
+from azfiles.standin import StandIn
+from azfiles.tests import actions, output
+
+
+def test_expired_properties_are_revalidated(
+    config: Config, server: StandIn, records: List[CallRecord], monkeypatch
+):
+    cache = MetaCache(Path("cache"), ttl=60)
+    monkeypatch.setattr(ApiCall, "cache", cache)
+    remote = Remote("m:/", config, False)
+    path = PosixPath("/d/a.txt")
+    server.write("/acct/share/d/a.txt", b"abc")
+    assert ApiCall.get_file_properties(remote, path).size == 3
+    assert ApiCall.get_file_properties(remote, path).size == 3
+    cache.ttl = 0
+    assert ApiCall.get_file_properties(remote, path).size == 3
+    server.write("/acct/share/d/a.txt", b"abcd")
+    server.nodes["/acct/share/d/a.txt"].modified()
+    assert ApiCall.get_file_properties(remote, path).size == 4
+    assert [r.status for r in records] == [200, 304, 200]
+
+
+def test_listing_read_keeps_entries_from_eviction(
+    config: Config, server: StandIn, monkeypatch
+):
+    cache = MetaCache(Path("cache"), ttl=60, max_entries=3)
+    monkeypatch.setattr(ApiCall, "cache", cache)
+    remote = Remote("m:/", config, False)
+    mount = remote.mount
+    server.write("/acct/share/d/a.txt", b"a")
+    server.write("/acct/share/d/b.txt", b"b")
+    server.write("/acct/share/e/c.txt", b"c")
+    list(ApiCall.list_dir(remote, PosixPath("/d")))
+    ApiCall.get_file_properties(remote, PosixPath("/e/c.txt"))
+    assert [e.name for e in cache.listing(mount, PosixPath("/d"))] == [
+        "a.txt",
+        "b.txt",
+    ]
+    server.write("/acct/share/e/f.txt", b"f")
+    ApiCall.get_file_properties(remote, PosixPath("/e/f.txt"))
+    # listed entries were read after c.txt, so it is least recently used
+    cache._evict()
+    assert cache.get(mount, PosixPath("/e/c.txt")) is None
+    assert len(cache.listing(mount, PosixPath("/d"))) == 2
+
+
+def test_cached_props_skip_requests(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    server.write("/acct/share/d/a.txt", b"abc")
+    for _ in range(3):
+        cli = actions(config, "m:/d/a.txt", cache="true")
+        cli.props()
+        assert output(cli)[0].startswith("a.txt,File,3,")
+    assert len(records) == 1
+    actions(config, "m:/d/a.txt", cache="true").delete()
+    cli = actions(config, "m:/d/a.txt", cache="true")
+    cli.props()
+    assert output(cli) == ["None"]
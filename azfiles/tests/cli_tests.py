@@ -0,0 +1,33 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import azfiles
+from azfiles import ApiCall, Config, main
+from azfiles.standin import StandIn
+
+HEAVY = ["requests", "urllib3", "dateutil", "sqlite3", "xml.etree.ElementTree"]
+
+
+def test_import_defers_heavy_modules():
+    script = (
+        "import sys, azfiles; " f"print([m for m in {HEAVY!r} if m in sys.modules])"
+    )
+    root = str(Path(azfiles.__file__).parent.parent)
+    env = dict(os.environ, PYTHONPATH=root)
+    out = subprocess.run(
+        [sys.executable, "-c", script], stdout=subprocess.PIPE, env=env, check=True
+    ).stdout
+    assert out.decode().strip() == "[]"
+
+
+def test_stats_printed_to_stderr(config: Config, server: StandIn, capsys):
+    Path("a.txt").write_bytes(b"abc")
+    main(["m:/d/", "upload", "a.txt", "--stats"], config=config)
+    err = capsys.readouterr().err.splitlines()
+    assert err[0].split()[:3] == ["operation", "calls", "errors"]
+    assert any(line.startswith("PUT range ") for line in err)
+    assert err[-2].startswith("total ")
+    assert err[-1].startswith("connections: ")
+    assert ApiCall.observer is None
@@ -0,0 +1,47 @@
+import gzip
+import os
+from pathlib import Path
+
+import pytest
+from azfiles import RANGE_SIZE, Config, b64_md5
+from azfiles.standin import StandIn
+from azfiles.tests import actions, write_file
+
+
+def test_gzip_roundtrip(config: Config, server: StandIn):
+    data = write_file(Path("log.csv"), b"2021-07-30,info,ok\n" * RANGE_SIZE)
+    actions(config, "m:/log.csv.gz", compress="gzip").upload("log.csv")
+    stored = bytes(server.nodes["/acct/share/log.csv.gz"].data)
+    # concatenated gzip members, as gunzip reads them
+    assert gzip.decompress(stored) == data
+    assert len(stored) < len(data) // 10
+    actions(config, "m:/log.csv.gz", compress="gzip").download("back.csv")
+    assert Path("back.csv").read_bytes() == data
+
+
+def test_zstd_roundtrip(config: Config, server: StandIn):
+    zstandard = pytest.importorskip("zstandard")
+    data = write_file(Path("log.csv"), os.urandom(1000) * (RANGE_SIZE // 500))
+    actions(config, "m:/log.zst", compress="zstd", compress_level="5").upload("log.csv")
+    stored = bytes(server.nodes["/acct/share/log.zst"].data)
+    reader = zstandard.ZstdDecompressor().stream_reader(stored, read_across_frames=True)
+    assert reader.read() == data
+    actions(config, "m:/log.zst", compress="zstd").download("back.csv")
+    assert Path("back.csv").read_bytes() == data
+
+
+def test_tree_cannot_be_compressed(config: Config):
+    Path("tree").mkdir()
+    with pytest.raises(ValueError, match="Only single file or stdin"):
+        actions(config, "m:/", compress="gzip").upload("tree")
+
+
+def test_md5_of_compressed_stream(config: Config, server: StandIn):
+    # stored MD5 is of compressed bytes, as they were uploaded
+    data = write_file(Path("f.txt"), b"hello world\n" * RANGE_SIZE)
+    actions(config, "m:/f.txt", md5="true", compress="gzip").upload("f.txt")
+    node = server.nodes["/acct/share/f.txt"]
+    assert len(node.data) < RANGE_SIZE
+    assert node.md5 == b64_md5(node.data)
+    actions(config, "m:/f.txt", md5="true", compress="gzip").download("back.txt")
+    assert Path("back.txt").read_bytes() == data
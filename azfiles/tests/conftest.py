@@ -0,0 +1,62 @@
+from pathlib import Path
+from typing import Iterator, List
+
+import azfiles
+import pytest
+from azfiles import ApiCall, CallRecord, Config, RateLimits
+from azfiles.standin import StandIn
+
+
+@pytest.fixture
+def server() -> Iterator[StandIn]:
+    server = StandIn().start()
+    yield server
+    server.close()
+
+
+@pytest.fixture(autouse=True)
+def isolated(tmp_path: Path, monkeypatch):
+    """
+    Journals, cache and relative paths stay in test's own directory, and no
+    connection, cache, observer or rate limit is carried over from other tests.
+    """
+    monkeypatch.setattr(azfiles, "JOURNAL_DIR", tmp_path / "journal")
+    monkeypatch.setattr(azfiles, "CACHE_PATH", tmp_path / "cache")
+    monkeypatch.setattr(azfiles, "COPY_POLL_INTERVAL", 0.01)
+    monkeypatch.setattr(ApiCall, "cache", None)
+    monkeypatch.setattr(ApiCall, "observer", None)
+    monkeypatch.setattr(ApiCall, "limits", RateLimits())
+    monkeypatch.chdir(tmp_path)
+    yield
+    ApiCall.sessions.close()
+
+
+@pytest.fixture
+def config(server: StandIn, tmp_path: Path) -> Config:
+    """
+    Mounts `m` and `n` are shares of account `acct`, `x` is share of
+    other account, all served by stand-in
+    """
+    config = Config(tmp_path / "config")
+    for name, account, share in (
+        ("m", "acct", "share"),
+        ("n", "acct", "other"),
+        ("x", "acct2", "share"),
+    ):
+        config.data[name] = {
+            "storage_account": account,
+            "share": share,
+            "sas_token": "sig=x",
+            "endpoint": server.endpoint(account),
+        }
+    return config
+
+
+@pytest.fixture
+def records(monkeypatch) -> List[CallRecord]:
+    """
+    Every REST call made while test runs
+    """
+    records: List[CallRecord] = []
+    monkeypatch.setattr(ApiCall, "observer", records.append)
+    return records
@@ -0,0 +1,54 @@
+from datetime import datetime, timezone
+from typing import List
+
+import pytest
+from azfiles import CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, output
+
+
+@pytest.mark.parametrize("dest", ["n:/archive/", "x:/archive/"])
+def test_copy_tree(config: Config, server: StandIn, dest: str):
+    for d in ("a", "a/b", "c"):
+        for i in range(3):
+            server.write(f"/acct/share/tree/{d}/f{i}", b"x" * i)
+    cli = actions(config, "m:/tree")
+    cli.copy(dest)
+    assert output(cli) == ["copied: 9 files, 9 bytes, 3 directories"]
+    root = "/acct/other" if dest.startswith("n") else "/acct2/share"
+    copied = sorted(p for p in server.nodes if p.startswith(f"{root}/archive/"))
+    assert copied == sorted(
+        p.replace("/acct/share/", f"{root}/archive/")
+        for p in server.nodes
+        if p.startswith("/acct/share/tree")
+    )
+
+
+def test_copy_waits_for_pending_copy(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    server.copy_pending = 2
+    server.write("/acct/share/a.txt", b"hello")
+    actions(config, "m:/a.txt").copy("n:/b/")
+    assert server.nodes["/acct/other/b/a.txt"].data == b"hello"
+    statuses = [r for r in records if r.operation == "HEAD"]
+    # source properties, then pending twice and success
+    assert len(statuses) == 4
+    assert server.nodes["/acct/other/b/a.txt"].copy_pending == 0
+
+
+def test_copy_across_accounts_keeps_write_time(config: Config, server: StandIn):
+    t = datetime(2020, 1, 2, tzinfo=timezone.utc)
+    server.write("/acct/share/d/a.txt", b"hello")
+    server.nodes["/acct/share/d/a.txt"].t = t
+    actions(config, "m:/d").copy("x:")
+    node = server.nodes["/acct2/share/d/a.txt"]
+    assert node.data == b"hello"
+    assert node.t == t
+
+
+def test_move_into_bare_mount(config: Config, server: StandIn):
+    server.write("/acct/share/d/a.txt", b"hello")
+    actions(config, "m:/d/a.txt").move("n:")
+    assert server.nodes["/acct/other/a.txt"].data == b"hello"
+    assert "/acct/share/d/a.txt" not in server.nodes
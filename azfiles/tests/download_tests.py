@@ -0,0 +1,47 @@
+import os
+from pathlib import Path
+from typing import List
+
+from azfiles import RANGE_SIZE, ApiCall, CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, operations
+
+
+def test_download_in_segments(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    data = os.urandom(3 * RANGE_SIZE + 100)
+    server.write("/acct/share/big.bin", data)
+    actions(config, "m:/big.bin", workers="3", segments="5").download("big.bin")
+    assert Path("big.bin").read_bytes() == data
+    assert operations(records)["GET"] == 5
+
+
+def test_small_file_in_one_request(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    server.write("/acct/share/d/small.txt", b"hello")
+    Path("out").mkdir()
+    actions(config, "m:/d/small.txt").download("out")
+    assert Path("out/small.txt").read_bytes() == b"hello"
+    assert operations(records)["GET"] == 1
+
+
+def test_failed_segment_is_fetched_again_alone(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    class Failing(ApiCall):
+        failed = False
+
+        @classmethod
+        def download_file_range(cls, remote, local_path, start, end, verify_md5=False):
+            if start == RANGE_SIZE and not cls.failed:
+                cls.failed = True
+                raise ValueError("connection reset")
+            super().download_file_range(remote, local_path, start, end, verify_md5)
+
+    data = os.urandom(3 * RANGE_SIZE)
+    server.write("/acct/share/big.bin", data)
+    actions(config, "m:/big.bin", Failing).download("big.bin")
+    assert Path("big.bin").read_bytes() == data
+    assert operations(records)["GET"] == 3
@@ -0,0 +1,46 @@
+import os
+import time
+from pathlib import Path
+from typing import List
+
+from azfiles import ApiCall, CallRecord, Config, Remote
+from azfiles.standin import StandIn
+from azfiles.tests import actions, write_file
+
+# at LIMIT bytes/s first second worth is sent right away, rest takes 0.5s
+DATA_SIZE = 3 * 10 ** 5
+LIMIT = 2 * 10 ** 5
+
+
+def timed_upload(config: Config, remote: str, **options: str) -> float:
+    started = time.perf_counter()
+    actions(config, remote, ApiCall, **options).upload("a.bin")
+    return time.perf_counter() - started
+
+
+def test_limits_from_command_line(config: Config, server: StandIn):
+    data = write_file(Path("a.bin"), os.urandom(DATA_SIZE))
+    assert timed_upload(config, "m:/", max_bytes_per_sec=str(LIMIT)) >= 0.4
+    assert server.nodes["/acct/share/a.bin"].data == data
+    assert ApiCall.limits.active
+    actions(config, "m:/", ApiCall, max_bytes_per_sec="0")
+    assert not ApiCall.limits.active
+
+
+def test_requests_per_sec(config: Config, server: StandIn, records: List[CallRecord]):
+    for i in range(10):
+        write_file(Path(f"f{i}.txt"), b"x")
+    started = time.perf_counter()
+    cli = actions(config, "m:/d/", ApiCall, max_requests_per_sec="20")
+    for i in range(10):
+        cli.upload(f"f{i}.txt")
+    # one second worth of calls passes right away, rest waits for its turn
+    assert len(records) > 30
+    assert time.perf_counter() - started >= (len(records) - 20) / 20 - 0.05
+
+
+def test_mount_limits_apply_to_its_share_only(config: Config, server: StandIn):
+    write_file(Path("a.bin"), os.urandom(DATA_SIZE))
+    config.data["m"]["max_bytes_per_sec"] = LIMIT
+    assert timed_upload(config, "m:/") >= 0.4
+    assert not ApiCall.limits.limiters(Remote("n:/a.bin", config, False).url())
@@ -0,0 +1,103 @@
+from pathlib import PosixPath
+from typing import List
+
+import pytest
+from azfiles import (
+    ApiCall,
+    CallRecord,
+    Config,
+    ListingParser,
+    Remote,
+    dt_parse,
+    parse_timestamp,
+)
+from azfiles.standin import StandIn
+from azfiles.tests import actions, operations, output
+
+
+def test_listing_follows_pages(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    for i in range(25):
+        server.write(f"/acct/share/logs/{i:02d}.log", b"x" * i)
+    cli = actions(config, "m:/logs/", maxresults="10")
+    cli.list()
+    lines = output(cli)
+    assert lines[:2] == [
+        "m:/logs",
+        "name,type,size,creation_time,last_access_time,last_write_time,etag",
+    ]
+    assert [line.split(",")[:3] for line in lines[2:]] == [
+        [f"{i:02d}.log", "File", str(i)] for i in range(25)
+    ]
+    assert operations(records)["GET list"] == 3
+
+
+def test_listing_of_empty_directory(config: Config, server: StandIn):
+    server.write("/acct/share/empty")
+    cli = actions(config, "m:/empty/")
+    cli.list()
+    assert output(cli)[2:] == []
+
+
+def find(config: Config, **options: str) -> List[str]:
+    cli = actions(config, "m:/", ApiCall, **options)
+    cli.find()
+    lines = output(cli)
+    assert lines[:2] == [
+        "m:/",
+        "path,type,size,creation_time,last_access_time,last_write_time,etag",
+    ]
+    return sorted(line.split(",")[0] for line in lines[2:])
+
+
+def test_find(config: Config, server: StandIn):
+    for path in ("a/x.log", "a/b/y.log", "a/b/c/z.log", "tmp/t.log", "a/n.txt"):
+        server.write(f"/acct/share/{path}", b"x" * 10)
+    server.write("/acct/share/big.log", b"x" * 1000)
+    assert find(config, name="*.log", prune="tmp", max_size="100") == [
+        "/a/b/c/z.log",
+        "/a/b/y.log",
+        "/a/x.log",
+    ]
+    assert find(config, type="d", maxdepth="2") == ["/a", "/a/b", "/tmp"]
+
+
+def test_parser_result_does_not_depend_on_chunking(config: Config, server: StandIn):
+    for i in range(30):
+        server.write(f"/acct/share/d/f&{i:02d}.txt", b"x" * i)
+    server.write("/acct/share/d/sub")
+    call = ApiCall(
+        "GET",
+        Remote("m:/", config, False).mount.url(
+            PosixPath("/d"),
+            "restype=directory&comp=list&include=ETag&include=Timestamps",
+        ),
+    )
+    body = call.response.content
+
+    def parse(chunk_size: int) -> List[str]:
+        parser = ListingParser(PosixPath("/d"))
+        entries = []
+        for i in range(0, len(body), chunk_size):
+            entries.extend(parser.feed(body[i : i + chunk_size]))
+        return [str(e) for e in entries]
+
+    rows = parse(len(body))
+    assert len(rows) == 31
+    assert rows[0].startswith("f&00.txt,File,0,")
+    assert parse(1) == parse(7) == rows
+
+
+@pytest.mark.parametrize(
+    "s",
+    [
+        "2021-07-30T18:13:20.1234567Z",
+        "2020-02-29T00:00:00.0000000Z",
+        "2021-07-30T18:13:20Z",
+        "Fri, 30 Jul 2021 18:13:20 GMT",
+        "Sat, 01 Jan 2000 00:00:00 GMT",
+    ],
+)
+def test_fast_timestamps_match_dateutil(s: str):
+    assert parse_timestamp(s) == dt_parse(s)
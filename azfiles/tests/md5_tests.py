@@ -0,0 +1,72 @@
+import os
+from pathlib import Path
+from typing import List, Set
+
+import pytest
+from azfiles import RANGE_SIZE, ApiCall, CallRecord, Config, b64_md5
+from azfiles.standin import StandIn
+from azfiles.tests import actions, write_file
+
+
+def test_md5_stored_on_upload(config: Config, server: StandIn):
+    for name, size in (
+        ("empty.bin", 0),
+        ("small.bin", 1000),
+        ("big.bin", RANGE_SIZE + 1000),
+    ):
+        data = write_file(Path(name), os.urandom(size))
+        actions(config, f"m:/{name}", md5="true").upload(name)
+        assert server.nodes[f"/acct/share/{name}"].md5 == b64_md5(data)
+
+
+def test_md5_mismatch_of_range_is_retried(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    class Corrupting(ApiCall):
+        corrupted: Set[int] = set()
+
+        @classmethod
+        def upload_range(cls, remote, start, data, content_md5=None):
+            if start not in cls.corrupted:
+                cls.corrupted.add(start)
+                data = bytes(data[:-1]) + bytes([data[-1] ^ 1])
+            return super().upload_range(remote, start, data, content_md5)
+
+    data = write_file(Path("big.bin"), os.urandom(2 * RANGE_SIZE))
+    actions(config, "m:/big.bin", Corrupting, md5="true").upload("big.bin")
+    statuses = [r.status for r in records if r.operation == "PUT range"]
+    assert sorted(statuses) == [201, 201, 400, 400]
+    assert server.nodes["/acct/share/big.bin"].data == data
+
+
+@pytest.mark.parametrize(
+    "size, options",
+    [
+        (1000, {}),
+        (3 * RANGE_SIZE, {}),
+        (3 * RANGE_SIZE, {"sparse": "true"}),
+    ],
+)
+def test_md5_of_whole_file_checked_on_download(
+    config: Config, server: StandIn, size: int, options: dict
+):
+    data = write_file(Path("f.bin"), os.urandom(size))
+    actions(config, "m:/f.bin", md5="true", **options).upload("f.bin")
+    cli = actions(config, "m:/f.bin", md5="true", **options)
+    cli.download("back.bin")
+    assert Path("back.bin").read_bytes() == data
+    # stored data no longer matches what was uploaded, while every range
+    # still gets MD5 service computes from what it has
+    server.nodes["/acct/share/f.bin"].data[size // 2] ^= 1
+    with pytest.raises(ValueError, match="MD5 mismatch: m:/f.bin expected"):
+        actions(config, "m:/f.bin", md5="true", **options).download("back.bin")
+
+
+def test_md5_checked_on_stream_download(config: Config, server: StandIn, capfdbinary):
+    data = write_file(Path("f.bin"), os.urandom(2 * RANGE_SIZE))
+    actions(config, "m:/f.bin", md5="true").upload("f.bin")
+    actions(config, "m:/f.bin", md5="true").download("-")
+    assert capfdbinary.readouterr().out == data
+    server.nodes["/acct/share/f.bin"].data[0] ^= 1
+    with pytest.raises(ValueError, match="MD5 mismatch"):
+        actions(config, "m:/f.bin", md5="true").download("-")
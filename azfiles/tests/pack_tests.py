@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+from typing import List
+
+import pytest
+from azfiles import RANGE_SIZE, CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, operations, output
+
+
+def make_tree(root: Path) -> Path:
+    for d in ("a", "a/b", "c"):
+        (root / d).mkdir(parents=True)
+        for i in range(5):
+            (root / d / f"f{i}.txt").write_bytes(os.urandom(100 * i))
+    (root / "c" / "big.bin").write_bytes(os.urandom(RANGE_SIZE + 10))
+    os.utime(root / "a" / "f1.txt", (1e9, 1e9))
+    return root
+
+
+def same_tree(left: Path, right: Path):
+    names = sorted(p.relative_to(left) for p in left.rglob("*"))
+    assert names == sorted(p.relative_to(right) for p in right.rglob("*"))
+    for name in names:
+        if (left / name).is_file():
+            assert (left / name).read_bytes() == (right / name).read_bytes()
+            assert (left / name).stat().st_mtime == (right / name).stat().st_mtime
+
+
+def test_pack(config: Config, server: StandIn, records: List[CallRecord]):
+    root = make_tree(Path("tree"))
+    cli = actions(config, "m:/backups/", pack="true")
+    cli.upload("tree")
+    size = sum(p.stat().st_size for p in root.rglob("*") if p.is_file())
+    assert output(cli) == [f"packed: 16 files, {size} bytes into m:/backups/tree.tar"]
+    assert operations(records)["PUT"] == 2
+    assert "/acct/share/backups/tree.tar.index.json" in server.nodes
+
+    cli = actions(config, "m:/backups/tree.tar", member="tree/a/f1.txt")
+    cli.download(".")
+    assert Path("f1.txt").read_bytes() == (root / "a" / "f1.txt").read_bytes()
+    assert Path("f1.txt").stat().st_mtime == 1e9
+
+    actions(config, "m:/backups/tree.tar", pack="true").download("out")
+    same_tree(root, Path("out", "tree"))
+
+    with pytest.raises(ValueError, match="No member tree/nope"):
+        actions(config, "m:/backups/tree.tar", member="tree/nope").download(".")
+
+
+def test_pack_into_bare_mount(config: Config, server: StandIn):
+    make_tree(Path("tree"))
+    actions(config, "m:", pack="true").upload("tree")
+    assert "/acct/share/tree.tar" in server.nodes
+    with pytest.raises(ValueError, match="cannot be compressed"):
+        actions(config, "m:", pack="true", compress="gzip").upload("tree")
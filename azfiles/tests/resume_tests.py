@@ -0,0 +1,91 @@
+import os
+from pathlib import Path
+from typing import List, Type
+
+import pytest
+from azfiles import RANGE_SIZE, ApiCall, CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, operations, output, write_file
+
+
+class Interrupted(BaseException):
+    """
+    Escapes retries and stops transfer, like Ctrl-C would
+    """
+
+
+def interrupted_at(offset: int) -> Type[ApiCall]:
+    class Api(ApiCall):
+        @classmethod
+        def upload_range(cls, remote, start, data, content_md5=None):
+            if start == offset:
+                raise Interrupted()
+            return super().upload_range(remote, start, data, content_md5)
+
+        @classmethod
+        def download_file_range(cls, remote, local_path, start, end, verify_md5=False):
+            if start == offset:
+                raise Interrupted()
+            super().download_file_range(remote, local_path, start, end, verify_md5)
+
+    return Api
+
+
+def test_resume_upload(config: Config, server: StandIn, records: List[CallRecord]):
+    data = write_file(Path("big.bin"), os.urandom(3 * RANGE_SIZE + 100))
+    with pytest.raises(Interrupted):
+        # one range at a time, so exactly two are done when third fails
+        cli = actions(config, "m:/big.bin", interrupted_at(2 * RANGE_SIZE))
+        cli.options.update(workers="1", buffers="1")
+        cli.upload("big.bin")
+    del records[:]
+    cli = actions(config, "m:/big.bin")
+    cli.upload("big.bin")
+    assert output(cli) == ["Resuming m:/big.bin: 2 of 4 ranges done"]
+    assert operations(records)["PUT range"] == 2
+    assert server.nodes["/acct/share/big.bin"].data == data
+
+
+def test_restart_upload_of_modified_file(config: Config, server: StandIn):
+    write_file(Path("big.bin"), os.urandom(2 * RANGE_SIZE))
+    with pytest.raises(Interrupted):
+        cli = actions(config, "m:/big.bin", interrupted_at(RANGE_SIZE))
+        cli.options.update(workers="1", buffers="1")
+        cli.upload("big.bin")
+    data = write_file(Path("big.bin"), os.urandom(2 * RANGE_SIZE + 1))
+    cli = actions(config, "m:/big.bin")
+    cli.upload("big.bin")
+    assert output(cli) == []
+    assert server.nodes["/acct/share/big.bin"].data == data
+
+
+def test_resume_download(config: Config, server: StandIn, records: List[CallRecord]):
+    data = os.urandom(3 * RANGE_SIZE + 100)
+    server.write("/acct/share/big.bin", data)
+    with pytest.raises(Interrupted):
+        cli = actions(config, "m:/big.bin", interrupted_at(2 * RANGE_SIZE))
+        cli.options.update(workers="1")
+        cli.download("big.bin")
+    del records[:]
+    cli = actions(config, "m:/big.bin")
+    cli.download("big.bin")
+    assert output(cli) == ["Resuming big.bin: 2 segments done"]
+    assert operations(records)["GET"] == 2
+    assert Path("big.bin").read_bytes() == data
+
+
+def test_restart_upload_when_remote_changed(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    data = write_file(Path("big.bin"), os.urandom(3 * RANGE_SIZE))
+    with pytest.raises(Interrupted):
+        cli = actions(config, "m:/big.bin", interrupted_at(2 * RANGE_SIZE))
+        cli.options.update(workers="1", buffers="1")
+        cli.upload("big.bin")
+    server.nodes["/acct/share/big.bin"].modified()
+    del records[:]
+    cli = actions(config, "m:/big.bin")
+    cli.upload("big.bin")
+    assert output(cli) == []
+    assert operations(records)["PUT range"] == 3
+    assert server.nodes["/acct/share/big.bin"].data == data
@@ -0,0 +1,34 @@
+from pathlib import PosixPath
+
+from azfiles import ApiCall, Config, Remote, SessionPool
+from azfiles.standin import StandIn
+
+
+def test_session_per_storage_account(config: Config, server: StandIn):
+    # all mounts are on the same stand-in host, with account in path
+    for name in ("m", "n", "x"):
+        ApiCall.get_file_properties(Remote(f"{name}:/", config, False), PosixPath("/a"))
+    assert sorted(ApiCall.sessions.sessions) == [
+        server.endpoint("acct").split("//")[1],
+        server.endpoint("acct2").split("//")[1],
+    ]
+
+
+def test_internal_error_retried_only_by_idempotent_calls():
+    url = "https://acct.file.core.windows.net/share/a"
+    pool = SessionPool()
+    retry = pool.session(url).get_adapter(url).max_retries
+    assert retry.is_retry("GET", 500)
+    assert retry.is_retry("HEAD", 500)
+    assert not retry.is_retry("PUT", 500)
+    assert retry.is_retry("PUT", 503)
+    assert retry.is_retry("PUT", 429)
+    pool.close()
+
+
+def test_keep_alive_connections_reused(config: Config, server: StandIn):
+    remote = Remote("m:/", config, False)
+    for i in range(10):
+        ApiCall.get_file_properties(remote, PosixPath(f"/f{i}"))
+    assert ApiCall.sessions.stats() == {"opened": 1, "reused": 9}
+    assert server.connections == 1
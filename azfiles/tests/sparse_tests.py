@@ -0,0 +1,39 @@
+import os
+from pathlib import Path
+from typing import List
+
+from azfiles import RANGE_SIZE, CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, operations, write_file
+
+
+def test_sparse(config: Config, server: StandIn, records: List[CallRecord]):
+    data = write_file(
+        Path("disk.img"),
+        os.urandom(RANGE_SIZE) + bytes(2 * RANGE_SIZE) + os.urandom(100),
+    )
+    actions(config, "m:/disk.img", sparse="true").upload("disk.img")
+    assert operations(records)["PUT range"] == 2
+    assert server.nodes["/acct/share/disk.img"].data == data
+    del records[:]
+    actions(config, "m:/disk.img", sparse="true").download("back.img")
+    assert operations(records)["GET"] == 2
+    assert operations(records)["GET rangelist"] == 1
+    assert Path("back.img").read_bytes() == data
+
+
+def test_sparse_upload_skips_holes(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    data = os.urandom(100)
+    with open("disk.img", "wb") as f:
+        f.truncate(4 * RANGE_SIZE)
+        f.seek(3 * RANGE_SIZE)
+        f.write(data)
+    actions(config, "m:/disk.img", sparse="true").upload("disk.img")
+    assert operations(records)["PUT range"] == 1
+    node = server.nodes["/acct/share/disk.img"]
+    assert node.data == Path("disk.img").read_bytes()
+    # filesystem reports data extent in whole blocks
+    ((start, end),) = node.written
+    assert start <= 3 * RANGE_SIZE and end >= 3 * RANGE_SIZE + 100
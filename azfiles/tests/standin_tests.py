@@ -0,0 +1,44 @@
+import time
+
+import requests
+from azfiles.standin import StandIn
+
+
+def test_error_replies_on_throttled_link():
+    # error bodies pass through link while nodes are locked
+    server = StandIn(bandwidth=10 ** 6).start()
+    try:
+        url = server.endpoint("acct") + "/share/d?restype=directory"
+        statuses = [requests.put(url, timeout=5).status_code for _ in range(3)]
+        assert statuses == [201, 409, 409]
+        nope = server.endpoint("acct") + "/share/nope"
+        assert requests.delete(nope, timeout=5).status_code == 404
+    finally:
+        server.close()
+
+
+def test_throttled_requests_are_server_busy():
+    server = StandIn(throttle=1.0).start()
+    try:
+        r = requests.head(server.endpoint("acct") + "/share/a.txt", timeout=5)
+        assert r.status_code == 503
+        assert r.headers["x-ms-error-code"] == "ServerBusy"
+    finally:
+        server.close()
+
+
+def test_latency_and_conditional_head():
+    server = StandIn(latency=0.05).start()
+    try:
+        url = server.endpoint("acct") + "/share/a.txt"
+        headers = {"x-ms-type": "file", "x-ms-content-length": "3"}
+        started = time.perf_counter()
+        assert requests.put(url, headers=headers, timeout=5).status_code == 201
+        assert time.perf_counter() - started >= 0.05
+        etag = requests.head(url, timeout=5).headers["ETag"]
+        r = requests.head(url, headers={"If-None-Match": etag}, timeout=5)
+        assert r.status_code == 304
+        r = requests.head(url, headers={"If-None-Match": '"0x99"'}, timeout=5)
+        assert r.status_code == 200
+    finally:
+        server.close()
@@ -0,0 +1,29 @@
+import io
+import os
+import sys
+
+from azfiles import RANGE_SIZE, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions
+
+
+def test_upload_from_stdin(config: Config, server: StandIn, monkeypatch):
+    data = os.urandom(2 * RANGE_SIZE + RANGE_SIZE // 2)
+    monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO(data)))
+    actions(config, "m:/d/dump.sql").upload("-")
+    assert server.nodes["/acct/share/d/dump.sql"].data == data
+
+
+def test_download_to_stdout(config: Config, server: StandIn, capfdbinary):
+    data = os.urandom(3 * RANGE_SIZE + 7)
+    server.write("/acct/share/dump.sql", data)
+    actions(config, "m:/dump.sql", workers="3").download("-")
+    assert capfdbinary.readouterr().out == data
+
+
+def test_empty_stream(config: Config, server: StandIn, monkeypatch, capfdbinary):
+    monkeypatch.setattr(sys, "stdin", io.TextIOWrapper(io.BytesIO()))
+    actions(config, "m:/empty").upload("-")
+    assert server.nodes["/acct/share/empty"].data == b""
+    actions(config, "m:/empty").download("-")
+    assert capfdbinary.readouterr().out == b""
@@ -0,0 +1,62 @@
+import os
+from pathlib import Path
+
+import pytest
+from azfiles import RANGE_SIZE, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, make_tree, output
+
+
+def test_sync_up_skips_files_sent_before(config: Config, server: StandIn):
+    make_tree(Path("tree"))
+    cli = actions(config, "m:/backups/")
+    cli.sync("tree")
+    assert output(cli) == ["transferred: 9 files, 900 bytes; skipped: 0 files, 0 bytes"]
+    cli = actions(config, "m:/backups/")
+    cli.sync("tree")
+    assert output(cli) == ["transferred: 0 files, 0 bytes; skipped: 9 files, 900 bytes"]
+
+    Path("tree/a/b/f1.txt").write_bytes(b"changed")
+    Path("tree/c/new.txt").write_bytes(b"new")
+    cli = actions(config, "m:/backups/", dry_run="true")
+    cli.sync("tree")
+    *uploads, summary = output(cli)
+    assert sorted(uploads) == [
+        "upload tree/a/b/f1.txt -> m:/backups/tree/a/b/f1.txt",
+        "upload tree/c/new.txt -> m:/backups/tree/c/new.txt",
+    ]
+    assert summary == "would transfer: 2 files, 10 bytes; skipped: 8 files, 800 bytes"
+    actions(config, "m:/backups/").sync("tree")
+    assert server.nodes["/acct/share/backups/tree/a/b/f1.txt"].data == b"changed"
+    assert server.nodes["/acct/share/backups/tree/c/new.txt"].data == b"new"
+
+
+def test_sync_down_skips_files_fetched_before(config: Config):
+    make_tree(Path("tree"))
+    actions(config, "m:/").upload("tree")
+    cli = actions(config, "m:/tree")
+    cli.sync("copy", "down")
+    assert output(cli) == ["transferred: 9 files, 900 bytes; skipped: 0 files, 0 bytes"]
+    assert Path("copy/a/b/f2.txt").read_bytes() == Path("tree/a/b/f2.txt").read_bytes()
+    cli = actions(config, "m:/tree")
+    cli.sync("copy", "down")
+    assert output(cli) == ["transferred: 0 files, 0 bytes; skipped: 9 files, 900 bytes"]
+
+
+@pytest.mark.parametrize("size", [0, 100, 2 * RANGE_SIZE])
+def test_sync_skips_files_sent_by_upload(config: Config, size: int):
+    Path("tree").mkdir()
+    Path("tree/f.bin").write_bytes(os.urandom(size))
+    os.utime("tree/f.bin", (1e9, 1e9))
+    actions(config, "m:/tree/").upload("tree/f.bin")
+    cli = actions(config, "m:/")
+    cli.sync("tree")
+    assert output(cli) == [
+        f"transferred: 0 files, 0 bytes; skipped: 1 files, {size} bytes"
+    ]
+
+
+def test_sync_of_file_is_refused(config: Config):
+    Path("f.txt").write_bytes(b"x")
+    with pytest.raises(ValueError, match="Only directory can be synced"):
+        actions(config, "m:/").sync("f.txt")
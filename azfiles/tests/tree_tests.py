@@ -0,0 +1,53 @@
+from pathlib import Path, PosixPath
+from typing import List
+
+from azfiles import ApiCall, CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, make_tree, operations, output
+
+
+def test_upload_tree(config: Config, server: StandIn, records: List[CallRecord]):
+    make_tree(Path("tree"))
+    Path("tree/empty").mkdir()
+    actions(config, "m:/backups/", workers="3", max_inflight="1000").upload("tree")
+    for p in Path("tree").rglob("*"):
+        node = server.nodes[f"/acct/share/backups/{p}"]
+        assert node.is_dir == p.is_dir()
+        if p.is_file():
+            assert node.data == p.read_bytes()
+    # every directory is created once: backups, tree, a, a/b, c and empty
+    assert operations(records)["PUT directory"] == 6
+
+
+def test_delete_removes_children_before_parents(config: Config, server: StandIn):
+    deleted: List[PosixPath] = []
+
+    class Recording(ApiCall):
+        @classmethod
+        def delete_directory(cls, remote, remote_dir):
+            super().delete_directory(remote, remote_dir)
+            deleted.append(remote_dir)
+
+        @classmethod
+        def delete_file(cls, remote, remote_path):
+            super().delete_file(remote, remote_path)
+            deleted.append(remote_path)
+
+    for d in range(4):
+        for f in range(5):
+            server.write(f"/acct/share/tree/d{d}/e/f{f}", b"x")
+            server.write(f"/acct/share/tree/d{d}/f{f}", b"x")
+    actions(config, "m:/tree", Recording, workers="8").delete()
+    assert sorted(server.nodes) == ["/acct/share"]
+    assert len(deleted) == 4 * 12 + 1
+    for i, path in enumerate(deleted):
+        assert not any(path in p.parents for p in deleted[i:])
+
+
+def test_delete_file_and_missing_path(config: Config, server: StandIn):
+    server.write("/acct/share/d/a.txt", b"x")
+    actions(config, "m:/d/a.txt").delete()
+    assert sorted(server.nodes) == ["/acct/share", "/acct/share/d"]
+    cli = actions(config, "m:/d/a.txt")
+    cli.delete()
+    assert output(cli) == ["Path doesn't exist: /d/a.txt"]
@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import List
+
+from azfiles import RANGE_SIZE, ApiCall, CallRecord, Config
+from azfiles.standin import StandIn
+from azfiles.tests import actions, operations, write_file
+
+
+def test_ranges_sent_concurrently(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    lock = threading.Lock()
+    active: List[int] = []
+
+    class Counting(ApiCall):
+        @classmethod
+        def upload_range(cls, remote, start, data, content_md5=None):
+            with lock:
+                active.append(active[-1] + 1 if active else 1)
+            time.sleep(0.05)
+            try:
+                return super().upload_range(remote, start, data, content_md5)
+            finally:
+                with lock:
+                    active.append(active[-1] - 1)
+
+    data = write_file(Path("big.bin"), os.urandom(6 * RANGE_SIZE + 100))
+    actions(config, "m:/d/big.bin", Counting, workers="3", buffers="4").upload(
+        "big.bin"
+    )
+    assert server.nodes["/acct/share/d/big.bin"].data == data
+    assert operations(records)["PUT range"] == 7
+    assert 1 < max(active) <= 3
+
+
+def test_failed_range_is_retried_alone(
+    config: Config, server: StandIn, records: List[CallRecord]
+):
+    class Failing(ApiCall):
+        failed = False
+
+        @classmethod
+        def upload_range(cls, remote, start, data, content_md5=None):
+            if start == RANGE_SIZE and not cls.failed:
+                cls.failed = True
+                raise ValueError("connection reset")
+            return super().upload_range(remote, start, data, content_md5)
+
+    data = write_file(Path("big.bin"), os.urandom(3 * RANGE_SIZE))
+    actions(config, "m:/big.bin", Failing).upload("big.bin")
+    assert server.nodes["/acct/share/big.bin"].data == data
+    assert operations(records)["PUT range"] == 3
+
+
+def test_ranges_sent_from_pooled_buffers(config: Config, server: StandIn):
+    buffers = set()
+
+    class Recording(ApiCall):
+        @classmethod
+        def upload_range(cls, remote, start, data, content_md5=None):
+            buffers.add(id(data.obj))
+            return super().upload_range(remote, start, data, content_md5)
+
+    data = write_file(Path("big.bin"), os.urandom(8 * RANGE_SIZE))
+    actions(config, "m:/big.bin", Recording, workers="2", buffers="3").upload("big.bin")
+    assert server.nodes["/acct/share/big.bin"].data == data
+    assert 1 < len(buffers) <= 3
+
+
+def test_upload_file_range(config: Config, server: StandIn):
+    data = write_file(Path("f.bin"), os.urandom(300))
+    cli = actions(config, "m:/f.bin")
+    cli.remote.set_remote_file(Path("f.bin"))
+    ApiCall.clear_file(cli.remote, 300)
+    ApiCall.upload_file_range(cli.remote, Path("f.bin"), 100, 300)
+    ApiCall.upload_file_range(cli.remote, Path("f.bin"), 0, 100)
+    assert server.nodes["/acct/share/f.bin"].data == data
@@ -19,6 +19,7 @@ dev_requires = [
     "pytest-cov",
     "types-python-dateutil",
     "types-requests",
+    "aiohttp",
 ]
 
 
@@ -59,6 +60,10 @@ setup(
     cmdclass=cmdclass_dict,
     entry_points={"console_scripts": ["azfiles=azfiles:main"]},
     install_requires=install_requires,
-    extras_require={"dev": dev_requires},
+    extras_require={
+        "dev": dev_requires,
+        "aio": ["aiohttp"],
+        "zstd": ["zstandard"],
+    },
     zip_safe=False,
 )